@@ -0,0 +1,70 @@
+cimport numpy as np
+cimport cython
+import  numpy as np
+
+from libc.stdint cimport int16_t, int32_t, int64_t, INT64_MAX
+
+
+ctypedef fused integer:
+    int16_t
+    int32_t
+    int64_t
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cpdef positive_modes(const integer [:, ::1] wfs):
+    """
+    Computes the mode of the positive values of each row of `wfs`,
+    which must be C-contiguous.
+    Rows without positive values have a mode of 0. In case of a
+    tie, the lowest value is taken.
+    """
+    cdef Py_ssize_t n_rows    = wfs.shape[0]
+    cdef Py_ssize_t n_samples = wfs.shape[1]
+    cdef double   [:] modes   = np.zeros(n_rows, dtype=np.double)
+    cdef int64_t  [:] counts
+    cdef Py_ssize_t i, j, lo, hi, best
+    cdef int64_t value, best_count
+    cdef int64_t vmin = INT64_MAX
+    cdef int64_t vmax = 0
+
+    # range of positive values
+    with nogil:
+        for i in range(n_rows):
+            for j in range(n_samples):
+                value = wfs[i, j]
+                if value > 0:
+                    vmin = min(vmin, value)
+                    vmax = max(vmax, value)
+
+    if vmax == 0: return np.asarray(modes)
+
+    cdef Py_ssize_t nbins = vmax - vmin + 1
+    counts = np.zeros(nbins, dtype=np.int64)
+
+    with nogil:
+        for i in range(n_rows):
+            # only the range of values of this row is used and cleared
+            lo = nbins
+            hi = -1
+            for j in range(n_samples):
+                value = wfs[i, j]
+                if value <= 0: continue
+                value = value - vmin
+                counts[value] += 1
+                if value < lo: lo = value
+                if value > hi: hi = value
+
+            if hi < 0: continue
+
+            best       = lo
+            best_count = 0
+            for j in range(lo, hi + 1):
+                if counts[j] > best_count:
+                    best       = j
+                    best_count = counts[j]
+                counts[j] = 0
+            modes[i] = best + vmin
+
+    return np.asarray(modes)
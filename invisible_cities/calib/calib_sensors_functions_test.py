@@ -336,3 +336,46 @@ def test_mode_for_square_waveform_has_no_bias(square_pmt_and_sipm_waveforms):
     sipms_mode = csf.subtract_baseline(sipms_wfm, bls_mode=BlsMode.mode)
     diffs      = sipms_noped - sipms_mode
     assert np.mean(diffs) == approx(0)
+
+
+@fixture(scope="module")
+def zero_suppressed_waveforms():
+    rng = np.random.default_rng(1234)
+    wfs = rng.integers(-5, 20, size=(20, 100)).astype(np.int16)
+    wfs[rng.random(wfs.shape) < 0.3] = 0
+    wfs[0] = 0
+    return wfs
+
+
+@mark.parametrize("axis", (0, 1))
+def test_mode_matches_positive_bincount(zero_suppressed_waveforms, axis):
+    def wf_mode(wf):
+        positive = wf > 0
+        return np.bincount(wf[positive]).argmax() if np.count_nonzero(positive) else 0
+
+    wfs      = zero_suppressed_waveforms
+    expected = np.apply_along_axis(wf_mode, axis, wfs).astype(float)
+    assert np.array_equal(csf.mode(wfs, axis=axis), expected)
+
+
+def test_mode_takes_lowest_value_in_ties():
+    wfs = np.array([[3, 3, 1, 1, 2, 0, -1, -1, -1],
+                    [0, 0, 0, 0, 0, 0, -1, -1, -1]])
+    assert np.array_equal(csf.mode(wfs, axis=1), [1, 0])
+
+
+def test_mode_raises_TypeError_for_float_waveforms():
+    with raises(TypeError):
+        csf.mode(np.ones((2, 10)))
+
+
+@mark.parametrize("dtype", (np.int16, np.float32, np.float64))
+@mark.parametrize("axis" , (0, 1))
+@mark.parametrize("fn"   , ("mean", "median"))
+def test_mean_and_median_match_zero_masked(zero_suppressed_waveforms, dtype, axis, fn):
+    wfs      = zero_suppressed_waveforms.astype(dtype)
+    masked   = csf.zero_masked(getattr(np.ma, fn))
+    expected = masked(wfs, axis=axis)
+    actual   = getattr(csf, fn)(wfs, axis=axis)
+    assert np.shape(actual) == np.shape(expected)
+    assert np.allclose(actual, expected)
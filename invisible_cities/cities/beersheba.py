@@ -70,7 +70,7 @@ from .. reco.deconv_functions  import find_nearest
 from .. reco.deconv_functions  import cut_and_redistribute_df
 from .. reco.deconv_functions  import drop_isolated_sensors
 from .. reco.deconv_functions  import drop_isolated_clusters
-from .. reco.deconv_functions  import deconvolve
+from .. reco.deconv_functions  import deconvolve_batch
 from .. reco.deconv_functions  import richardson_lucy
 from .. reco.deconv_functions  import no_satellite_killer
 
@@ -112,7 +112,8 @@ def deconvolve_signal(det_db           : pd.DataFrame,
                       n_dim            : Optional[int]=2,
                       cut_type         : Optional[CutType]=CutType.abs,
                       inter_method     : Optional[InterpolationMethod]=InterpolationMethod.cubic,
-                      n_iterations_g   : Optional[int]=0):
+                      n_iterations_g   : Optional[int]=0,
+                      fft_workers      : Optional[int]=1):
     """
     Applies Lucy Richardson deconvolution to SiPM response with a
     given set of PSFs and parameters.
@@ -141,6 +142,7 @@ def deconvolve_signal(det_db           : pd.DataFrame,
                         `rel`: cut on the relative value (to the max) of the hits.
     inter_method     : Interpolation method (`nointerpolation`, `nearest`, `linear` or `cubic`).
     n_iterations_g   : Number of Lucy-Richardson iterations for gaussian in 'separate mode'
+    fft_workers      : Number of workers used in the FFTs of the deconvolution.
 
     Returns
     ----------
@@ -157,10 +159,11 @@ def deconvolve_signal(det_db           : pd.DataFrame,
     psfs          = load_dst(psf_fname, 'PSF', 'PSFs')
     det_grid      = [np.arange(det_db[var].min() + bs/2, det_db[var].max() - bs/2 + np.finfo(np.float32).eps, bs)
                      for var, bs in zip(dimensions, bin_size)]
-    deconvolution = deconvolve(n_iterations, iteration_tol,
-                               sample_width, det_grid,
-                               **satellite_params,
-                               inter_method = inter_method)
+    deconvolution = deconvolve_batch(n_iterations, iteration_tol,
+                                     sample_width, det_grid,
+                                     **satellite_params,
+                                     inter_method = inter_method,
+                                     workers      = fft_workers)
 
     if not isinstance(energy_type , HitEnergy          ):
         raise ValueError(f'energy_type {energy_type} is not a valid energy type.')
@@ -171,41 +174,54 @@ def deconvolve_signal(det_db           : pd.DataFrame,
     if not isinstance(deconv_mode , DeconvolutionMode  ):
         raise ValueError(f'deconv_mode {deconv_mode} is not a valid deconvolution mode.')
 
-    def deconvolve_hits(df, z):
+    def select_psf(df, z):
         '''
-        Given an slice, applies deconvolution using the PSF
+        Given an slice, returns the coordinates of the PSF
         associated to the passed z.
+        '''
+        xx, yy = df.Xpeak.unique(), df.Ypeak.unique()
+        zz     = z if deconv_mode is DeconvolutionMode.joint else 0
+        return find_nearest(psfs.z, zz), find_nearest(psfs.x, xx), find_nearest(psfs.y, yy)
+
+    def deconvolve_hits(slices, psf_coords):
+        '''
+        Given a set of slices sharing the same PSF, applies
+        deconvolution to all of them at once.
 
         Parameters
         ----------
-        df : Original input dataframe for the deconvolution (single slice cdst)
-        z  : Longitudinal position of the slice.
+        slices     : List of (z, df) pairs, with the original input dataframe
+                     for the deconvolution (single slice cdst) and the
+                     longitudinal position of the slice.
+        psf_coords : Coordinates (z, x, y) of the PSF.
         Returns
         ----------
-        Dataframe with the deconvolved slice.
+        List with a dataframe for each deconvolved slice.
         '''
-        xx, yy = df.Xpeak.unique(), df.Ypeak.unique()
-        zz     = z if deconv_mode is DeconvolutionMode.joint else 0
-        psf = psfs.loc[(psfs.z == find_nearest(psfs.z, zz)) &
-                       (psfs.x == find_nearest(psfs.x, xx)) &
-                       (psfs.y == find_nearest(psfs.y, yy)) , :]
-
-        deconv_image, pos = deconvolution(tuple(df.loc[:, dimensions].values.T), df.NormQ.values, psf)
-
-        if   deconv_mode is DeconvolutionMode.joint:
-            pass
-        elif deconv_mode is DeconvolutionMode.separate:
-            dist         = multivariate_normal(np.zeros(n_dim), diffusion**2 * z * units.mm / units.cm) #Z is in mm in cdst
-            cols         = tuple(f"{v.lower()}r" for v in dimensions)
-            psf_cols     = psf.loc[:, cols]
-            gaus         = dist.pdf(psf_cols.values)
-            psf          = gaus.reshape(psf_cols.nunique())
-            deconv_image = nan_to_num(richardson_lucy(deconv_image, psf,
-                                                      iterations = n_iterations_g,
-                                                      iter_thr = iteration_tol,
-                                                      **satellite_params))
-
-        return create_deconvolution_df(df, deconv_image.flatten(), pos, cut_type, e_cut, n_dim)
+        pz, px, py = psf_coords
+        psf = psfs.loc[(psfs.z == pz) & (psfs.x == px) & (psfs.y == py), :]
+
+        data     = [tuple(df.loc[:, dimensions].values.T) for _, df in slices]
+        weights  = [df.NormQ.values                      for _, df in slices]
+        deconv   = deconvolution(data, weights, psf)
+
+        deconvolved = []
+        for (z, df), (deconv_image, pos) in zip(slices, deconv):
+            if   deconv_mode is DeconvolutionMode.joint:
+                pass
+            elif deconv_mode is DeconvolutionMode.separate:
+                dist         = multivariate_normal(np.zeros(n_dim), diffusion**2 * z * units.mm / units.cm) #Z is in mm in cdst
+                cols         = tuple(f"{v.lower()}r" for v in dimensions)
+                psf_cols     = psf.loc[:, cols]
+                gaus         = dist.pdf(psf_cols.values)
+                psf_g        = gaus.reshape(psf_cols.nunique())
+                deconv_image = nan_to_num(richardson_lucy(deconv_image, psf_g,
+                                                          iterations = n_iterations_g,
+                                                          iter_thr = iteration_tol,
+                                                          **satellite_params))
+
+            deconvolved.append(create_deconvolution_df(df, deconv_image.flatten(), pos, cut_type, e_cut, n_dim))
+        return deconvolved
 
     def apply_deconvolution(df):
         '''
@@ -224,7 +240,14 @@ def deconvolve_signal(det_db           : pd.DataFrame,
         df.loc[:, "NormQ"] = np.nan
         for peak, hits in df.groupby("npeak"):
             hits.loc[:, "NormQ"] = hits.loc[:, 'Q'] / hits.loc[:, 'Q'].sum()
-            deconvolved_hits = pd.concat([deconvolve_hits(df_z, z) for z, df_z in hits.groupby("Z")], ignore_index=True)
+            slices           = list(hits.groupby("Z"))
+            psf_coords       = [select_psf(df_z, z) for z, df_z in slices]
+            deconvolved      = [None] * len(slices)
+            for coords in dict.fromkeys(psf_coords):
+                indices = [i for i, c in enumerate(psf_coords) if c == coords]
+                for i, df_z in zip(indices, deconvolve_hits([slices[i] for i in indices], coords)):
+                    deconvolved[i] = df_z
+            deconvolved_hits = pd.concat(deconvolved, ignore_index=True)
             deconvolved_hits = deconvolved_hits.assign(npeak=peak, Xpeak=hits.Xpeak.iloc[0], Ypeak=hits.Ypeak.iloc[0])
             distribute_energy(deconvolved_hits, hits, energy_type)
             deco_dst.append(deconvolved_hits)
@@ -454,6 +477,9 @@ def beersheba( files_in         : OneOrManyFiles
             'cubic' not supported for 3D deconvolution.
         n_iterations_g       : int
             Number of Lucy-Richardson iterations for gaussian in 'separate mode'
+        fft_workers          : int, optional
+            Number of workers used in the FFTs of the deconvolution.
+            Slices sharing the same PSF are deconvolved together.
     satellite_params : dict, None
         satellite_start_iter : int
             Iteration no. when satellite killer starts being used.
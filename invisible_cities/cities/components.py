@@ -4,6 +4,10 @@ from collections.abc import Sequence
 from argparse        import Namespace
 from glob            import glob
 from os.path         import expandvars
+from os.path         import dirname
+from importlib       import import_module
+from tempfile        import TemporaryDirectory
+from concurrent.futures import ProcessPoolExecutor
 from itertools       import count
 from itertools       import repeat
 from warnings        import warn
@@ -59,6 +63,7 @@ from .. reco                      import            hits_functions as hif
 from .. reco                      import             wfm_functions as wfm
 from .. reco                      import         paolina_functions as plf
 from .. reco   .xy_algorithms     import                    corona
+from .. reco   .xy_algorithms     import            SiPMNeighbours
 from .. reco   .xy_algorithms     import                barycenter
 from .. reco   .hits_functions    import            cluster_tagger
 from .. filters.s1s2_filter       import               S12Selector
@@ -94,7 +99,7 @@ from .. types  .symbols           import                    XYReco
 from .. types  .symbols           import                NormMethod
 
 from .. icaros .correction_functions   import    load_map
-from .. icaros .correction_functions   import    apply_correctionmap_inplace_hits
+from .. icaros .correction_functions   import    CorrectionMap3D
 
 
 
@@ -144,8 +149,17 @@ def city(city_function):
         conf.event_range  = event_range(conf)
         # TODO There were deamons! self.daemons = tuple(map(summon_daemon, kwds.get('daemons', [])))
 
+        n_workers = getattr(conf, "n_workers", 1)
+        if hasattr(conf, 'n_workers'):         del conf.n_workers
+
         args   = vars(conf)
-        result = check_annotations(city_function)(**args)
+        if n_workers > 1:
+            if city_function.__name__ not in parallel_cities:
+                raise ValueError(f"{city_function.__name__} cannot run with n_workers > 1: "
+                                  "only cities that process events one by one can")
+            result = run_city_in_parallel(city_function, args, n_workers)
+        else:
+            result = check_annotations(city_function)(**args)
         if os.path.exists(conf.file_out):
             write_city_configuration(conf.file_out, city_function.__name__, args)
             copy_cities_configuration(conf.files_in[0], conf.file_out)
@@ -154,6 +168,136 @@ def city(city_function):
     return proxy
 
 
+# Cities that process events one by one, without reducing over all of
+# them, so that their output can be split across workers and merged
+parallel_cities = { "beersheba", "buffy"  , "detsim"   , "diomira"
+                  , "dorothea" , "esmeralda", "hypathia", "irene"
+                  , "isaura"   , "isidora", "sophronia"}
+
+
+def _run_city_worker(module_name, city_name, args):
+    city_function = getattr(import_module(module_name), city_name).__wrapped__
+    return check_annotations(city_function)(**args)
+
+
+def run_city_in_parallel(city_function, args, n_workers):
+    """
+    Run a city over `n_workers` processes.
+
+    The input files are split in contiguous chunks, one per worker,
+    so each worker processes a subset of the files and writes a
+    partial output file. The partial outputs are then merged into
+    `args["file_out"]` following the order of the input files. For
+    the cities in `parallel_cities`, which process events one by one,
+    this yields the same output as a serial run. Cities that reduce
+    over all events (e.g. histograms or maps) are not supported. The
+    values returned by each worker are combined with
+    `merge_city_results`.
+
+    Only full event ranges are supported, since the event range
+    cannot be split meaningfully across files.
+    """
+    if args["event_range"] != (None,):
+        raise ValueError("Running a city with n_workers > 1 requires "
+                         "`event_range = all`")
+
+    files_in  = args["files_in"]
+    file_out  = args["file_out"]
+    n_workers = min(n_workers, len(files_in))
+    chunks    = np.array_split(np.arange(len(files_in)), n_workers)
+
+    with TemporaryDirectory(dir=dirname(os.path.abspath(file_out))) as tmpdir:
+        partial_files = [os.path.join(tmpdir, f"part_{i}.h5") for i in range(n_workers)]
+        worker_args   = [ dict(args, files_in=[files_in[i] for i in chunk], file_out=partial_file)
+                          for chunk, partial_file in zip(chunks, partial_files) ]
+
+        run_worker = partial(_run_city_worker, city_function.__module__, city_function.__name__)
+        with ProcessPoolExecutor(n_workers) as executor:
+            results = list(executor.map(run_worker, worker_args))
+
+        partial_files = list(filter(os.path.exists, partial_files))
+        if partial_files:
+            merge_output_files(partial_files, file_out)
+
+    return merge_city_results(results)
+
+
+def merge_city_results(results):
+    """
+    Combine the values returned by several runs of the same city.
+    Namespaces are merged field by field: integers and counters are
+    added, lists are concatenated and anything else is collected in
+    a list with one entry per run.
+    """
+    first = results[0]
+    if   isinstance(first, Namespace):
+        return Namespace(**{ k: merge_city_results([vars(r)[k] for r in results])
+                             for k in vars(first) })
+    elif isinstance(first, fl.PassedFailed):
+        return fl.PassedFailed(*map(sum, zip(*results)))
+    elif isinstance(first, (int, np.integer)) and not isinstance(first, bool):
+        return sum(results)
+    elif isinstance(first, list):
+        return sum(results, [])
+    else:
+        return results
+
+
+# Groups that hold run-wide information, identical in every partial file
+_run_wide_groups = "/DB/", "/config/"
+# MC tables whose file_index refers to the input files of each partial file
+_mc_indexed_tables = "/MC/configuration", "/MC/event_mapping"
+
+def merge_output_files(files_in, file_out):
+    """
+    Merge several city outputs into one file, in the given order.
+    - Tables and extendable arrays are concatenated.
+    - Run-wide groups (DB, config) and non-extendable arrays are
+      taken from the first file in which they appear.
+    - The file_index of the MC configuration and event mapping
+      tables is shifted so that it keeps increasing across files.
+    The attributes of each node (e.g. `columns_to_index`) are taken
+    from the first file in which the node appears.
+    """
+    with tb.open_file(file_out, "w") as h5out:
+        for filename in files_in:
+            with tb.open_file(filename) as h5in:
+                first_index = mcinfo_io.check_last_merge_index(h5out) + 1
+                for node in h5in.walk_nodes("/", classname="Leaf"):
+                    path = node._v_pathname
+                    if path.startswith(_run_wide_groups) and path in h5out:
+                        continue
+
+                    if path not in h5out:
+                        parent = get_or_create_group(h5out, node._v_parent._v_pathname)
+                        node._f_copy(parent)
+                        if path in _mc_indexed_tables:
+                            shift_file_index(h5out.get_node(path), first_index)
+                        continue
+
+                    target = h5out.get_node(path)
+                    if   isinstance(node, tb.Table):
+                        rows = node.read()
+                        if path in _mc_indexed_tables:
+                            rows["file_index"] += first_index
+                        target.append(rows)
+                    elif isinstance(node, tb.EArray):
+                        target.append(node.read())
+
+
+def get_or_create_group(h5out, path):
+    if path in h5out:
+        return h5out.get_node(path)
+    where, name = path.rsplit("/", 1)
+    return h5out.create_group(where or "/", name, createparents=True)
+
+
+def shift_file_index(table, shift):
+    if shift == 0: return
+    file_index = table.cols.file_index
+    file_index[:] = file_index[:] + shift
+
+
 @check_annotations
 def create_timestamp(rate: float) -> float:
     """
@@ -432,12 +576,12 @@ def deconv_pmt(dbfile, run_number, n_baseline,
     pmt_active = np.nonzero(DataPMT.Active.values)[0].tolist() if mask else np.ones(len(DataPMT), dtype=bool)
     coeff_c    = DataPMT.coeff_c  .values.astype(np.double)[pmt_active]
     coeff_blr  = DataPMT.coeff_blr.values.astype(np.double)[pmt_active]
+    b_cf, a_cf = blr.cleaning_filters(coeff_c)
 
     def deconv_pmt(rwfs):
         assert len(rwfs) == len(coeff_c)
         cwfs = pedestal_function(rwfs[:, :n_baseline]) - rwfs
-        cwfs = map(blr.deconvolve_signal, cwfs, coeff_c, coeff_blr)
-        return np.array(tuple(cwfs))
+        return blr.deconvolve_signals(cwfs.astype(np.double, copy=False), b_cf, a_cf, coeff_blr)
 
     return deconv_pmt
 
@@ -876,7 +1020,7 @@ def peak_classifier(**params):
 def compute_xy_position(dbfile, run_number, algo, **reco_params):
     if algo is XYReco.corona:
         datasipm    = load_db.DataSiPM(dbfile, run_number)
-        reco_params = dict(all_sipms = datasipm, **reco_params)
+        reco_params = dict(all_sipms = datasipm, sipm_neighbours = SiPMNeighbours(datasipm), **reco_params)
         algorithm   = corona
     else:
         algorithm   = barycenter
@@ -895,13 +1039,13 @@ def compute_z_and_dt(t_s2, t_s1, drift_v):
 
 
 def build_pointlike_event(dbfile, run_number, drift_v,
-                          reco, charge_type):
+                          reco, charge_type, noise_cache=None):
     datasipm   = load_db.DataSiPM(dbfile, run_number)
     sipm_xs    = datasipm.X.values
     sipm_ys    = datasipm.Y.values
     sipm_xys   = np.stack((sipm_xs, sipm_ys), axis=1)
 
-    sipm_noise = NoiseSampler(dbfile, run_number).signal_to_noise
+    sipm_noise = NoiseSampler(dbfile, run_number, cache_dir=noise_cache).signal_to_noise
 
     def build_pointlike_event(pmap, selector_output, event_number, timestamp):
         evt = KrEvent(event_number, timestamp * 1e-3)
@@ -998,6 +1142,7 @@ def hit_builder( detector_db : str
                , global_reco : XYReco
                , slice_reco  : XYReco
                , charge_type : SiPMCharge
+               , noise_cache : Optional[str] = None
                ) -> Callable:
     """
     Builds hits from PMaps using a general clustering algorithm. For a given
@@ -1046,13 +1191,17 @@ def hit_builder( detector_db : str
     charge_type: SiPMCharge
       Interpretation of the SiPM charge.
 
+    noise_cache: str, optional
+      Directory where the SiPM dark count expectations are cached
+      (see `NoiseSampler`).
+
     Returns
     -------
     build_hits: Callable
       A function that computes hits.
     """
     sipm_xys   = sipm_positions(detector_db, run_number)
-    sipm_noise =   NoiseSampler(detector_db, run_number).signal_to_noise
+    sipm_noise =   NoiseSampler(detector_db, run_number, cache_dir=noise_cache).signal_to_noise
 
     def build_hits( pmap           : PMap
                   , selector_output: S12SelectorOutput
@@ -1109,6 +1258,7 @@ def sipms_as_hits( detector_db : str
                  , q_thr       : float
                  , global_reco : Callable
                  , charge_type : SiPMCharge
+                 , noise_cache : Optional[str] = None
                  ) -> Callable:
     """
     Builds hits from PMaps taking each SiPM as an individual hit. For a given
@@ -1160,13 +1310,17 @@ def sipms_as_hits( detector_db : str
     charge_type: SiPMCharge
       Interpretation of the SiPM charge.
 
+    noise_cache: str, optional
+      Directory where the SiPM dark count expectations are cached
+      (see `NoiseSampler`).
+
     Returns
     -------
     build_hits: Callable
       A function that computes hits.
     """
     sipm_xys   = sipm_positions(detector_db, run_number)
-    sipm_noise =   NoiseSampler(detector_db, run_number).signal_to_noise
+    sipm_noise =   NoiseSampler(detector_db, run_number, cache_dir=noise_cache).signal_to_noise
 
     def build_hits( pmap           : PMap
                   , selector_output: S12SelectorOutput
@@ -1194,20 +1348,20 @@ def sipms_as_hits( detector_db : str
             slice_es = peak.pmts.sum_over_sensors
             xys      = sipm_xys[peak.sipms.ids]
 
-            for (slice_z, slice_e, sipm_qs) in zip(slice_zs, slice_es, sipm_charge):
-                sipm_xs, sipm_ys, sipm_qs, sipm_es = hif.sipms_above_threshold(xys, sipm_qs, q_thr, slice_e)
-                sipm_hs  = dict( event    = event_number
-                               , time     = timestamp * 1e-3
-                               , npeak    = peak_no
-                               , Xpeak    = xy_peak[0]
-                               , Ypeak    = xy_peak[1]
-                               , X        = sipm_xs
-                               , Y        = sipm_ys
-                               , Z        = slice_z
-                               , Q        = sipm_qs
-                               , E        = sipm_es
-                               )
-                hits.append(pd.DataFrame(sipm_hs))
+            # the hits of all the slices of the peak are built at once
+            slices, sipm_xs, sipm_ys, sipm_qs, sipm_es = hif.sipms_above_threshold_in_slices(xys, sipm_charge, q_thr, slice_es)
+            sipm_hs  = dict( event    = event_number
+                           , time     = timestamp * 1e-3
+                           , npeak    = peak_no
+                           , Xpeak    = xy_peak[0]
+                           , Ypeak    = xy_peak[1]
+                           , X        = sipm_xs
+                           , Y        = sipm_ys
+                           , Z        = slice_zs[slices]
+                           , Q        = sipm_qs
+                           , E        = sipm_es
+                           )
+            hits.append(pd.DataFrame(sipm_hs))
 
         hits = pd.concat(hits, ignore_index=True)
         hits = hits.astype(dict(npeak=np.uint16, Z=float))
@@ -1531,12 +1685,12 @@ def track_blob_info_creator_extractor(vox_size         : Tuple[float, float, flo
 
             ave_pos = np.average(hits_from_track["X Y Z".split()], weights=hits_from_track.Ep, axis=0)
             ave_r   = np.average(hits_from_track.R               , weights=hits_from_track.Ep, axis=0)
-            distances = plf.shortest_paths(t)
-            extr1, extr2, length = plf.find_extrema_and_length(distances)
+            analysis = plf.TrackAnalysis(t)
+            extr1, extr2, length = analysis.extrema_and_length()
             extr1_pos = extr1.XYZ
             extr2_pos = extr2.XYZ
 
-            e_blob1, e_blob2, hits_blob1, hits_blob2, blob_pos1, blob_pos2 = plf.blob_energies_hits_and_centres(t, blob_radius, scan_radius)
+            e_blob1, e_blob2, hits_blob1, hits_blob2, blob_pos1, blob_pos2 = analysis.blob_energies_hits_and_centres(blob_radius, scan_radius)
 
             common_hits = hits_blob1.merge(hits_blob2, how="inner")
             overlap     = common_hits.Ep.sum()
@@ -1673,6 +1827,7 @@ def hits_corrector( filename     : str
                   , norm_method  : NormMethod
                   , norm_options : Optional[dict] = None
                   , apply_z      : Optional[bool] = False
+                  , interpolate  : Optional[bool] = False
                   ) -> Callable:
     """
     Applies energy correction map and converts drift time to z.
@@ -1684,6 +1839,9 @@ def hits_corrector( filename     : str
     apply_temp : bool
         whether to apply temporal corrections
         must be set to False if no temporal correction dataframe exists in map file
+    interpolate : bool
+        whether to interpolate the map trilinearly instead of taking
+        the value of the nearest voxel
 
     Returns
     ----------
@@ -1691,9 +1849,10 @@ def hits_corrector( filename     : str
     and Z fields assigned. Input data is not modified.
     """
     maps = load_map(os.path.expandvars(filename))
+    cmap = CorrectionMap3D(maps.krmap, norm_method, norm_options, interpolate)
 
     def correct(hits : pd.DataFrame) -> pd.DataFrame:
-        hits = apply_correctionmap_inplace_hits(hits, maps.krmap, norm_method, norm_options, 'Ec', units.MeV)
+        hits["Ec"] = cmap.correct(hits.Z.values, hits.X.values, hits.Y.values, hits.E.values, units.MeV)
 
         if apply_z:
             median_dv  = maps.t_evol.dv.median()
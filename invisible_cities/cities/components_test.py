@@ -6,6 +6,7 @@ import pandas as pd
 
 from argparse  import Namespace
 from functools import partial
+from importlib import import_module
 
 from pytest import mark
 from pytest import raises
@@ -23,7 +24,13 @@ from .. types.symbols      import WfType
 from .. types.symbols      import EventRange as ER
 from .. types.symbols      import NormMethod
 from .. types.symbols      import XYReco
+from .. types.symbols      import SiPMCharge
+from .. types.symbols      import RebinMethod
+from .. reco               import hits_functions as hif
+from .. reco.xy_algorithms import barycenter
+from .. filters.s1s2_filter import S12SelectorOutput
 
+from .              import components
 from .  components import event_range
 from .  components import collect
 from .  components import copy_mc_info
@@ -38,8 +45,13 @@ from .  components import check_max_time
 from .  components import hits_corrector
 from .  components import write_city_configuration
 from .  components import copy_cities_configuration
+from .  components import merge_city_results
+from .  components import sipms_as_hits
+from .  components import sipm_positions
+from .  components import get_s1_time
 
 from .. dataflow   import dataflow as fl
+from .. io.dst_io  import df_writer
 
 from typing import Union
 
@@ -313,6 +325,44 @@ def test_hits_and_kdst_from_files(ICDATADIR):
     assert type(output['kdst'])   == pd.DataFrame
 
 
+@mark.parametrize("q_thr", (0, 5 * units.pes, 1e9 * units.pes))
+def test_sipms_as_hits_same_as_per_slice(KrMC_pmaps_dict, q_thr):
+    """
+    The hits of all the slices of a peak are built at once. Compare
+    them with those produced slice by slice with
+    `sipms_above_threshold`.
+    """
+    detector_db = "new"
+    run_number  = 0
+    drift_v     = 1 * units.mm / units.mus
+    sipm_xys    = sipm_positions(detector_db, run_number)
+    build_hits  = sipms_as_hits( detector_db, run_number, drift_v
+                               , 1, RebinMethod.stride, q_thr
+                               , barycenter, SiPMCharge.raw)
+
+    pmaps, evt_numbers = KrMC_pmaps_dict
+    for event in evt_numbers.si_events:
+        pmap     = pmaps[event]
+        selected = S12SelectorOutput(True, [True] * len(pmap.s1s), [True] * len(pmap.s2s))
+        hits     = build_hits(pmap, selected, event, 0)
+
+        s1_t     = get_s1_time(pmap, selected)
+        expected = []
+        for peak_no, peak in enumerate(pmap.s2s):
+            xys = sipm_xys[peak.sipms.ids]
+            for time, slice_e, sipm_qs in zip(peak.times, peak.pmts.sum_over_sensors, peak.sipms.all_waveforms.T):
+                xs, ys, qs, es = hif.sipms_above_threshold(xys, sipm_qs, q_thr, slice_e)
+                expected.append(pd.DataFrame(dict( npeak = peak_no
+                                                 , X = xs, Y = ys
+                                                 , Z = (time - s1_t) * units.ns * drift_v
+                                                 , Q = qs, E = es)))
+        expected = pd.concat(expected, ignore_index=True)
+
+        assert np.all     (hits.npeak == expected.npeak)
+        for column in "X Y Z Q E".split():
+            assert np.allclose(hits[column], expected[column])
+
+
 @ignore_warning.no_hits
 def test_hits_and_kdst_from_files_missing_hits(Th228_hits_missing, config_tmpdir):
     n_events_true = len(pd.read_hdf(Th228_hits_missing, "/Run/events"))
@@ -613,3 +663,71 @@ def test_copy_cities_configuration_warns_when_nothing_to_copy(ICDATADIR, config_
 
     with warns(UserWarning, match="Input file does not contain /config group"):
         copy_cities_configuration(filename1, filename2)
+
+
+@city
+def parallel_dummy_city( files_in    : list
+                       , file_out    : str
+                       , event_range : tuple):
+    evtnum_list = []
+    with tb.open_file(file_out, "w") as h5out:
+        for file_index, filename in enumerate(files_in):
+            events = pd.read_hdf(filename, "/Run/events")
+            df_writer(h5out, events, "Run", "events", columns_to_index=["evt_number"])
+            df_writer(h5out, events.assign(file_index=file_index), "MC", "event_mapping")
+            evtnum_list.extend(events.evt_number.tolist())
+        df_writer(h5out, pd.DataFrame(dict(run_number=[1])), "DB", "dummy")
+    return Namespace( events_in   = len(evtnum_list)
+                    , evtnum_list = evtnum_list
+                    , selection   = fl.PassedFailed(len(evtnum_list), 0))
+
+
+@ignore_warning.no_config_group
+def test_city_n_workers_gives_same_output_as_serial(config_tmpdir, monkeypatch):
+    monkeypatch.setattr(components, "parallel_cities", {"parallel_dummy_city"})
+    files_in = []
+    for i in range(5):
+        filename = os.path.join(config_tmpdir, f"test_city_n_workers_input_{i}.h5")
+        events   = pd.DataFrame(dict(evt_number=np.arange(3) + 10 * i, timestamp=np.ones(3) * i))
+        with tb.open_file(filename, "w") as h5out:
+            df_writer(h5out, events, "Run", "events")
+        files_in.append(filename)
+
+    file_out_serial   = os.path.join(config_tmpdir, "test_city_n_workers_serial.h5")
+    file_out_parallel = os.path.join(config_tmpdir, "test_city_n_workers_parallel.h5")
+    result_serial     = parallel_dummy_city( files_in = files_in, file_out = file_out_serial
+                                           , event_range = ER.all)
+    result_parallel   = parallel_dummy_city( files_in = files_in, file_out = file_out_parallel
+                                           , event_range = ER.all, n_workers = 3)
+
+    assert result_parallel == result_serial
+
+    with tb.open_file(file_out_serial) as serial, tb.open_file(file_out_parallel) as parallel:
+        for table in ("/Run/events", "/MC/event_mapping", "/DB/dummy"):
+            assert_tables_equality(parallel.get_node(table), serial.get_node(table))
+        assert parallel.root.Run.events.cols.evt_number.is_indexed
+        assert "parallel_dummy_city" in parallel.root.config
+
+
+def test_city_n_workers_requires_full_event_range(config_tmpdir, monkeypatch):
+    monkeypatch.setattr(components, "parallel_cities", {"parallel_dummy_city"})
+    file_out = os.path.join(config_tmpdir, "test_city_n_workers_requires_full_event_range.h5")
+    with raises(ValueError):
+        parallel_dummy_city( files_in = [__file__, __file__.replace("_test", "")]
+                           , file_out = file_out, event_range = 10, n_workers = 2)
+
+
+@mark.parametrize("city_name", ("berenice", "trude"))
+def test_city_n_workers_raises_for_reduce_cities(config_tmpdir, city_name):
+    city_function = getattr(import_module(f"invisible_cities.cities.{city_name}"), city_name)
+    file_out      = os.path.join(config_tmpdir, f"test_city_n_workers_{city_name}.h5")
+    with raises(ValueError, match="n_workers"):
+        city_function( files_in = [__file__, __file__.replace("_test", "")]
+                     , file_out = file_out, event_range = ER.all, n_workers = 2)
+
+
+def test_merge_city_results():
+    results  = [ Namespace(n=1, evts=[0, 1], pf=fl.PassedFailed(2, 0), other="a")
+               , Namespace(n=2, evts=[   5], pf=fl.PassedFailed(0, 1), other="b") ]
+    expected =   Namespace(n=3, evts=[0, 1, 5], pf=fl.PassedFailed(2, 1), other=["a", "b"])
+    assert merge_city_results(results) == expected
@@ -18,6 +18,8 @@ import warnings
 import numpy  as np
 import tables as tb
 
+from typing import Optional
+
 from . components import city
 from . components import print_every
 from . components import copy_mc_info
@@ -128,13 +130,14 @@ def buffer_times_and_length_getter(pmt_width, sipm_width, el_gap, el_dv, max_len
     return get_buffer_times_and_length
 
 
-def s2_waveform_creator(sns_bin_width, LT, el_drift_velocity):
+def s2_waveform_creator(sns_bin_width, LT, el_drift_velocity, group_electrons=False):
     """
     Same function as create_wfs in module detsim.s2_waveforms_c with poissonization.
     See description of the refered function for more details.
     """
     def create_s2_waveform(xs, ys, ts, phs, tmin, buffer_length):
-        waveforms = create_wfs(xs, ys, ts, phs, LT, el_drift_velocity, sns_bin_width, buffer_length, tmin)
+        waveforms = create_wfs(xs, ys, ts, phs, LT, el_drift_velocity, sns_bin_width, buffer_length, tmin,
+                               group_electrons = group_electrons)
         return np.random.poisson(waveforms)
     return create_s2_waveform
 
@@ -167,6 +170,8 @@ def detsim( *
           , rate               : float
           , data_mc_ratio_pmt  : float
           , data_mc_ratio_sipm : float
+          , lighttable_cache   : Optional[str] = None
+          , group_s2_electrons : bool          = False
           ):
 
     buffer_params_  = buffer_params .copy()
@@ -180,8 +185,9 @@ def detsim( *
     # derived parameters
     datapmt  = db.DataPMT (detector_db, run_number)
     datasipm = db.DataSiPM(detector_db, run_number)
-    lt_pmt   = LT_PMT (fname=os.path.expandvars(s2_lighttable), data_mc_ratio=data_mc_ratio_pmt )
-    lt_sipm  = LT_SiPM(fname=os.path.expandvars(sipm_psf)     , data_mc_ratio=data_mc_ratio_sipm, sipm_database=datasipm)
+    cache    = os.path.expandvars(lighttable_cache) if lighttable_cache else None
+    lt_pmt   = LT_PMT (fname=os.path.expandvars(s2_lighttable), data_mc_ratio=data_mc_ratio_pmt , cache_dir=cache)
+    lt_sipm  = LT_SiPM(fname=os.path.expandvars(sipm_psf)     , data_mc_ratio=data_mc_ratio_sipm, cache_dir=cache, sipm_database=datasipm)
     el_gap   = lt_sipm.el_gap_width
 
     filter_delayed_hits = fl.map(filter_hits_after_max_time(buffer_params_["max_time"]),
@@ -221,7 +227,7 @@ def detsim( *
                                      args = ('x', 'y', 'z', 'time', 'energy', 'tmin', 'buffer_length'),
                                      out = 's1_pmt_waveforms')
 
-    create_pmt_s2_waveforms = fl.map(s2_waveform_creator(buffer_params_["pmt_width"], lt_pmt, el_dv),
+    create_pmt_s2_waveforms = fl.map(s2_waveform_creator(buffer_params_["pmt_width"], lt_pmt, el_dv, group_s2_electrons),
                                      args = ('x_ph', 'y_ph', 'times_ph', 'nphotons', 'tmin', 'buffer_length'),
                                      out = 's2_pmt_waveforms')
 
@@ -231,7 +237,7 @@ def detsim( *
 
     create_pmt_waveforms = fl.pipe(create_pmt_s1_waveforms, create_pmt_s2_waveforms, sum_pmt_waveforms)
 
-    create_sipm_waveforms = fl.map(s2_waveform_creator(buffer_params_["sipm_width"], lt_sipm, el_dv),
+    create_sipm_waveforms = fl.map(s2_waveform_creator(buffer_params_["sipm_width"], lt_sipm, el_dv, group_s2_electrons),
                                    args = ('x_ph', 'y_ph', 'times_ph', 'nphotons', 'tmin', 'buffer_length'),
                                    out = 'sipm_bin_wfs')
 
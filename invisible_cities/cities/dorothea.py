@@ -37,6 +37,7 @@ The properties of the S2 signals are those of the S1 signal plus:
 
 from operator import attrgetter
 
+import os
 import tables as tb
 
 from .. core.configure      import       EventRangeType
@@ -88,6 +89,7 @@ def dorothea( files_in         :  OneOrManyFiles
             , global_reco_algo : XYReco, global_reco_params:  dict
             , sipm_charge_type : SiPMCharge
             , include_mc       : Optional[bool] = False
+            , noise_cache      : Optional[str]  = None
 ):
     # global_reco_params are qth, qlm, lm_radius, new_lm_radius, msipm
     # qlm           =  0 * pes every Cluster must contain at least one SiPM with charge >= qlm
@@ -105,8 +107,10 @@ def dorothea( files_in         :  OneOrManyFiles
 
     reco_algo             = compute_xy_position( detector_db, run_number
                                                , global_reco_algo, **global_reco_params)
+    noise_cache           = os.path.expandvars(noise_cache) if noise_cache else None
     build_pointlike_event = fl.map(build_pointlike_event_( detector_db, run_number, drift_v
-                                                         , reco_algo, sipm_charge_type),
+                                                         , reco_algo, sipm_charge_type
+                                                         , noise_cache),
                                    args = ("pmap", "selector_output", "event_number", "timestamp"),
                                    out  = "pointlike_event"                                       )
 
@@ -30,6 +30,8 @@ The tasks performed are:
  - (Optional) apply energy corrections to the hits
 """
 
+import os
+
 from operator import attrgetter
 
 import numpy  as np
@@ -96,6 +98,7 @@ def sophronia( files_in           : OneOrManyFiles
              , same_peak          : bool
              , corrections        : Optional[dict] = None
              , clustering_params  : Optional[dict] = None
+             , noise_cache        : Optional[str]  = None
              ):
     """
     drift_v : float
@@ -149,7 +152,13 @@ def sophronia( files_in           : OneOrManyFiles
             Scaling factor to apply to the (x, y) coordinates before clustering.
         scale_z  : float
             Scaling factor to apply to the z coordinate before clustering.
+
+    noise_cache : str, optional
+        Directory where the SiPM dark count expectations used for the
+        signal-to-noise charge are cached across jobs.
     """
+    noise_cache = os.path.expandvars(noise_cache) if noise_cache else None
+
     global_reco = compute_xy_position( detector_db
                                      , run_number
                                      , global_reco_algo
@@ -173,7 +182,8 @@ def sophronia( files_in           : OneOrManyFiles
                                           , rebin_method
                                           , q_thr
                                           , global_reco
-                                          , sipm_charge_type)
+                                          , sipm_charge_type
+                                          , noise_cache)
                            , args = "pmap selector_output event_number timestamp".split()
                            , out  = "hits")
 
@@ -197,7 +207,8 @@ def sophronia( files_in           : OneOrManyFiles
                                                            , run_number
                                                            , drift_v
                                                            , global_reco
-                                                           , sipm_charge_type)
+                                                           , sipm_charge_type
+                                                           , noise_cache)
                                   , args = "pmap selector_output event_number timestamp".split()
                                   , out  = "pointlike_event")
 
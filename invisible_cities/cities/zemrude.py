@@ -21,6 +21,8 @@ from .. icaros  .selection_functions     import apply_selections
 from .. icaros  .krmap_functions         import compute_3D_map
 from .. icaros  .krmap_functions         import gaussian_fit_ready
 from .. icaros  .krmap_functions         import get_median
+from .. icaros  .krmap_functions         import gaussian_fit_by_voxel_ready
+from .. icaros  .krmap_functions         import get_median_by_voxel
 from .. icaros  .krmap_functions         import compute_metadata
 from .. icaros  .krmap_functions         import get_time_evol
 from .. icaros  .krmap_functions         import save_map
@@ -58,18 +60,28 @@ def select_dst(dtrms2_low, dtrms2_upp, low_xrays, high_xrays, low_S2t, high_S2t,
     return apply_selections_dst
 
 
-def create_selfmap(xy_range, dt_range, xy_nbins, dt_nbins, S2e_range, fit_function, nbins, min_events):
+def create_selfmap(xy_range, dt_range, xy_nbins, dt_nbins, S2e_range, fit_function, nbins, min_events, nprocs=1):
+    vectorized = False
     if fit_function == MapFitFunction.gaussian:
         fit_function = gaussian_fit_ready(nbins, min_events)
 
     elif fit_function == MapFitFunction.median:
         fit_function = get_median
 
+    elif fit_function == MapFitFunction.fast_gaussian:
+        fit_function = gaussian_fit_by_voxel_ready(nbins, min_events)
+        vectorized   = True
+
+    elif fit_function == MapFitFunction.fast_median:
+        fit_function = get_median_by_voxel
+        vectorized   = True
+
     else:
         raise ValueError(f'Invalid fit function {fit_function}')
 
     def create_map(df):
-        return compute_3D_map(df,xy_range, dt_range, xy_nbins, dt_nbins, S2e_range, fit_function)
+        return compute_3D_map(df,xy_range, dt_range, xy_nbins, dt_nbins, S2e_range, fit_function,
+                              vectorized, nprocs)
     return create_map
 
 
@@ -164,6 +176,7 @@ def zemrude(files_in           : OneOrManyFiles
             , xy_range_plot    : np.ndarray
             , error            : bool = False
             , xy_params        : dict = None
+            , fit_processes    : int  = 1
             ):
 
     apply_preliminary_map  = fl.map( apply_map(pre_map,
@@ -196,7 +209,8 @@ def zemrude(files_in           : OneOrManyFiles
                                             S2e_range,
                                             fit_function,
                                             nbins,
-                                            min_events)
+                                            min_events,
+                                            fit_processes)
                              , args = 'selected_dst'
                              , out  = '3D_krmap')
 
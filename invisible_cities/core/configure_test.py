@@ -371,6 +371,8 @@ def test_config_city_fails_without_output_file(simple_conf_file_name):
                    ('run_number' ,       '--run-number 24', 24),
                    ('print_mod'  ,                 '-p 25', 25),
                    ('print_mod'  ,        '--print-mod 26', 26),
+                   ('n_workers'  ,                  '-j 4',  4),
+                   ('n_workers'  ,        '--n-workers 5',  5),
                    ('event_range',                '-e all', [all]),
                    ('event_range',     '--event-range all', [all]),
                    ('event_range',                 '-e 27', [27]),
@@ -1,8 +1,14 @@
+import os
+import hashlib
+import tempfile
+
 import numpy as np
 
 from scipy.signal import fftconvolve
 
 from typing       import       Tuple
+from typing       import    Optional
+from typing       import    Callable
 
 from functools    import     partial
 from functools    import   lru_cache
@@ -101,12 +107,64 @@ def general_thresholds(xbins : np.array,
     return cuts
 
 
+NOISE_CACHE_VERSION = 1
+
+
+def noise_cache(build     : Callable[[], np.array],
+                cache_dir : Optional[str],
+                name      : str,
+                *arrays   : np.array,
+                **params) -> np.array:
+    """
+    Returns the array produced by `build`, storing it in a cache.
+    The cache is a .npy file in `cache_dir`, named after `name` and a
+    hash of the contents of `arrays`, `params` and the cache version.
+    Once written, the array is memory-mapped read-only.
+
+    Parameters
+    ----------
+    build : Callable
+        Function without arguments returning the array.
+    cache_dir : str or None
+        Directory where the cache is stored. If None, `build` is
+        called and no cache is used.
+    name : str
+        Prefix of the cache file.
+    arrays : numpy.ndarray
+        Input data of `build`.
+    params :
+        Parameters that change the output of `build`.
+
+    Returns
+    -------
+    array : numpy.ndarray
+        The array returned by `build`.
+    """
+    if cache_dir is None:
+        return build()
+
+    sha = hashlib.sha256()
+    sha.update(f"{NOISE_CACHE_VERSION} {sorted(params.items())}".encode())
+    for array in arrays:
+        sha.update(np.ascontiguousarray(array).tobytes())
+    path = os.path.join(cache_dir, f"{name}.{sha.hexdigest()[:16]}.npy")
+
+    if not os.path.isfile(path):
+        os.makedirs(cache_dir, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=cache_dir, suffix=".npy", delete=False) as file:
+            np.save(file, build())
+        os.replace(file.name, path)
+
+    return np.load(path, mmap_mode="r")
+
+
 class NoiseSampler:
     def __init__(self,
                  detector    : str,
                  run_number  : int,
                  sample_size : int = 1,
-                 smear       : bool = True):
+                 smear       : bool = True,
+                 cache_dir   : Optional[str] = None):
         """Sample a histogram as if it was a PDF.
 
         Parameters
@@ -119,6 +177,11 @@ class NoiseSampler:
             If True, the samples are uniformly smeared to simulate
             a continuous distribution. If False, the samples are
             always the center of the histograms' bins. Default is True.
+        cache_dir: str, optional
+            Directory where the multi-sample distributions and the dark
+            count expectations are stored, so that they are computed
+            only once for given noise spectra (see `noise_cache`).
+            Default is None (no cache).
 
         Attributes
         ---------
@@ -138,6 +201,7 @@ class NoiseSampler:
          self.baselines) = DB.SiPMNoise(detector, run_number)
         self.nsamples    = sample_size
         self.smear       = smear
+        self.cache_dir   = cache_dir
         self.active      = DB.DataSiPM(detector, run_number).Active.values[:, np.newaxis]
         self.adc_to_pes  = DB.DataSiPM(detector, run_number).adc_to_pes.values.astype(np.double)[:, np.newaxis]
         self.nsensors    = self.active.size
@@ -147,23 +211,63 @@ class NoiseSampler:
         self.baselines   = self.baselines[:, np.newaxis]
         self.dx          = np.diff(self.xbins)[0] * 0.5
 
-        self._sampler    = partial(sample_discrete_distribution,
-                                   self.xbins,
-                                   size = self.nsamples)
-        self._smearer    = partial(uniform_smearing,
-                                   max_deviation = self.dx,
-                                   size          = (self.nsensors,
-                                                    self.nsamples))
+        # Cumulative distributions of all sensors with a guide table
+        # pointing, for each interval [j/nbins, (j+1)/nbins), to the
+        # first bin whose cumulative probability is above j/nbins.
+        # A uniform draw u starts at the bin pointed by its interval
+        # and moves forward until the cumulative probability exceeds u,
+        # which takes one or two steps on average.
+        nbins            = len(self.xbins)
+        cdfs             = np.cumsum(self.probs, axis=1)
+        cdfs[:, -1]      = 1
+        guide            = np.arange(nbins) / nbins
+        guide            = np.array([np.searchsorted(cdf, guide, side="right") for cdf in cdfs])
+        self._has_noise  = self.probs.any(axis=1)
+        self._cdfs       = cdfs.ravel()
+        self._guide      = guide + np.arange(self.nsensors)[:, np.newaxis] * nbins
 
     def mask(self, array):
         """Set to 0 those rows corresponding to masked sensors"""
         return array * self.active
 
-    def sample(self):
-        """Take a set of samples from each pdf."""
-        sample  = np.apply_along_axis(self._sampler, 1, self.probs)
+    def sample(self, nevents : Optional[int] = None,
+               rng     : Optional[np.random.Generator] = None) -> np.array:
+        """Take a set of samples from each pdf.
+
+        Parameters
+        ----------
+        nevents : int, optional
+            Number of events to sample. If given, the output has an
+            additional leading dimension of this size.
+        rng : numpy.random.Generator, optional
+            Source of random numbers. If not given, the global
+            numpy random state is used.
+
+        Returns
+        -------
+        sample : numpy.ndarray
+            Samples in adc with shape (nsensors, nsamples) or
+            (nevents, nsensors, nsamples).
+        """
+        rng   = np.random if rng is None else rng
+        shape = (self.nsensors, self.nsamples)
+        if nevents is not None:
+            shape = (nevents,) + shape
+
+        nbins  = len(self.xbins)
+        u      = rng.random(shape)
+        index  = self._guide[np.arange(self.nsensors)[:, np.newaxis], (u * nbins).astype(int)]
+        # walk forward the draws that are beyond the guide bin
+        u, index = u.ravel(), index.ravel()
+        walk     = np.flatnonzero(self._cdfs[index] <= u)
+        while walk.size:
+            index[walk] += 1
+            walk         = walk[self._cdfs[index[walk]] <= u[walk]]
+
+        index  = index.reshape(shape) % nbins
+        sample = self.xbins[index] * self._has_noise[:, np.newaxis]
         if self.smear:
-            sample += self._smearer()
+            sample += rng.uniform(-self.dx, self.dx, size=shape)
         sample = self.adc_to_pes * sample + self.baselines
         return self.mask(sample)
 
@@ -229,6 +333,17 @@ class NoiseSampler:
         the mean expectation to approximate
         dark counts for all sipm channels.
         """
+        def build():
+            return self._dark_expectation(sample_width, dark_model)
+
+        return noise_cache(build, self.cache_dir, "dark_pes",
+                           self.probs, self.xbins, self.active,
+                           sample_width = sample_width,
+                           dark_model   = dark_model.name)
+
+
+    def _dark_expectation(self, sample_width : int,
+                          dark_model=DarkModel.threshold) -> np.array:
         pdfs = self.multi_sample_distributions(sample_width)
 
         pad_xbins, _ = pad_pdfs(self.xbins, self.probs)
@@ -270,12 +385,19 @@ class NoiseSampler:
             the requested sample_width and padded for symmetry
             around zero.
         """
+        def build():
+            return self._multi_sample_distributions(sample_width)
+
+        return noise_cache(build, self.cache_dir, "sipm_pdfs",
+                           self.probs, self.xbins,
+                           sample_width = sample_width)
+
+
+    @lru_cache(maxsize=30)
+    def _multi_sample_distributions(self, sample_width : int) -> np.array:
         if sample_width == 1:
             return pad_pdfs(self.xbins, self.probs)[1]
 
-        mapping = map(fftconvolve                                      ,
-                      self.multi_sample_distributions(               1),
-                      self.multi_sample_distributions(sample_width - 1),
-                      np.full(self.probs.shape[0], "same")             )
-
-        return np.array(tuple(mapping))
+        return fftconvolve(self._multi_sample_distributions(               1),
+                           self._multi_sample_distributions(sample_width - 1),
+                           mode = "same", axes = 1)
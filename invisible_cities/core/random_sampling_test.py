@@ -1,3 +1,5 @@
+import os
+
 import numpy as np
 
 from flaky  import   flaky
@@ -23,6 +25,7 @@ from . random_sampling  import inverse_cdf_index
 from . random_sampling  import inverse_cdf
 from . random_sampling  import pad_pdfs
 from . random_sampling  import NoiseSampler
+from . random_sampling  import noise_cache
 
 sensible_sizes    =                  integers(min_value =    2,
                                               max_value =   20)
@@ -177,6 +180,34 @@ def test_inverse_cdf_hypothesis_generated(distribution, percentile):
     assert icdf == approx(true_value)
 
 
+def test_noise_cache_builds_once(tmpdir):
+    cache_dir = os.path.join(tmpdir, "cache")
+    probs     = np.full((3, 4), 0.25)
+
+    calls = []
+    def build():
+        calls.append(None)
+        return np.arange(12.).reshape(3, 4)
+
+    for _ in range(3):
+        values = noise_cache(build, cache_dir, "pdfs", probs, sample_width=2)
+        assert len(calls) == 1
+        assert np.array_equal(values, np.arange(12.).reshape(3, 4))
+        assert not values.flags.writeable
+
+    noise_cache(build, cache_dir, "pdfs", probs, sample_width=3)
+    assert len(calls) == 2
+
+    noise_cache(build, cache_dir, "pdfs", probs * 2, sample_width=2)
+    assert len(calls) == 3
+
+
+def test_noise_cache_without_cache_dir():
+    build  = lambda: np.ones(3)
+    values = noise_cache(build, None, "pdfs", np.ones(3), sample_width=2)
+    assert np.array_equal(values, np.ones(3))
+
+
 @fixture(scope="module")
 def run_number():
     return 4714
@@ -213,6 +244,35 @@ def test_noise_sampler_output_shape(datasipm, noise_sampler):
     assert sample.shape == (nsipm, nsamples)
 
 
+def test_noise_sampler_output_shape_many_events(datasipm, noise_sampler):
+    nsipm                       = len(datasipm)
+    noise_sampler, nsamples, *_ = noise_sampler
+    sample                      = noise_sampler.sample(3)
+    assert sample.shape == (3, nsipm, nsamples)
+
+
+def test_noise_sampler_generator_is_reproducible(noise_sampler):
+    noise_sampler, *_ = noise_sampler
+    sample1 = noise_sampler.sample(2, np.random.default_rng(123))
+    sample2 = noise_sampler.sample(2, np.random.default_rng(123))
+    assert np.all(sample1 == sample2)
+
+
+def test_noise_sampler_follows_distribution(datasipm, noise_sampler):
+    noise_sampler, nsamples, smear, *_ = noise_sampler
+    if smear: return
+
+    nevents   = 20
+    samples   = noise_sampler.sample(nevents, np.random.default_rng(123))
+    samples   = (samples - noise_sampler.baselines) / noise_sampler.adc_to_pes
+    bin_width = 2 * noise_sampler.dx
+    for i in np.flatnonzero(datasipm.Active.values)[:10]:
+        index = np.round((samples[:, i] - noise_sampler.xbins[0]) / bin_width).astype(int)
+        freq  = np.bincount(index.flatten(), minlength=len(noise_sampler.xbins)) / (nevents * nsamples)
+        assert np.all(freq[noise_sampler.probs[i] == 0] == 0)
+        assert np.allclose(freq, noise_sampler.probs[i], atol=0.01)
+
+
 def test_noise_sampler_masked_sensors(datasipm, noise_sampler):
     noise_sampler, *_ = noise_sampler
     sample            = noise_sampler.sample()
@@ -323,6 +383,18 @@ def test_noise_sampler_signal_to_noise(noise_sampler,
     assert np.allclose(np.round(signal_to_noise, 2), expected)
 
 
+@mark.parametrize("dark_model", DarkModel)
+def test_noise_sampler_dark_expectation_cache(dbnew, run_number, noise_sampler, tmpdir, dark_model):
+    noise_sampler, *_ = noise_sampler
+    expected          = noise_sampler.dark_expectation(3, dark_model)
+
+    for _ in range(2):
+        sampler = NoiseSampler(dbnew, run_number, cache_dir=str(tmpdir))
+        cached  = sampler.dark_expectation(3, dark_model)
+        assert np.allclose(cached, expected)
+    assert len(os.listdir(tmpdir)) == 2 # pdfs and dark expectation
+
+
 def test_signal_to_noise_zero_sample_raises_error(noise_sampler):
 
     noise_sampler, *_ = noise_sampler
@@ -21,6 +21,9 @@ def bin_sensors(sensors   : pd.DataFrame,
                 max_buffer: float       ) -> Tuple[np.ndarray, pd.Series]:
     """
     Raw data binning function.
+    All sensors are binned at once: equivalent to applying
+    `weighted_histogram` to each sensor, but in a single
+    `np.bincount` call over (sensor, bin) pairs.
 
     Parameters
     ----------
@@ -36,7 +39,25 @@ def bin_sensors(sensors   : pd.DataFrame,
     max_bin     = np.ceil (max_time / bin_width) * bin_width
 
     bins        = np.arange(min_bin, max_bin + bin_width, bin_width)
-    bin_sensors = sensors.groupby('sensor_id').apply(weighted_histogram, bins)
+    nbins       = len(bins) - 1
+
+    ids         = (sensors.index.get_level_values('sensor_id')
+                   if 'sensor_id' in sensors.index.names else sensors.sensor_id)
+    sensor_indx, sensor_ids = pd.factorize(ids, sort=True)
+    times       = sensors.time  .values
+    charge      = sensors.charge.values
+
+    # same convention as np.histogram: bins closed on the left,
+    # except for the last one, which is closed on both sides
+    bin_indx    = np.searchsorted(bins, times, side='right') - 1
+    bin_indx[times == bins[-1]] = nbins - 1
+    in_range    = (bin_indx >= 0) & (bin_indx < nbins)
+
+    binned      = np.bincount(sensor_indx[in_range] * nbins + bin_indx[in_range],
+                              weights   = charge[in_range],
+                              minlength = len(sensor_ids) * nbins)
+    binned      = binned.reshape(len(sensor_ids), nbins).astype(charge.dtype, copy=False)
+    bin_sensors = pd.Series(list(binned), index=pd.Index(sensor_ids, name='sensor_id'), dtype=object)
     return bins[:-1], bin_sensors
 
 
@@ -69,7 +90,10 @@ def pad_safe(sensors: np.ndarray, padding: Tuple) -> np.ndarray:
     """Pads zeros around each sensor in a 2D array"""
     if not sensors.shape[0]:
         return np.empty((0, padding[0] + padding[1] + 1))
-    return np.apply_along_axis(np.pad, 1, sensors, padding, "constant")
+    nsensors, nsamples = sensors.shape
+    padded = np.zeros((nsensors, padding[0] + nsamples + padding[1]), dtype=sensors.dtype)
+    padded[:, padding[0]:padding[0] + nsamples] = sensors
+    return padded
 
 
 def buffer_calculator(buffer_len: float, pre_trigger: float,
@@ -5,9 +5,11 @@ from pytest import mark
 
 from .. core            import system_of_units as units
 
-from . buffer_functions import       bin_sensors
-from . buffer_functions import buffer_calculator
-from . buffer_functions import find_signal_start
+from . buffer_functions import        bin_sensors
+from . buffer_functions import  buffer_calculator
+from . buffer_functions import  find_signal_start
+from . buffer_functions import           pad_safe
+from . buffer_functions import weighted_histogram
 
 
 def test_bin_sensors(mc_waveforms, pmt_ids, sipm_ids):
@@ -47,6 +49,37 @@ def test_bin_sensors(mc_waveforms, pmt_ids, sipm_ids):
     assert sipm_wf.sum().sum() == sipm_sum
 
 
+@mark.parametrize("dtype", (int, float))
+def test_bin_sensors_same_as_weighted_histogram(dtype):
+    bin_width = 25 * units.ns
+    rng       = np.random.default_rng(123)
+    ids       = np.repeat([12, 3, 7], 20)
+    times     = rng.integers(0, 40, ids.size) * bin_width
+    charges   = rng.integers(1, 5, ids.size).astype(dtype)
+    sensors   = pd.DataFrame(dict(time=times, charge=charges),
+                             index=pd.Index(ids, name='sensor_id'))
+
+    # some samples fall outside the binning range
+    t_min, t_max = 5 * bin_width, 30 * bin_width
+    bins, binned = bin_sensors(sensors, bin_width, t_min, t_max, np.inf)
+
+    edges    = np.append(bins, bins[-1] + bin_width)
+    expected = sensors.groupby('sensor_id').apply(weighted_histogram, edges)
+    assert binned.index.equals(expected.index)
+    for actual, wf in zip(binned, expected):
+        assert actual.dtype == wf.dtype
+        assert np.all(actual == wf)
+
+
+def test_pad_safe():
+    sensors = np.arange(12).reshape(3, 4)
+    padded  = pad_safe(sensors, (2, 3))
+    assert padded.shape == (3, 9)
+    assert np.all(padded[:,  :2] == 0)
+    assert np.all(padded[:, -3:] == 0)
+    assert np.all(padded[:, 2:6] == sensors)
+
+
 @mark.parametrize("signal_thresh", (2, 10))
 def test_find_signal_start(binned_waveforms, signal_thresh):
 
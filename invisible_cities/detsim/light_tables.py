@@ -1,8 +1,13 @@
+import os
+import shutil
+import hashlib
+import tempfile
 import numpy  as np
 import pandas as pd
 import warnings
 from typing import Callable
 from typing import Optional
+from typing import Dict
 
 from functools import partial
 from .. core                import system_of_units as units
@@ -57,6 +62,57 @@ def read_lighttable(fname      : str,
     return lt_df, config_df, el_gap, active_r
 
 
+LIGHTTABLE_CACHE_VERSION = 1
+
+
+def lighttable_cache(build     : Callable[[], Dict[str, np.ndarray]],
+                     fname     : str,
+                     cache_dir : Optional[str],
+                     **params)->Dict[str, np.ndarray]:
+    """Returns the arrays produced by `build`, storing them in a cache.
+    The cache is a directory of .npy files in `cache_dir`, named after
+    the light table file, a hash of its contents, `params` and the
+    cache version. Once written, the arrays are memory-mapped read-only,
+    so that the processes reading the same table share its pages.
+    Parameters:
+        :build: Callable
+            function without arguments returning a dictionary of arrays
+            from the light table
+        :fname: str
+            lighttable filename (full path)
+        :cache_dir: str or None
+            directory where the cache is stored. If None, `build` is
+            called and no cache is used
+        :params:
+            parameters that change the output of `build`
+    Returns: dict
+        the arrays returned by `build`, memory-mapped if `cache_dir` is
+        not None
+    """
+    if cache_dir is None:
+        return build()
+
+    sha = hashlib.sha256()
+    sha.update(f"{LIGHTTABLE_CACHE_VERSION} {sorted(params.items())}".encode())
+    with open(fname, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 24), b""):
+            sha.update(chunk)
+    path = os.path.join(cache_dir, f"{os.path.basename(fname)}.{sha.hexdigest()[:16]}")
+
+    if not os.path.isdir(path):
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp = tempfile.mkdtemp(dir=cache_dir)
+        for name, array in build().items():
+            np.save(os.path.join(tmp, name), array)
+        try:
+            os.rename(tmp, path)
+        except OSError: # written by another process in the meantime
+            shutil.rmtree(tmp)
+
+    return {name[:-len(".npy")]: np.load(os.path.join(path, name), mmap_mode="r")
+            for name in os.listdir(path)}
+
+
 def create_lighttable_function(filename : str,
                                active_r : Optional[float]=None)->Callable:
     """From a lighttable file, it returns a function of (x, y) for S2 signal
@@ -82,13 +138,15 @@ def create_lighttable_function(filename : str,
             zs = np.full(len(xs), zs)
         if not (len(xs) == len(ys) == len(zs)):
             raise Exception("input arrays must be of same shape")
-        sel = (np.sqrt(xs**2 + ys**2) <= act_r) & (zbins[0]<=zs) & (zs<=zbins[-1]) #inside bins
-        xindices = pd.cut(xs[sel], xbins, include_lowest=True, labels=xcenters)
-        yindices = pd.cut(ys[sel], ybins, include_lowest=True, labels=ycenters)
-        zindices = pd.cut(zs[sel], zbins, include_lowest=True, labels=zcenters)
-        indices  = pd.Index(zip(xindices, yindices, zindices), name=("x", "y", "z"))
+        sel = ((np.sqrt(xs**2 + ys**2) <= act_r)         &
+               (xbins[0]<=xs) & (xs<=xbins[-1])          &
+               (ybins[0]<=ys) & (ys<=ybins[-1])          &
+               (zbins[0]<=zs) & (zs<=zbins[-1])          ) #inside bins
+        xindices = bin_indices(xs[sel], xbins)
+        yindices = bin_indices(ys[sel], ybins)
+        zindices = bin_indices(zs[sel], zbins)
         values   = np.zeros((len(xs), nsensors))
-        values[sel] = lt.reindex(indices, fill_value=0)
+        values[sel] = lt_grid[xindices, yindices, zindices]
         return values
 
     if lt.get("z") is None:
@@ -112,5 +170,21 @@ def create_lighttable_function(filename : str,
     ybins = binedges_from_bincenters(ycenters, range=range_y)
     zbins = binedges_from_bincenters(zcenters)
 
+    # Dense (x, y, z, sensor) grid. Points missing in the table are zero.
+    lt_grid = np.zeros((len(xcenters), len(ycenters), len(zcenters), nsensors))
+    lt_grid[np.searchsorted(xcenters, lt.index.get_level_values('x')),
+            np.searchsorted(ycenters, lt.index.get_level_values('y')),
+            np.searchsorted(zcenters, lt.index.get_level_values('z'))] = lt.values
+
     if had_z: return get_lt_values
     else    : return partial(get_lt_values, zs=np.array([1]))
+
+
+def bin_indices(values : np.ndarray, binedges : np.ndarray)->np.ndarray:
+    """
+    Index of the bin each value falls in. Bins are closed on the
+    right and the first one is also closed on the left, as in
+    `pd.cut(..., include_lowest=True)`. Values must be within the
+    bin edges.
+    """
+    return np.clip(np.searchsorted(binedges, values, side="left") - 1, 0, len(binedges) - 2)
@@ -4,5 +4,5 @@ cdef class LightTable:
         double active_radius
         int    num_sensors
     cdef:
-        double [:] zbins_
+        const double [:] zbins_
     cdef double* get_values_(self, const double x, const double y, const int sensor_id)
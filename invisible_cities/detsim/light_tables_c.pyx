@@ -30,7 +30,8 @@ from libc.math cimport round as cround
 
 
 from ..         core import system_of_units as   units
-from  . light_tables import read_lighttable as read_lt
+from  . light_tables import read_lighttable  as read_lt
+from  . light_tables import lighttable_cache
 
 cdef class LightTable:
     """
@@ -41,6 +42,26 @@ cdef class LightTable:
     cdef double* get_values_(self, const double x, const double y, const int sensor_id):
         raise NotImplementedError
 
+    def xy_grid(self):
+        """
+        Returns the origin and pitch (x0, y0, dx, dy) of the xy cells
+        over which the light table values are constant or vary slowly
+        """
+        raise NotImplementedError
+
+    def sensors_in_reach(self, xs, ys, margin):
+        """
+        Returns, in CSR format (offsets, sensor_ids), the sensors that
+        may have non-zero values for a position within `margin` of each
+        (x, y) point. The sensors of point i are
+        sensor_ids[offsets[i]:offsets[i+1]].
+        By default all sensors are considered in reach.
+        """
+        npoints = len(xs)
+        offsets = np.arange(npoints + 1) * self.num_sensors
+        sensors = np.tile(np.arange(self.num_sensors), npoints)
+        return offsets, sensors
+
     @property
     def zbins(self):
         """ Array of z positions """
@@ -92,6 +113,11 @@ cdef class LT_SiPM(LightTable):
               optionally set new EL gap width
         active_radius : float
               optionally set new active radius
+        data_mc_ratio : float
+              scale factor applied to the light table values
+        cache_dir     : string
+              optional directory where the processed table is cached
+              (see light_tables.lighttable_cache)
 
     """
 
@@ -99,7 +125,7 @@ cdef class LT_SiPM(LightTable):
         double [:] snsx
         double [:] snsy
     cdef:
-        double [:, ::1] values
+        const double [:, ::1] values
         double psf_bin
         double max_zel
         double max_psf
@@ -107,25 +133,41 @@ cdef class LT_SiPM(LightTable):
         double inv_bin
         double active_r2
 
-    def __init__(self, *, fname, sipm_database, el_gap_width=None, active_radius=None, data_mc_ratio=1):
+    def __init__(self, *, fname, sipm_database, el_gap_width=None, active_radius=None, data_mc_ratio=1, cache_dir=None):
         if data_mc_ratio <= 0: raise ValueError("LT_SiPM: data_mc_ratio must be greater than 0")
 
-        lt_df, config_df, el_gap, active_r = read_lt(fname, 'PSF', el_gap_width, active_radius)
-        lt_df.set_index('dist_xy', inplace=True)
+        def build():
+            lt_df, config_df, el_gap, active_r = read_lt(fname, 'PSF', el_gap_width, active_radius)
+            lt_df.set_index('dist_xy', inplace=True)
+            el_pitch = float(config_df.loc["pitch_z"].value) * units.mm
+            zbins    = get_el_bins(el_pitch, el_gap)
+            return dict(el_gap   = np.double(el_gap),
+                        active_r = np.double(active_r),
+                        zbins    = zbins,
+                        values   = np.array(lt_df.values/len(zbins) * data_mc_ratio, order='C', dtype=np.double),
+                        psf_bin  = np.double(lt_df.index[1]-lt_df.index[0]) * units.mm, #index of psf is the distance to the sensor in mm
+                        max_psf  = np.double(max(lt_df.index.values)))
+
+        table = lighttable_cache(build, fname, cache_dir,
+                                 kind          = "LT_SiPM",
+                                 el_gap_width  = el_gap_width,
+                                 active_radius = active_radius,
+                                 data_mc_ratio = data_mc_ratio)
+        el_gap   = float(table["el_gap"  ])
+        active_r = float(table["active_r"])
         self.el_gap_width  = el_gap
         self.active_radius = active_r
         self.active_r2 = active_r**2 # compute this once to speed up the get_values_ calls
 
-        el_pitch  = float(config_df.loc["pitch_z"].value) * units.mm
-        self.zbins_    = get_el_bins(el_pitch, el_gap)
-        self.values    = np.array(lt_df.values/len(self.zbins_) * data_mc_ratio, order='C', dtype=np.double)
-        self.psf_bin   = float(lt_df.index[1]-lt_df.index[0]) * units.mm #index of psf is the distance to the sensor in mm
+        self.zbins_    = table["zbins"]
+        self.values    = table["values"]
+        self.psf_bin   = float(table["psf_bin"])
         self.inv_bin   = 1./self.psf_bin # compute this once to speed up the get_values_ calls
 
         self.snsx        = sipm_database.X.values.astype(np.double)
         self.snsy        = sipm_database.Y.values.astype(np.double)
         self.max_zel     = el_gap
-        self.max_psf     = max(lt_df.index.values)
+        self.max_psf     = float(table["max_psf"])
         self.max_psf2    = self.max_psf**2
         self.num_sensors = len(sipm_database)
 
@@ -152,9 +194,30 @@ cdef class LT_SiPM(LightTable):
             return NULL
         aux = sqrt(dist)*self.inv_bin
         bin_id = <int> floor(aux)
-        values = &self.values[bin_id, 0]
+        values = <double*> &self.values[bin_id, 0]
         return values
 
+    def xy_grid(self):
+        """
+        The values depend on the distance to the sensors, binned with
+        the psf bin size: a grid with the same pitch is used
+        """
+        return 0., 0., self.psf_bin, self.psf_bin
+
+    def sensors_in_reach(self, xs, ys, margin):
+        """
+        Returns, in CSR format (offsets, sensor_ids), the sensors within
+        the psf distance (plus `margin`) of each (x, y) point.
+        """
+        from scipy.spatial import cKDTree
+        tree    = cKDTree(np.stack([self.snsx, self.snsy], axis=1))
+        points  = np.stack([np.asarray(xs, dtype=np.double), np.asarray(ys, dtype=np.double)], axis=1)
+        reach   = tree.query_ball_point(points, r=self.max_psf + margin, return_sorted=True)
+        lengths = np.fromiter(map(len, reach), dtype=np.int64, count=len(reach))
+        offsets = np.concatenate([[0], np.cumsum(lengths)])
+        sensors = np.fromiter((s for r in reach for s in r), dtype=np.int64, count=offsets[-1])
+        return offsets, sensors
+
     def get_values(self, const double x, const double y, const int sns_id):
         """
         Retrive values from the light tables for all z partitions.
@@ -174,6 +237,29 @@ cdef class LT_SiPM(LightTable):
         return super().get_values(x, y, sns_id)
 
 
+def extend_lt_bounds(lt_df, columns, bin_x, bin_y, active_radius):
+    """
+    Extend light tables values up to a full active_radius volume, using nearest interpolation method.
+    The resulting tensor has shape of num_bins_x, num_bins_y.
+    """
+    from scipy.interpolate import griddata
+    xtable   = lt_df.x.values
+    ytable   = lt_df.y.values
+    xmin_, xmax_ = xtable.min(), xtable.max()
+    ymin_, ymax_ = ytable.min(), ytable.max()
+    # extend min, max to go one bin-width over the active volume
+    xmin, xmax = xmin_-np.ceil((active_radius-np.abs(xmin_))/bin_x)*bin_x, xmax_+np.ceil((active_radius-np.abs(xmax_))/bin_x)*bin_x
+    ymin, ymax = ymin_-np.ceil((active_radius-np.abs(ymin_))/bin_y)*bin_y, ymax_+np.ceil((active_radius-np.abs(ymax_))/bin_y)*bin_y
+    #create new centers that extend over full active volume
+    x          = np.arange(xmin, xmax+bin_x/2., bin_x).astype(np.double)
+    y          = np.arange(ymin, ymax+bin_y/2., bin_y).astype(np.double)
+    #interpolate missing values using nearest method from scipy
+    xx, yy     = np.meshgrid(x, y)
+    values_aux = (np.concatenate([griddata((xtable, ytable), lt_df[column], (yy, xx), method='nearest')[..., None]
+                                  for column in columns],axis=-1)[..., None]).astype(np.double)
+    return values_aux, (xmin, xmax), (ymin, ymax)
+
+
 cdef class LT_PMT(LightTable):
     """
     A class to handle reading of PMTs light table. Inherits from base class LightTable
@@ -195,11 +281,16 @@ cdef class LT_PMT(LightTable):
               optionally set new EL gap width
         active_radius : float
               optionally set new active radius
+        data_mc_ratio : float
+              scale factor applied to the light table values
+        cache_dir     : string
+              optional directory where the processed table is cached
+              (see light_tables.lighttable_cache)
 
     """
 
     cdef:
-        double [:, :, :, ::1] values
+        const double [:, :, :, ::1] values
         double max_zel
         double max_psf
         double max_psf2
@@ -209,54 +300,51 @@ cdef class LT_PMT(LightTable):
         double ymin
         double active_r2
 
-    def __init__(self, *, fname, el_gap_width=None, active_radius=None, data_mc_ratio=1):
+    def __init__(self, *, fname, el_gap_width=None, active_radius=None, data_mc_ratio=1, cache_dir=None):
         if data_mc_ratio <= 0: raise ValueError("LT_PMT: data_mc_ratio must be greater than 0")
 
-        lt_df, config_df, el_gap, active_r = read_lt(fname, 'LT', el_gap_width, active_radius)
-        self.el_gap_width  = el_gap
+        def build():
+            lt_df, config_df, el_gap, active_r = read_lt(fname, 'LT', el_gap_width, active_radius)
+
+            sensor = config_df.loc["sensor"].value
+            #remove column total from the list of columns
+            columns = [col for col in lt_df.columns if ((sensor in col) and ("total" not in col))]
+            el_pitch    = el_gap #hardcoded for this specific table
+            bin_x = float(config_df.loc["pitch_x"].value) * units.mm
+            bin_y = float(config_df.loc["pitch_y"].value) * units.mm
+
+            zbins = get_el_bins(el_pitch, el_gap)
+            values_aux, (xmin, xmax), (ymin, ymax)  = extend_lt_bounds(lt_df, columns, bin_x, bin_y, active_r)
+            lenz = len(zbins)
+            # add dimension for z partitions (1 in case of this table)
+            values = np.asarray(np.repeat(values_aux, lenz, axis=-1) * data_mc_ratio, dtype=np.double, order='C')
+            return dict(el_gap   = np.double(el_gap),
+                        active_r = np.double(active_r),
+                        zbins    = zbins,
+                        values   = values,
+                        xmin     = np.double(xmin),
+                        ymin     = np.double(ymin),
+                        bin_x    = np.double(bin_x),
+                        bin_y    = np.double(bin_y))
+
+        table = lighttable_cache(build, fname, cache_dir,
+                                 kind          = "LT_PMT",
+                                 el_gap_width  = el_gap_width,
+                                 active_radius = active_radius,
+                                 data_mc_ratio = data_mc_ratio)
+        active_r = float(table["active_r"])
+        self.el_gap_width  = float(table["el_gap"])
         self.active_radius = active_r
         self.active_r2 = active_r**2 # compute this once to speed up the get_values_ calls
 
-        sensor = config_df.loc["sensor"].value
-        #remove column total from the list of columns
-        columns = [col for col in lt_df.columns if ((sensor in col) and ("total" not in col))]
-        el_pitch    = el_gap #hardcoded for this specific table
-        bin_x = float(config_df.loc["pitch_x"].value) * units.mm
-        bin_y = float(config_df.loc["pitch_y"].value) * units.mm
-
-        self.zbins_ = get_el_bins(el_pitch, el_gap)
-        values_aux, (xmin, xmax), (ymin, ymax)  = self.__extend_lt_bounds(lt_df, config_df, columns, bin_x, bin_y)
-        lenz = len(self.zbins)
-        # add dimension for z partitions (1 in case of this table)
-        self.values = np.asarray(np.repeat(values_aux, lenz, axis=-1) * data_mc_ratio, dtype=np.double, order='C')
-        self.xmin = xmin
-        self.ymin = ymin
+        self.zbins_ = table["zbins"]
+        self.values = table["values"]
+        self.xmin   = float(table["xmin"])
+        self.ymin   = float(table["ymin"])
         # calculate inverse to speed up calls of get_values_
-        self.inv_binx    = 1./bin_x
-        self.inv_biny    = 1./bin_y
-        self.num_sensors = len(columns)
-
-    def __extend_lt_bounds(self, lt_df, config_df, columns, bin_x, bin_y):
-        """
-        Extend light tables values up to a full active_radius volume, using nearest interpolation method.
-        The resulting tensor has shape of num_bins_x, num_bins_y.
-        """
-        from scipy.interpolate import griddata
-        xtable   = lt_df.x.values
-        ytable   = lt_df.y.values
-        xmin_, xmax_ = xtable.min(), xtable.max()
-        ymin_, ymax_ = ytable.min(), ytable.max()
-        # extend min, max to go one bin-width over the active volume
-        xmin, xmax = xmin_-np.ceil((self.active_radius-np.abs(xmin_))/bin_x)*bin_x, xmax_+np.ceil((self.active_radius-np.abs(xmax_))/bin_x)*bin_x
-        ymin, ymax = ymin_-np.ceil((self.active_radius-np.abs(ymin_))/bin_y)*bin_y, ymax_+np.ceil((self.active_radius-np.abs(ymax_))/bin_y)*bin_y
-        #create new centers that extend over full active volume
-        x          = np.arange(xmin, xmax+bin_x/2., bin_x).astype(np.double)
-        y          = np.arange(ymin, ymax+bin_y/2., bin_y).astype(np.double)
-        #interpolate missing values using nearest method from scipy
-        xx, yy     = np.meshgrid(x, y)
-        values_aux = (np.concatenate([griddata((xtable, ytable), lt_df[column], (yy, xx), method='nearest')[..., None]
-                                      for column in columns],axis=-1)[..., None]).astype(np.double)
-        return values_aux, (xmin, xmax), (ymin, ymax)
+        self.inv_binx    = 1./float(table["bin_x"])
+        self.inv_biny    = 1./float(table["bin_y"])
+        self.num_sensors = self.values.shape[2]
 
     @cython.wraparound(False)
     cdef double* get_values_(self, const double x, const double y, const int sns_id):
@@ -269,9 +357,15 @@ cdef class LT_PMT(LightTable):
             return NULL
         xindx = <int> cround((x-self.xmin)*self.inv_binx)
         yindx = <int> cround((y-self.ymin)*self.inv_biny)
-        values = &self.values[xindx, yindx, sns_id, 0]
+        values = <double*> &self.values[xindx, yindx, sns_id, 0]
         return values
 
+    def xy_grid(self):
+        """
+        The values are taken from the nearest bin of the table
+        """
+        return self.xmin, self.ymin, 1./self.inv_binx, 1./self.inv_biny
+
     def get_values(self, const double x, const double y, const int sns_id):
         """
         Retrive values from the light tables for all z partitions.
@@ -127,3 +127,16 @@ def test_light_tables_pmt_equal(get_dfs, xs, ys):
     vals_lt_c = np.concatenate([lt_c.get_values(xs,ys, pmtid)for pmtid in pmts_ids]).flatten()
     vals_lt   = s2_lt(np.array([xs]), np.array([ys])).flatten()
     np.testing.assert_allclose(vals_lt_c, vals_lt)
+
+
+@few_examples
+@given(xs=floats(min_value=-500, max_value=500),
+       ys=floats(min_value=-500, max_value=500))
+def test_LT_SiPM_sensors_in_reach(get_dfs, xs, ys):
+    datasipm = DataSiPM('new')
+    fname, psf_df, psf_conf = get_dfs['psf']
+    lt = LT_SiPM(fname=fname, sipm_database=datasipm)
+    offsets, sensors = lt.sensors_in_reach(np.array([xs]), np.array([ys]), 0)
+    assert offsets[0] == 0 and offsets[-1] == len(sensors)
+    with_values = [i for i in range(lt.num_sensors) if np.any(lt.get_values(xs, ys, i))]
+    assert set(with_values) <= set(sensors)
@@ -1,16 +1,20 @@
 import os
-import numpy as np
+import numpy  as np
+import pandas as pd
 
 from .. core.core_functions import find_nearest
 
 from .. io.dst_io  import load_dst
 
 from .light_tables import create_lighttable_function
+from .light_tables import bin_indices
+from .light_tables import lighttable_cache
 
 from pytest import fixture
 
 from hypothesis import given, settings
 from hypothesis.strategies  import floats
+from hypothesis.strategies  import lists
 
 
 few_examples = settings(deadline=None, max_examples=100)
@@ -79,3 +83,47 @@ def test_get_lt_values_s2(lighttable_filenames, xs, ys):
         expected = np.zeros((1, 12))
 
     np.testing.assert_allclose(S2_LT(np.array([xs]), np.array([ys])), expected)
+
+
+@few_examples
+@given(values=lists(floats(min_value=-10, max_value=10), min_size=1))
+def test_bin_indices_same_as_pd_cut(values):
+    centers  = np.array([-9, -6, -5, 0, 1, 3, 8.5])
+    binedges = np.array([-10, -7.5, -5.5, -2.5, 0.5, 2, 5.75, 10])
+    values   = np.concatenate([values, binedges])
+    expected = pd.cut(values, binedges, include_lowest=True, labels=np.arange(len(centers)))
+    assert np.array_equal(bin_indices(values, binedges), expected.astype(int))
+
+
+def test_lighttable_cache_builds_once(tmpdir):
+    fname = os.path.join(tmpdir, "table.h5")
+    with open(fname, "wb") as file:
+        file.write(b"some light table")
+    cache_dir = os.path.join(tmpdir, "cache")
+
+    calls = []
+    def build():
+        calls.append(None)
+        return dict(values = np.arange(12.).reshape(3, 4),
+                    bin    = np.double(2.5))
+
+    for _ in range(3):
+        table = lighttable_cache(build, fname, cache_dir, factor=1)
+        assert len(calls) == 1
+        assert np.array_equal(table["values"], np.arange(12.).reshape(3, 4))
+        assert float(table["bin"]) == 2.5
+        assert not table["values"].flags.writeable
+
+    lighttable_cache(build, fname, cache_dir, factor=2)
+    assert len(calls) == 2
+
+    with open(fname, "ab") as file:
+        file.write(b" modified")
+    lighttable_cache(build, fname, cache_dir, factor=1)
+    assert len(calls) == 3
+
+
+def test_lighttable_cache_without_cache_dir():
+    build = lambda: dict(values=np.ones(3))
+    table = lighttable_cache(build, "not_a_file.h5", None, factor=1)
+    assert np.array_equal(table["values"], np.ones(3))
@@ -25,6 +25,9 @@ cdef double[:] spread_histogram(const double[:] histogram, int nsmear_left, int
     return spreaded[:l]
 
 
+EXACT_CELL_FACTOR = 8
+
+
 def create_wfs(double [:] xs           ,
                double [:] ys           ,
                double [:] ts           ,
@@ -33,11 +36,18 @@ def create_wfs(double [:] xs           ,
                double     el_dv        ,
                double     sns_time_bin ,
                double     buffer_length,
-               double     tmin = 0    ):
+               double     tmin = 0     ,
+               bint group_electrons = False):
     """
     Simulates s2 waveforms given position and time of the electron at EL plane,
     light table and approperiate sensor attributes.
 
+    Electrons are binned in the xy cells of the light table (see
+    LightTable.xy_grid) and only the sensors within reach of each cell
+    are visited. With `group_electrons`, the electrons in the same cell
+    whose light falls in the same time bins are merged into the first
+    of them, adding up their photons.
+
     Parameters:
     -----------
     xs, ys, ts    : numpy arrays of c doubles
@@ -53,6 +63,11 @@ def create_wfs(double [:] xs           ,
             length of the waveform in time
     tmin          : c double
             time of first waveform bin
+    group_electrons : bool
+            whether to merge the electrons of the same xy cell and
+            time bins. The result is exact if the light table values
+            are constant within each cell (e.g. LT_PMT) and an
+            approximation otherwise (e.g. LT_SiPM)
 
     Returns:
     --------
@@ -77,18 +92,34 @@ def create_wfs(double [:] xs           ,
     # sensor time bin size
     cdef double [:] el_times = np.arange(time_bs_sns/2.,max_time_sns,time_bs_sns).astype(np.double)
 
+    xs_, ys_, ts_, phs_, cells, offsets, sensors = electrons_by_cell(xs, ys, ts, phs, lt, el_times,
+                                                                     sns_time_bin, tmin, group_electrons)
+    cdef:
+        double   [:] xs_c      = xs_
+        double   [:] ys_c      = ys_
+        double   [:] ts_c      = ts_
+        double   [:] phs_c     = phs_
+        np.int64_t [:] cells_c   = cells
+        np.int64_t [:] offsets_c = offsets
+        np.int64_t [:] sensors_c = sensors
+
     cdef:
-        int snsindx, sns_id, ph_p
+        int snsindx, tindx
+        Py_ssize_t pindx, elindx, j, cell
         double[::1] lt_factors   = np.empty_like(el_times, dtype=np.double)
         double *    lt_factors_p = &lt_factors[0]
-        double time, t_p, x_p, y_p, signal
+        # phs is an array of integers, so ph_p holds whole photon counts,
+        # also for grouped electrons, whose counts are summed exactly
+        double time, t_p, x_p, y_p, ph_p, signal
 
-    for pindx in range(ts.shape[0]):
-        x_p  = xs[pindx]
-        y_p  = ys[pindx]
-        ph_p = phs[pindx]
-        t_p  = (ts[pindx]-tmin)/sns_time_bin #division with sensor bin size faster if done outside inner loop
-        for snsindx in range(nsens):
+    for pindx in range(ts_c.shape[0]):
+        x_p  = xs_c [pindx]
+        y_p  = ys_c [pindx]
+        ph_p = phs_c[pindx]
+        cell = cells_c[pindx]
+        t_p  = (ts_c[pindx]-tmin)/sns_time_bin #division with sensor bin size faster if done outside inner loop
+        for j in range(offsets_c[cell], offsets_c[cell + 1]):
+            snsindx      = sensors_c[j]
             lt_factors_p = lt.get_values_(x_p, y_p, snsindx)
             if lt_factors_p != NULL:
                 for elindx in range(el_times.shape[0]):
@@ -110,3 +141,63 @@ def create_wfs(double [:] xs           ,
             wfs[snsindx] = spread_histogram(wfs[snsindx], nsmear_l, nsmear_r)
 
     return np.asarray(wfs)
+
+
+def electrons_by_cell(xs, ys, ts, phs, LT lt, el_times, double sns_time_bin, double tmin, bint group_electrons):
+    """
+    Assigns the electrons inside the active volume to the xy cells of
+    the light table and finds the sensors within reach of each cell.
+    If `group_electrons` is set, the electrons of the same cell are
+    merged when all of their EL partitions fall in the same time bins.
+
+    Returns the positions, times, photons and cell index of the
+    (possibly merged) electrons and the sensors of each cell in CSR
+    format (offsets, sensors).
+    """
+    xs  = np.asarray(xs , dtype=np.double)
+    ys  = np.asarray(ys , dtype=np.double)
+    ts  = np.asarray(ts , dtype=np.double)
+    phs = np.asarray(phs, dtype=np.double)
+
+    # electrons outside the active volume produce no light in any sensor
+    inside = xs**2 + ys**2 < lt.active_radius**2
+    xs, ys, ts, phs = xs[inside], ys[inside], ts[inside], phs[inside]
+
+    x0, y0, dx, dy = lt.xy_grid()
+    if not group_electrons:
+        # cells are only used to find the sensors in reach: coarser
+        # cells mean fewer searches at the cost of a larger margin
+        dx, dy = EXACT_CELL_FACTOR * dx, EXACT_CELL_FACTOR * dy
+    ix = np.floor((xs - x0) / dx + 0.5).astype(np.int64)
+    iy = np.floor((ys - y0) / dy + 0.5).astype(np.int64)
+    iy_min, iy_max  = (iy.min(), iy.max()) if len(iy) else (0, 0)
+    cell_ids, cells = np.unique(ix * (iy_max - iy_min + 1) + iy - iy_min, return_inverse=True)
+    cells   = cells.ravel()
+    member  = np.zeros(len(cell_ids), dtype=np.int64)
+    member[cells] = np.arange(len(cells)) # any electron of each cell
+    centers = x0 + ix[member] * dx, y0 + iy[member] * dy
+
+    if group_electrons:
+        # The EL partition k of an electron at time t (in sensor bins)
+        # falls in bin floor(t) + floor(el_times[k]) + (frac(t) >= 1 - frac(el_times[k])),
+        # so electrons with the same floor(t) and the same number of
+        # thresholds below frac(t) fill the same bins.
+        el_times    = np.asarray(el_times)
+        thresholds  = np.sort(1 - (el_times - np.floor(el_times)))
+        t_sns       = (ts - tmin) / sns_time_bin
+        t_bin       = np.floor(t_sns)
+        t_class     = np.searchsorted(thresholds, t_sns - t_bin, side="right")
+        t_bin       = t_bin.astype(np.int64) - t_bin.min(initial=0)
+        nclasses    = len(thresholds) + 1
+        keys        = (cells * (t_bin.max(initial=0) + 1) + t_bin) * nclasses + t_class
+        _, index, group = np.unique(keys, return_index=True, return_inverse=True)
+        group       = group.ravel()
+        cells       = cells[index]
+        xs, ys, ts  = xs[index], ys[index], ts[index]
+        phs         = np.bincount(group, weights=phs, minlength=len(index)).astype(np.double)
+
+    offsets, sensors = lt.sensors_in_reach(*centers, np.hypot(dx, dy) / 2)
+    return (xs, ys, ts, phs,
+            np.asarray(cells  , dtype=np.int64),
+            np.asarray(offsets, dtype=np.int64),
+            np.asarray(sensors, dtype=np.int64))
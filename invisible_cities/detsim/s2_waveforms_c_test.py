@@ -14,6 +14,8 @@ from hypothesis.strategies     import floats
 from hypothesis.strategies     import integers
 from hypothesis.extra.numpy    import arrays
 
+from pytest import raises
+
 
 few_examples = settings(deadline=None, max_examples=100)
 
@@ -154,3 +156,56 @@ def test_time_distribution_sipms(get_dfs, xs, ys, ts, ps):
         signal = lt.get_values(xs, ys, i)*ps
         expected, _ = np.histogram(z_bins_time, bins=time_bins, weights=signal)
         np.testing.assert_allclose(waveform[i], expected)
+
+
+@few_examples
+@given(xs=arrays(   float, 50, elements = floats  (min_value = -200*mm , max_value = 200*mm )),
+       ys=arrays(   float, 50, elements = floats  (min_value = -200*mm , max_value = 200*mm )),
+       ts=arrays(   float, 50, elements = floats  (min_value =    2*mus, max_value =  20*mus)),
+       ps=arrays(np.int32, 50, elements = integers(min_value =    10   , max_value = 100    )))
+def test_create_wfs_group_electrons_pmts(get_dfs, xs, ys, ts, ps):
+    # the PMT light table is constant over its cells, so grouping
+    # the electrons does not change the waveforms
+    fname, lt_df, lt_conf = get_dfs['lt']
+    lt = LT_PMT(fname=fname)
+    el_drift_velocity = 2.5 * mm/mus
+    sensor_time_bin   = 100 * ns
+    buffer_length     = 50  * mus
+    xs[1::2], ys[1::2] = xs[::2], ys[::2] # force some electrons to share cells
+    waveform = create_wfs(xs, ys, ts, ps, lt, el_drift_velocity, sensor_time_bin, buffer_length)
+    grouped  = create_wfs(xs, ys, ts, ps, lt, el_drift_velocity, sensor_time_bin, buffer_length, group_electrons=True)
+    np.testing.assert_allclose(grouped, waveform)
+
+
+@few_examples
+@given(x0=floats  (min_value = -50*mm , max_value = 50*mm ),
+       y0=floats  (min_value = -50*mm , max_value = 50*mm ),
+       ts=arrays(   float, 10, elements = floats  (min_value =   2*mus, max_value = 20*mus)),
+       ps=arrays(np.int32, 20, elements = integers(min_value =   10   , max_value = 100   )))
+def test_create_wfs_group_electrons_sipms(get_dfs, x0, y0, ts, ps):
+    datasipm = DataSiPM('new')
+    fname, psf_df, psf_conf = get_dfs['psf']
+    el_drift_velocity = 2.5 * mm/mus
+    sensor_time_bin   = 1   * mus
+    buffer_length     = 50  * mus
+    lt = LT_SiPM(fname=fname, sipm_database=datasipm)
+    # pairs of electrons at the same position and time, far apart
+    # from the other pairs: only the pairs are grouped
+    xs = np.tile(x0 + np.arange(10) * 20 * mm, 2)
+    ys = np.full(20, y0)
+    ts = np.tile(ts, 2)
+    waveform = create_wfs(xs, ys, ts, ps, lt, el_drift_velocity, sensor_time_bin, buffer_length)
+    grouped  = create_wfs(xs, ys, ts, ps, lt, el_drift_velocity, sensor_time_bin, buffer_length, group_electrons=True)
+    np.testing.assert_allclose(grouped, waveform)
+
+
+def test_create_wfs_raises_with_non_integer_photons(get_dfs):
+    # photon counts are not truncated inside create_wfs: they must be
+    # integers from the start
+    fname, lt_df, lt_conf = get_dfs['lt']
+    lt = LT_PMT(fname=fname)
+    xs = ys = np.zeros(2)
+    ts = np.full(2, 2 * mus)
+    ps = np.array([10.5, 20.7])
+    with raises(ValueError):
+        create_wfs(xs, ys, ts, ps, lt, 2.5 * mm/mus, 100 * ns, 50 * mus)
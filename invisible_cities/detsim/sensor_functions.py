@@ -4,6 +4,8 @@ JJGC January 2017
 import numpy  as np
 import pandas as pd
 
+from scipy import signal
+
 from .. sierpe            import fee as FE
 from .. sierpe            import low_frequency_noise as lfn
 from .. reco              import wfm_functions as wfm
@@ -31,12 +33,16 @@ def charge_fluctuation(signal, single_pe_rms):
     return sig_fl
 
 
-def simulate_pmt_response(event, pmtrd, adc_to_pes, pe_resolution, detector_db='new', run_number = 0):
-    """ Full simulation of the energy plane response
+def pmt_response_simulator(adc_to_pes, pe_resolution, detector_db='new', run_number=0):
+    """ Full simulation of the energy plane response.
+    The electronics (single pe pulse, FEE filters) are set up once
+    and all PMTs are processed together.
     Input:
-     1) extensible array pmtrd
-     2) event_number
+     1) calibration constants of each PMT
+     2) single pe resolution of each PMT
     returns:
+    a function that takes the MC waveforms (pmtrd) of one event,
+    with shape (n_pmt, n_samples), and returns
     array of raw waveforms (RWF) obtained by convoluting pmtrd with the PMT
     front end electronics (LPF, HPF filters)
     array of BLR waveforms (only decimation)
@@ -46,35 +52,70 @@ def simulate_pmt_response(event, pmtrd, adc_to_pes, pe_resolution, detector_db='
     # FEE, with noise PMT
     fee  = FE.FEE(detector_db, run_number,
                   noise_FEEPMB_rms=FE.NOISE_I, noise_DAQ_rms=FE.NOISE_DAQ)
-    # Low frequency noise
-    buffer_length = int(FE.f_sample * pmtrd.shape[2] / FE.f_mc)
-    lowFreq = lfn.low_frequency_noise(detector_db, run_number, buffer_length)
-
-    NPMT = pmtrd.shape[1]
-    RWF  = []
-    BLRX = []
-    for pmt in range(NPMT):
-        # normalize calibration constants from DB to MC value
-        cc = adc_to_pes[pmt] / FE.ADC_TO_PES
+
+    # normalize calibration constants from DB to MC value
+    cc            = np.asarray(adc_to_pes, dtype=float)[:, np.newaxis] / FE.ADC_TO_PES
+    pe_resolution = np.asarray(pe_resolution, dtype=float)
+    filters_fee   = [FE.filter_fee(fee, pmt) for pmt in range(len(cc))]
+    b_lpf, a_lpf  = FE.filter_sfee_lpf(fee)
+    noise_daq     = fee.DAQnoise_rms * FE.v_to_adc()
+    nspe          = len(spe.spe)
+
+    def simulate_pmt_response(pmtrd):
+        npmt, nsamples = pmtrd.shape
+        # Low frequency noise
+        buffer_length = int(FE.f_sample * nsamples / FE.f_mc)
+        lowFreq = lfn.low_frequency_noise(detector_db, run_number, buffer_length)
+
         # signal_i in current units
         # fluctuating charge according to 1pe sigma from calibration.
-        pe_rms = pe_resolution[pmt]
-        signal_i = FE.spe_pulse_from_vector(spe,
-                                            charge_fluctuation(pmtrd[event, pmt], pe_rms),
-                                            norm=cc)
+        signal_fl = charge_fluctuation_per_sensor(pmtrd, pe_resolution[:npmt])
+        signal_i  = np.array([np.convolve(wf[:-nspe + 1], spe.spe) for wf in signal_fl]) * cc[:npmt]
         # Decimate (DAQ decimation)
         signal_d = FE.daq_decimator(FE.f_mc, FE.f_sample, signal_i)
-        # Effect of FEE and transform to adc counts
-        signal_fee = FE.signal_v_fee(fee, signal_d, pmt) * FE.v_to_adc()
+        # Effect of FEE (with FEE + PMT base noise at its input) and transform to adc counts
+        noise_fee  = np.random.normal(0, fee.noise_FEEPMB_rms, signal_d.shape)
+        signal_fee = np.array([signal.lfilter(b, a, wf)
+                               for (b, a), wf in zip(filters_fee, signal_d + noise_fee)]) * FE.v_to_adc()
         # add noise daq including the low frequency noise
-        signal_daq = FE.noise_adc(fee, signal_fee) - lowFreq(pmt)
+        signal_daq = signal_fee + np.random.normal(0, noise_daq, signal_fee.shape)
+        signal_daq = signal_daq - np.array([lowFreq(pmt) for pmt in range(npmt)])
         # signal blr is just pure MC decimated by adc in adc counts
-        signal_blr = FE.signal_v_lpf(fee, signal_d) * FE.v_to_adc()
+        signal_blr = signal.lfilter(b_lpf, a_lpf, signal_d, axis=1) * FE.v_to_adc()
         # raw waveform stored with negative sign and offset
-        RWF.append(FE.OFFSET - signal_daq)
         # blr waveform stored with positive sign and no offset
-        BLRX.append(signal_blr)
-    return np.array(RWF), np.array(BLRX)
+        return FE.OFFSET - signal_daq, signal_blr
+
+    return simulate_pmt_response
+
+
+def charge_fluctuation_per_sensor(signal, single_pe_rms):
+    """Same as `charge_fluctuation` for a 2D array with one
+    row per sensor, each with its own single pe rms."""
+    sig_fl     = signal.astype(float)
+    sigma      = np.asarray(single_pe_rms, dtype=float)
+    rows, cols = np.nonzero((sig_fl > 0) & (sigma[:, np.newaxis] > 0))
+    mean       = sig_fl[rows, cols]
+    ## This fluctuation can't give negative signal
+    sig_fl[rows, cols] = np.clip(np.random.normal(mean, np.sqrt(mean) * sigma[rows]), 0, None)
+    return sig_fl
+
+
+def simulate_pmt_response(event, pmtrd, adc_to_pes, pe_resolution, detector_db='new', run_number = 0):
+    """ Full simulation of the energy plane response
+    Input:
+     1) extensible array pmtrd
+     2) event_number
+    returns:
+    array of raw waveforms (RWF) obtained by convoluting pmtrd with the PMT
+    front end electronics (LPF, HPF filters)
+    array of BLR waveforms (only decimation)
+
+    To simulate many events, build the simulator once with
+    `pmt_response_simulator`.
+    """
+    simulate = pmt_response_simulator(adc_to_pes, pe_resolution, detector_db, run_number)
+    return simulate(pmtrd[event])
 
 
 def simulate_sipm_response(sipmrd, sipms_noise_sampler, sipm_adc_to_pes, pe_resolution):
@@ -10,6 +10,7 @@ from .. database             import load_db
 
 from .  sensor_functions import convert_channel_id_to_IC_id
 from .  sensor_functions import simulate_pmt_response
+from .  sensor_functions import charge_fluctuation_per_sensor
 from .. calib            import calib_sensors_functions as csf
 from .. reco             import wfm_functions as wfm
 
@@ -41,6 +42,23 @@ def test_cwf_blr(dbnew, electron_MCRD_file):
                                    window_size = 500)
         assert diff[0] < 1
 
+
+def test_charge_fluctuation_per_sensor():
+    signal        = np.zeros((3, 100))
+    signal[:, 40:60] = 1000
+    single_pe_rms = np.array([0, 0.1, 0.5])
+
+    fluctuated = charge_fluctuation_per_sensor(signal, single_pe_rms)
+
+    assert fluctuated.shape == signal.shape
+    assert np.all(fluctuated >= 0)
+    assert np.all(fluctuated[:, :40] == 0)
+    assert np.all(fluctuated[:, 60:] == 0)
+    assert np.all(fluctuated[0] == signal[0])
+    assert np.all(fluctuated[1:, 40:60] != signal[1:, 40:60])
+    assert np.std(fluctuated[1, 40:60]) < np.std(fluctuated[2, 40:60])
+
+
 @mark.slow
 def test_sipm_noise_sampler(dbnew, electron_MCRD_file):
     """This test checks that the number of SiPMs surviving a hard energy
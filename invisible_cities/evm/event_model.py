@@ -12,8 +12,11 @@ from .. core.core_functions import overflow_protection
 
 from typing import List
 from typing import Tuple
+from typing import Iterator
 from typing import NamedTuple
 
+from collections.abc import Mapping
+
 ZANODE = -9.425 * units.mm
 
 
@@ -316,6 +319,146 @@ class HitCollection(Event):
     __repr__ =     __str__
 
 
+class ColumnarHits:
+    """
+    Hits of many events stored column-wise in a structured array, with
+    the layout of the hits tables (e.g. RECO/Events). The hits of each
+    event (and time) are contiguous, between data[offsets[i]] and
+    data[offsets[i+1]], so the hits of an event are a view of the data.
+    HitCollection objects are only built on demand (see
+    hit_collection and hit_collections).
+    """
+    def __init__(self, data : np.ndarray, offsets : np.ndarray):
+        self.data    = data
+        self.offsets = offsets
+
+    @classmethod
+    def from_records(cls, records : np.ndarray) -> "ColumnarHits":
+        """
+        Groups the hits in a structured array by event and time. The
+        hits are only sorted (and copied) if they are not already
+        grouped in increasing event and time order.
+        """
+        event = records["event"]
+        time  = records["time"] if "time" in records.dtype.names else np.zeros(len(records))
+
+        devent = np.diff(event)
+        dtime  = np.diff(time)
+        if np.any((devent < 0) | ((devent == 0) & (dtime < 0))):
+            order   = np.lexsort((time, event))
+            records = records[order]
+            event   = event  [order]
+            time    = time   [order]
+            devent  = np.diff(event)
+            dtime   = np.diff(time)
+
+        new_event = np.flatnonzero((devent != 0) | (dtime != 0)) + 1
+        offsets   = np.concatenate([[0], new_event, [len(records)]]) if len(records) else np.zeros(1, dtype=int)
+        return cls(records, offsets)
+
+    @classmethod
+    def from_df(cls, df : pd.DataFrame) -> "ColumnarHits":
+        return cls.from_records(df.to_records(index=False))
+
+    def to_df(self) -> pd.DataFrame:
+        return pd.DataFrame(self.data)
+
+    @property
+    def events(self) -> np.ndarray:
+        return self.data["event"][self.offsets[:-1]]
+
+    @property
+    def times(self) -> np.ndarray:
+        if "time" not in self.data.dtype.names:
+            return np.full(len(self), -1)
+        return self.data["time"][self.offsets[:-1]]
+
+    @property
+    def nhits(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i : int) -> np.ndarray:
+        """Hits of the i-th event (a view of the data)."""
+        return self.data[self.offsets[i] : self.offsets[i+1]]
+
+    def __iter__(self) -> Iterator[np.ndarray]:
+        for i in range(len(self)):
+            yield self[i]
+
+    def without_NN(self) -> "ColumnarHits":
+        """Copy without the NN hits (nor the events left without hits)."""
+        Q = self.data["Q"] if "Q" in self.data.dtype.names else self.data["E"]
+        return ColumnarHits.from_records(self.data[Q != NN])
+
+    def hit_collection(self, i : int) -> HitCollection:
+        """
+        HitCollection of the i-th event, with default values for the
+        columns missing in the data.
+        """
+        hits = self[i]
+        n    = len(hits)
+
+        def column(name, default):
+            return hits[name].tolist() if name in hits.dtype.names else [default] * n
+
+        X , Y     = column("X"    ,    0), column("Y"    ,    0)
+        Z , E     = column("Z"    ,    0), column("E"    ,    0)
+        Q         = column("Q"    , None)
+        Xp, Yp    = column("Xpeak", -1000), column("Ypeak", -1000)
+        npeak     = column("npeak",    0)
+        Ec        = column("Ec"   ,   -1)
+        track_id  = column("track_id", -1)
+        Ep        = column("Ep"   ,  -1.)
+
+        hits = [Hit(npeak[h]                         ,
+                    Cluster(E[h] if Q[h] is None else Q[h],
+                            xy(X[h], Y[h])           ,
+                            xy(   0,    0)           ,
+                            nsipm = 1                ,
+                            z     = Z[h]             ,
+                            E     = E[h]             ,
+                            Qc    = 0               ),
+                    Z[h]                             ,
+                    E[h]                             ,
+                    xy(Xp[h], Yp[h])                 ,
+                    s2_energy_c = Ec[h]              ,
+                    track_id    = track_id[h]        ,
+                    Ep          = Ep[h]              )
+                for h in range(n)]
+
+        return HitCollection(self.events[i], self.times[i], hits=hits)
+
+    def hit_collections(self) -> "LazyHitCollections":
+        """Read-only mapping {event number : HitCollection}, built on access."""
+        return LazyHitCollections(self)
+
+
+class LazyHitCollections(Mapping):
+    """
+    Mapping {event number : HitCollection} of the events in a
+    ColumnarHits. Each HitCollection is built the first time it is
+    accessed.
+    """
+    def __init__(self, hits : ColumnarHits):
+        self.hits   = hits
+        self.index  = dict(zip(hits.events.tolist(), range(len(hits))))
+        self._cache = {}
+
+    def __getitem__(self, event : int) -> HitCollection:
+        if event not in self._cache:
+            self._cache[event] = self.hits.hit_collection(self.index[event])
+        return self._cache[event]
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __len__(self):
+        return len(self.index)
+
+
 class KrEvent(Event):
     """Represents a point-like (Krypton) event."""
     def __init__(self, event_number, event_time):
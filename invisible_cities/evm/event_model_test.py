@@ -1,6 +1,8 @@
-import numpy as np
+import numpy  as np
+import pandas as pd
 
 from pytest import mark
+from pytest import fixture
 
 from hypothesis             import given
 from hypothesis.strategies  import just
@@ -11,6 +13,7 @@ from hypothesis.strategies  import integers
 from hypothesis.strategies  import composite
 
 from .. types.ic_types   import xy
+from .. types.ic_types   import NN
 from .. types.symbols    import HitEnergy
 
 from .       event_model import Event
@@ -19,6 +22,7 @@ from .       event_model import Hit
 from .       event_model import Voxel
 from .       event_model import HitCollection
 from .       event_model import KrEvent
+from .       event_model import ColumnarHits
 
 
 @composite
@@ -164,6 +168,62 @@ def test_hit_collection_nonempty(hits):
     assert hc.hits == hits
 
 
+@fixture
+def columnar_hits_df():
+    return pd.DataFrame(dict( event = np.array([  3,   3,   1,   3,   1,   7], dtype=np.int64)
+                            , time  = np.array([ 10,  10,  20,  10,  20,  30], dtype=float   )
+                            , npeak = np.array([  0,   1,   0,   1,   0,   0], dtype=np.uint16)
+                            , X     = np.array([ 1., 2. , 3. , 4. , 5. , 6. ])
+                            , Y     = np.array([-1.,-2. ,-3. ,-4. ,-5. ,-6. ])
+                            , Z     = np.array([10., 20., 30., 40., 50., 60.])
+                            , Q     = np.array([ 5., NN , 7. , 8. , 9. , NN ])
+                            , E     = np.array([.1 , .2 , .3 , .4 , .5 , .6 ])))
+
+
+def test_columnar_hits_groups_events(columnar_hits_df):
+    hits = ColumnarHits.from_df(columnar_hits_df)
+
+    assert len(hits) == 3
+    assert np.all(hits.events == [ 1,  3,  7])
+    assert np.all(hits.times  == [20, 10, 30])
+    assert np.all(hits.nhits  == [ 2,  3,  1])
+    assert np.all(hits[0]["X"] == [3, 5])
+    assert np.all(hits[1]["X"] == [1, 2, 4])
+    assert sum(len(event) for event in hits) == len(columnar_hits_df)
+
+
+def test_columnar_hits_events_are_views(columnar_hits_df):
+    records = columnar_hits_df.sort_values("event", kind="stable").to_records(index=False)
+    hits    = ColumnarHits.from_records(records)
+
+    assert hits.data is records
+    assert np.shares_memory(hits[1], records)
+
+
+def test_columnar_hits_without_NN(columnar_hits_df):
+    hits = ColumnarHits.from_df(columnar_hits_df).without_NN()
+
+    assert np.all(hits.events == [1, 3])
+    assert np.all(hits.nhits  == [2, 2])
+    assert np.all(hits.data["Q"] != NN)
+
+
+def test_columnar_hits_hit_collections(columnar_hits_df):
+    collections = ColumnarHits.from_df(columnar_hits_df).hit_collections()
+
+    assert list(collections) == [1, 3, 7]
+    assert collections[3] is collections[3]
+
+    hc = collections[3]
+    assert hc.event == 3
+    assert hc.time  == 10
+    assert [h.npeak for h in hc.hits] == [0, 1, 1]
+    assert [h.X     for h in hc.hits] == [1, 2, 4]
+    assert [h.Q     for h in hc.hits] == [5, NN, 8]
+    assert [h.E     for h in hc.hits] == [.1, .2, .4]
+    assert all(h.Xpeak == -1000 and h.Ec == -1 and h.track_id == -1 for h in hc.hits)
+
+
 def test_kr_event_attributes():
     evt =  KrEvent(-1, -1)
 
@@ -1,7 +1,8 @@
 import numpy  as np
 import pandas as pd
 
-from scipy.interpolate import griddata
+from scipy.interpolate import RegularGridInterpolator
+from scipy.spatial     import cKDTree
 
 from .. core    .system_of_units import keV
 from .. core    .core_functions  import in_range
@@ -10,6 +11,7 @@ from .. types   .ic_types        import NoneType
 from .. evm     .ic_containers   import KryptonMap
 
 from typing import Union
+from typing import Optional
 
 
 def normalization(krmap     : pd.DataFrame,
@@ -81,6 +83,127 @@ def normalization(krmap     : pd.DataFrame,
     raise ValueError(f'Unsuported NormMethod: {method}')
 
 
+class CorrectionMap3D:
+    def __init__(self,
+                 krmap       : pd.DataFrame,
+                 norm_method : NormMethod,
+                 xy_params   : Optional[dict] = None,
+                 interpolate : bool           = False):
+        """
+        Krypton map prepared to be evaluated many times.
+
+        The map values and the normalization are computed once. If the
+        map voxels form a regular (dt, x, y) grid, as produced by
+        `compute_3D_map`, the values are stored in a dense array and
+        the voxel of each point is found by arithmetic on its
+        coordinates. Points falling in empty (NaN) voxels or maps
+        which are not a regular grid fall back to a nearest neighbour
+        search among the non-empty voxels, which gives the same
+        result as `scipy.interpolate.griddata(..., method="nearest")`.
+
+        Parameters
+        ----------
+        krmap : pd.DataFrame
+          Input krypton map with dt, x, y and mu columns.
+        norm_method : NormMethod
+          Method for normalization, defined in class function NormMethod.
+        xy_params : dict, optional
+          Limits in x and y that define the region inside of which the
+          normalization will be performed.
+        interpolate : bool, optional
+          If True, the map is trilinearly interpolated between the
+          centres of the voxels instead of taking the nearest voxel.
+          Requires a regular grid. Default is False.
+
+        Attributes
+        ----------
+        norm : float
+          Normalization value of the map.
+        """
+        krmap     = krmap[~krmap.mu.isna()]
+        points    = krmap['dt x y'.split()].values
+        self.norm = normalization(krmap, norm_method, xy_params)
+        self.mu   = krmap.mu.values
+        self.tree = cKDTree(points)
+        self.grid = self._regular_grid(points, self.mu)
+
+        self.interpolator = None
+        if interpolate:
+            if self.grid is None:
+                raise ValueError("Interpolation requires a map on a regular grid")
+            origin, step, values = self.grid
+            axes   = [o + s * np.arange(n) for o, s, n in zip(origin, step, values.shape)]
+            filled = values.copy()
+            empty  = np.isnan(filled)
+            if np.any(empty):
+                centres       = np.stack(np.meshgrid(*axes, indexing="ij"), axis=-1)[empty]
+                filled[empty] = self.mu[self.tree.query(centres)[1]]
+            self.interpolator = RegularGridInterpolator(axes, filled)
+
+    @staticmethod
+    def _regular_grid(points : np.ndarray, values : np.ndarray):
+        """
+        Returns the origin, step and dense array of values of a map
+        on a regular grid or None if the points are not such a grid.
+        """
+        origin, step, shape = [], [], []
+        for coordinate in points.T:
+            centres = np.unique(coordinate)
+            steps   = np.diff(centres)
+            if len(centres) > 1 and not np.allclose(steps, steps[0]):
+                return None
+            origin.append(centres[0])
+            step  .append(steps[0] if len(centres) > 1 else 1)
+            shape .append(len(centres))
+
+        origin  = np.array(origin)
+        step    = np.array(step)
+        indices = np.rint((points - origin) / step).astype(int)
+        grid    = np.full(shape, np.nan)
+        grid[tuple(indices.T)] = values
+        return origin, step, grid
+
+    def __call__(self,
+                 dt : np.ndarray,
+                 x  : np.ndarray,
+                 y  : np.ndarray) -> np.ndarray:
+        """
+        Returns the map values at the given points.
+        """
+        points = np.stack([dt, x, y], axis=1).astype(float)
+        if self.grid is None:
+            return self.mu[self.tree.query(points)[1]]
+
+        origin, step, values = self.grid
+        upper = origin + step * (np.array(values.shape) - 1)
+        if self.interpolator is not None:
+            return self.interpolator(np.clip(points, origin, upper))
+
+        indices = np.rint((points - origin) / step).clip(0, np.array(values.shape) - 1)
+        mu      = values[tuple(indices.astype(int).T)]
+        empty   = np.isnan(mu)
+        if np.any(empty):
+            mu[empty] = self.mu[self.tree.query(points[empty])[1]]
+        return mu
+
+    def correct(self,
+                dt   : np.ndarray,
+                x    : np.ndarray,
+                y    : np.ndarray,
+                E    : np.ndarray,
+                unit : Union[float, NoneType] = keV) -> np.ndarray:
+        """
+        Returns the energy E corrected with the map.
+        See `apply_3Dmap` for details.
+        """
+        Ec = E * (self.norm / self(dt, x, y))
+
+        if unit is not None:
+            Ec = (Ec/self.norm) * 41.55*keV/unit
+
+        return Ec
+
+
 def apply_3Dmap(krmap       : pd.DataFrame,
                 norm_method : NormMethod,
                 dt          : np.ndarray,
@@ -101,6 +224,8 @@ def apply_3Dmap(krmap       : pd.DataFrame,
          E_0 = 41.55 keV is the known energy deposited by a 83mKr decay,
          and S_0(x,y,z) is the average energy of 83mKr events
          from the corresponding voxel of the reference energy map.
+
+    To apply the same map many times, use `CorrectionMap3D`.
     Parameters
     ----------
     krmap : pd.DataFrame
@@ -126,20 +251,7 @@ def apply_3Dmap(krmap       : pd.DataFrame,
       Corrected energy
 
     """
-    mask        = krmap.mu.isna()
-    krmap       = krmap[~mask]
-    map_points  = krmap['dt x y'.split()].values
-    norm        = normalization(krmap, norm_method, xy_params)
-    data_points = np.stack([dt, x, y], axis = 1)
-
-    E_interpolated_data = griddata(map_points, krmap.mu.values, data_points, method = 'nearest')
-    correction_factor   = norm/E_interpolated_data
-    Ec                  = E * correction_factor
-
-    if unit is not None:
-        Ec = (Ec/norm) * 41.55*keV/unit
-
-    return Ec
+    return CorrectionMap3D(krmap, norm_method, xy_params).correct(dt, x, y, E, unit)
 
 
 def apply_correctionmap_inplace_kdst(kdst        : pd.DataFrame,
@@ -6,8 +6,12 @@ from .. types   .symbols              import NormMethod
 from .. icaros  .correction_functions import normalization
 from .. icaros  .correction_functions import apply_3Dmap
 from .. icaros  .correction_functions import apply_correctionmap_inplace_kdst
+from .. icaros  .correction_functions import CorrectionMap3D
+
+from scipy.interpolate import griddata
 
 from pytest import fixture
+from pytest import raises
 
 
 @fixture
@@ -87,3 +91,35 @@ def test_apply_correctionmap_shape(dummy_map):
     kdst_correct = apply_correctionmap_inplace_kdst(kdst, dummy_map, norm_method = NormMethod.maximum, xy_params = None, col_name='Ec')
     assert kdst_correct.shape[1] ==  kdst_test.shape[1] + 1
     assert ((kdst_test == kdst_correct.drop(columns = 'Ec')).all()).all()
+
+
+def test_correction_map_3D_same_as_nearest_neighbour(dummy_map):
+    dummy_map.loc[dummy_map.index % 7 == 0, 'mu'] = np.nan
+    dummy_map = dummy_map.sample(frac=1, random_state=123)
+    valid     = dummy_map[~dummy_map.mu.isna()]
+
+    n  = 1000
+    dt = np.random.uniform(-50, 500, n)
+    x  = np.random.uniform(-50, 325, n)
+    y  = np.random.uniform(-50, 325, n)
+
+    expected = griddata(valid['dt x y'.split()].values, valid.mu.values,
+                        np.stack([dt, x, y], axis=1), method='nearest')
+    assert np.all(CorrectionMap3D(dummy_map, NormMethod.maximum)(dt, x, y) == expected)
+
+
+def test_correction_map_3D_interpolation(dummy_map):
+    correction_map = CorrectionMap3D(dummy_map, NormMethod.maximum, interpolate=True)
+
+    values = correction_map(dummy_map.dt.values, dummy_map.x.values, dummy_map.y.values)
+    assert np.allclose(values, dummy_map.mu)
+
+    # mu is linear in y
+    mu = correction_map(np.array([45.]), np.array([25.]), np.array([12.5]))
+    assert np.allclose(mu, ((1*1 + 800)*0.5 + 1))
+
+
+def test_correction_map_3D_interpolation_requires_regular_grid(dummy_map):
+    dummy_map.loc[0, 'x'] = 1
+    with raises(ValueError):
+        CorrectionMap3D(dummy_map, NormMethod.maximum, interpolate=True)
@@ -0,0 +1,479 @@
+"""
+This module contains the tools to produce krypton maps out of core.
+The kdst files are read one at a time and only the sufficient
+statistics of each voxel (number of events, mean, spread and a
+fixed-binning histogram of S2e) and of each time slice are kept,
+so the memory needed is set by the size of the map and not by the
+number of events. The accumulators can be saved and loaded to resume
+a partial production:
+
+    acc = (KrMapAccumulator.load(checkpoint) if os.path.exists(checkpoint) else
+           KrMapAccumulator(xy_range, dt_range, xy_nbins, dt_nbins, S2e_range))
+    acc = accumulate_kdsts(filenames, "DST", "Events", acc, checkpoint=checkpoint)
+    krmap  = acc.compute_3D_map(MapFitFunction.fast_gaussian)
+    t_evol = acc.get_time_evol(run_number)
+"""
+import os
+import tempfile
+
+import numpy  as np
+import pandas as pd
+
+from .. core   .core_functions  import in_range
+from .. io     .dst_io          import load_dst
+from .. types  .symbols         import MapFitFunction
+from .. icaros .krmap_functions import create_empty_map
+from .. icaros .krmap_functions import merge_maps
+from .. icaros .krmap_functions import include_coordinates
+from .. icaros .krmap_functions import regularize_map
+from .. icaros .krmap_functions import gaussian_fit_histograms
+
+from typing import Callable
+from typing import Optional
+from typing import Sequence
+
+
+# output column of the time evolution -> kdst column
+TIME_EVOL_COLUMNS = { 's2e'   : 'S2e'
+                    , 's1w'   : 'S1w'
+                    , 's1h'   : 'S1h'
+                    , 's2h'   : 'S2h'
+                    , 's2w'   : 'S2w'
+                    , 's2q'   : 'S2q'
+                    , 'Nsipm' : 'Nsipm'
+                    , 'Xrms'  : 'Xrms'
+                    , 'Yrms'  : 'Yrms'
+                    , 'Zrms'  : 'Zrms'}
+
+
+def merge_moments(n1 : np.ndarray, mean1 : np.ndarray, m21 : np.ndarray,
+                  n2 : np.ndarray, mean2 : np.ndarray, m22 : np.ndarray):
+    """
+    Combines the number of entries, mean and sum of squared deviations
+    from the mean of two samples into those of their union
+    (Chan et al. parallel algorithm).
+    """
+    n     = n1 + n2
+    delta = mean2 - mean1
+    with np.errstate(divide="ignore", invalid="ignore"):
+        f    = np.where(n > 0, n2 / n, 0)
+    mean = mean1 + delta * f
+    m2   = m21 + m22 + delta**2 * n1 * f
+    return n, mean, m2
+
+
+def moments_by_group(group   : np.ndarray,
+                     values  : np.ndarray,
+                     ngroups : int):
+    """
+    Number of entries, mean and sum of squared deviations from the mean
+    of values in each group. `values` can be 2D, with one column per
+    variable.
+    """
+    n      = np.bincount(group, minlength=ngroups)
+    values = values.reshape(len(group), -1)
+    sums   = np.stack([np.bincount(group, v, minlength=ngroups) for v in values.T], axis=-1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = np.where(n[:, np.newaxis] > 0, sums / n[:, np.newaxis], 0)
+    dev2   = (values - mean[group])**2
+    m2     = np.stack([np.bincount(group, v, minlength=ngroups) for v in dev2.T], axis=-1)
+    return n, mean, m2
+
+
+class KrMapAccumulator:
+    def __init__(self,
+                 xy_range    : tuple,
+                 dt_range    : tuple,
+                 xy_nbins    : int,
+                 dt_nbins    : int,
+                 S2e_range   : tuple,
+                 S2e_nbins   : int   = 1000,
+                 slice_hours : float = 1,
+                 t0          : Optional[float] = None):
+        """
+        Accumulates the sufficient statistics to compute a krypton map
+        and the time evolution of the kdst averages, one chunk of the
+        kdst at a time.
+
+        Parameters
+        ----------
+        xy_range, dt_range, xy_nbins, dt_nbins, S2e_range :
+            Same as in krmap_functions.compute_3D_map.
+        S2e_nbins: int
+            Number of bins of the S2e histogram of each voxel within
+            S2e_range. The memory used is proportional to
+            S2e_nbins * dt_nbins * xy_nbins**2.
+        slice_hours: float
+            Time interval (hours) of the time evolution slices.
+        t0: float, optional
+            Start of the first time slice. By default, the earliest
+            time of the first chunk added.
+        """
+        self.xy_range    = tuple(xy_range)
+        self.dt_range    = tuple(dt_range)
+        self.xy_nbins    = xy_nbins
+        self.dt_nbins    = dt_nbins
+        self.S2e_range   = tuple(S2e_range)
+        self.S2e_nbins   = S2e_nbins
+        self.slice_hours = slice_hours
+
+        nvoxels          = dt_nbins * xy_nbins * xy_nbins
+        self.nevents     = np.zeros( nvoxels            , dtype=np.int64 )
+        self.S2e_mean    = np.zeros( nvoxels            , dtype=np.float64)
+        self.S2e_m2      = np.zeros( nvoxels            , dtype=np.float64)
+        self.S2e_hist    = np.zeros((nvoxels, S2e_nbins), dtype=np.uint32 )
+
+        self.nrows       = 0
+        self.ncolumns    = 0
+        self.time_range  = np.array([np.inf, -np.inf])
+        self.rmax        = -np.inf
+        self.zmax        = -np.inf
+
+        self.t0          = np.nan if t0 is None else t0
+        # slice index -> [nevents, time min, time max, means..., m2s...]
+        self.slices      = {}
+        self.files       = []
+
+    def voxel_index(self, df : pd.DataFrame):
+        """
+        Voxel of each entry of df (in the order (k, i, j) of the maps)
+        and mask of the entries within the ranges of the map.
+        """
+        xy_bins = np.linspace(*self.xy_range, self.xy_nbins + 1)
+        dt_bins = np.linspace(*self.dt_range, self.dt_nbins + 1)
+
+        mask = ( in_range(df.X  .values, *self.xy_range )
+               & in_range(df.Y  .values, *self.xy_range )
+               & in_range(df.DT .values, *self.dt_range )
+               & in_range(df.S2e.values, *self.S2e_range))
+
+        i = np.digitize(df.X .values[mask], xy_bins) - 1
+        j = np.digitize(df.Y .values[mask], xy_bins) - 1
+        k = np.digitize(df.DT.values[mask], dt_bins) - 1
+        return (k * self.xy_nbins + i) * self.xy_nbins + j, mask
+
+    def add(self, df : pd.DataFrame, filename : Optional[str] = None):
+        """
+        Adds the entries of a chunk of the kdst to the accumulators.
+        If given, filename is recorded as processed.
+        """
+        nvoxels = len(self.nevents)
+        voxel, mask = self.voxel_index(df)
+        S2e         = df.S2e.values[mask].astype(float)
+
+        n, mean, m2 = moments_by_group(voxel, S2e, nvoxels)
+        (self.nevents ,
+         self.S2e_mean,
+         self.S2e_m2  ) = merge_moments(self.nevents, self.S2e_mean, self.S2e_m2,
+                                        n, mean[:, 0], m2[:, 0])
+
+        low, high = self.S2e_range
+        ibin      = ((S2e - low) / (high - low) * self.S2e_nbins).astype(int).clip(0, self.S2e_nbins - 1)
+        np.add.at(self.S2e_hist.reshape(-1), voxel * self.S2e_nbins + ibin, 1)
+
+        if len(df):
+            self.nrows        += len(df)
+            self.ncolumns      = df.shape[1]
+            self.time_range[0] = min(self.time_range[0], df.time.min())
+            self.time_range[1] = max(self.time_range[1], df.time.max())
+            self.rmax          = max(self.rmax, df.R.max())
+            self.zmax          = max(self.zmax, df.Z.max())
+            self.add_time_slices(df)
+
+        if filename is not None:
+            self.files.append(filename)
+
+    def add_time_slices(self, df : pd.DataFrame):
+        if np.isnan(self.t0):
+            self.t0 = df.time.min()
+
+        slice_seconds  = self.slice_hours * 3600
+        time           = df.time.values
+        islice         = np.floor((time - self.t0) / slice_seconds).astype(int)
+        ids, group     = np.unique(islice, return_inverse=True)
+        values         = df[list(TIME_EVOL_COLUMNS.values())].values.astype(float)
+        n, mean, m2    = moments_by_group(group, values, len(ids))
+
+        tmin = np.full(len(ids),  np.inf)
+        tmax = np.full(len(ids), -np.inf)
+        np.minimum.at(tmin, group, time)
+        np.maximum.at(tmax, group, time)
+
+        ncols = values.shape[1]
+        for s, idx in enumerate(ids):
+            old = self.slices.get(idx)
+            if old is None:
+                self.slices[idx] = np.concatenate([[n[s], tmin[s], tmax[s]], mean[s], m2[s]])
+                continue
+
+            _, old_mean, old_m2 = np.split(old, [3, 3 + ncols])
+            new_n, new_mean, new_m2 = merge_moments(old[0], old_mean, old_m2, n[s], mean[s], m2[s])
+            self.slices[idx] = np.concatenate([[ new_n
+                                               , min(old[1], tmin[s])
+                                               , max(old[2], tmax[s])]
+                                               , new_mean, new_m2])
+
+    def medians(self) -> pd.DataFrame:
+        """
+        Same as krmap_functions.get_median for each voxel, with the
+        median interpolated from the S2e histogram.
+        """
+        low, high = self.S2e_range
+        binsize   = (high - low) / self.S2e_nbins
+        nevents   = self.nevents
+        cumsum    = np.cumsum(self.S2e_hist, axis=1)
+        half      = nevents / 2
+        ibin      = np.minimum((cumsum < half[:, np.newaxis]).sum(axis=1), self.S2e_nbins - 1)
+        below     = np.where(ibin > 0, cumsum[np.arange(len(ibin)), ibin - 1], 0)
+        inbin     = self.S2e_hist[np.arange(len(ibin)), ibin]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            median = low + binsize * (ibin + (half - below) / inbin)
+            std    = np.sqrt(self.S2e_m2 / (nevents - 1))
+
+        few   = nevents < 5
+        sigma = np.where(few, (0.04/2.35) * median, std)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return pd.DataFrame({'nevents'    : nevents.astype(float),
+                                 'mu'         : np.where(few, np.nan, median),
+                                 'sigma'      : sigma,
+                                 'mu_error'   : sigma/np.sqrt(nevents),
+                                 'sigma_error': np.nan})
+
+    def rebinned_histograms(self, nbins : int, chunk_size : int = 1000):
+        """
+        Merges the S2e histogram of each voxel into (at most) nbins
+        bins of an integer number of the original bins, starting at the
+        first bin with entries. Returns the new histograms and the lower
+        edge and the width of nbins of their bins for each voxel.
+        """
+        low, high = self.S2e_range
+        binsize   = (high - low) / self.S2e_nbins
+        filled    = self.S2e_hist > 0
+        first     = np.argmax(filled, axis=1)
+        last      = self.S2e_nbins - 1 - np.argmax(filled[:, ::-1], axis=1)
+        group     = np.maximum(-(-(last - first + 1) // nbins), 1)
+
+        counts = np.zeros((len(self.S2e_hist), nbins), dtype=np.int64)
+        fine   = np.arange(self.S2e_nbins)
+        for start in range(0, len(counts), chunk_size):
+            voxels = slice(start, start + chunk_size)
+            ibin   = (fine - first[voxels, np.newaxis]) // group[voxels, np.newaxis]
+            ibin   = ibin.clip(0, nbins - 1) + nbins * np.arange(len(ibin))[:, np.newaxis]
+            counts[voxels] = np.bincount( ibin.flatten()
+                                        , self.S2e_hist[voxels].flatten()
+                                        , minlength = ibin.size // self.S2e_nbins * nbins
+                                        ).reshape(-1, nbins)
+
+        return counts, low + first * binsize, nbins * group * binsize
+
+    def fit_map(self,
+                fit_function : MapFitFunction,
+                nbins        : int = 20,
+                min_events   : int = 50) -> pd.DataFrame:
+        """
+        Equivalent of krmap_functions.fit_map computed from the
+        accumulators. Only the approximations of the fits available
+        for the fixed-binning histograms are supported:
+        - fast_gaussian: the gaussian is fitted as in
+          krmap_functions.gaussian_fit_by_voxel (a linearised fit, not
+          the least squares fit of gaussian_fit) to the S2e histogram
+          of each voxel, rebinned to nbins bins.
+        - fast_median: the median is interpolated from the S2e
+          histogram of each voxel, so its precision is limited by the
+          binning of the histograms.
+        """
+        if fit_function is MapFitFunction.fast_gaussian:
+            counts, low, width = self.rebinned_histograms(nbins)
+            x                  = (np.arange(nbins) + 0.5) / nbins
+            result             = gaussian_fit_histograms(counts, x, low, width, self.medians(), min_events)
+
+        elif fit_function is MapFitFunction.fast_median:
+            result = self.medians()
+
+        else:
+            raise ValueError(f'Invalid fit function {fit_function}: only fast_gaussian '
+                             'and fast_median can be computed from the accumulators')
+
+        k, i, j = np.unravel_index(np.arange(len(result)), (self.dt_nbins, self.xy_nbins, self.xy_nbins))
+        result  = result.assign(k=k, i=i, j=j)[self.nevents > 0]
+        return result[['k', 'i', 'j', 'nevents', 'mu', 'sigma', 'mu_error', 'sigma_error']]
+
+    def compute_3D_map(self,
+                       fit_function : MapFitFunction,
+                       nbins        : int = 20,
+                       min_events   : int = 50) -> pd.DataFrame:
+        """
+        Equivalent of krmap_functions.compute_3D_map for all the data
+        added to the accumulators, with the voxels fitted as in
+        fit_map, which only supports fast_gaussian and fast_median.
+        """
+        args       = self.xy_range, self.dt_range, self.xy_nbins, self.dt_nbins
+        dt_binsize = (self.dt_range[1] - self.dt_range[0])/self.dt_nbins
+        xy_binsize = (self.xy_range[1] - self.xy_range[0])/self.xy_nbins
+
+        NaN_map    = create_empty_map(*args)
+        map_3D_fit = self.fit_map(fit_function, nbins, min_events)
+        map        = merge_maps(NaN_map, map_3D_fit)
+        coor_map   = include_coordinates(map, *args)
+
+        volume  = (dt_binsize*xy_binsize*xy_binsize)*0.001 #from mm^3 to cm^3
+        t_hours = (self.time_range[1] - self.time_range[0])/3600 #from seconds to hours
+
+        #density in events/hour/cm^3
+        full_map = coor_map.assign(density = coor_map['nevents']/volume/t_hours)
+        return regularize_map(full_map, (self.dt_nbins, self.xy_nbins, self.xy_nbins))
+
+    def compute_metadata(self, krmap : pd.DataFrame) -> pd.DataFrame:
+        """
+        Same as krmap_functions.compute_metadata for all the data
+        added to the accumulators.
+        """
+        metadata = {'rmax'        : self.rmax,
+                    'zmax'        : self.zmax,
+                    'bin_size_dt' : (self.dt_range[1] - self.dt_range[0]) / self.dt_nbins,
+                    'bin_size_x'  : (self.xy_range[1] - self.xy_range[0]) / self.xy_nbins,
+                    'bin_size_y'  : (self.xy_range[1] - self.xy_range[0]) / self.xy_nbins,
+                    'dtbins'      : [krmap.k.unique().tolist()],
+                    'xbins'       : [krmap.i.unique().tolist()],
+                    'ybins'       : [krmap.j.unique().tolist()],
+                    'nbins_dt'    : self.dt_nbins,
+                    'nbins_x'     : self.xy_nbins,
+                    'nbins_y'     : self.xy_nbins,
+                    'xy_range'    : [self.xy_range],
+                    'dt_range'    : [self.dt_range],
+                    'map_shape'   : [(self.nrows, self.ncolumns)],
+                    'map_extent'  : self.nrows}
+
+        return pd.DataFrame(metadata, index = [0]).T
+
+    def get_time_evol(self, run_number : int) -> pd.DataFrame:
+        """
+        Time evolution of the averages of the kdst in each time slice,
+        with the columns of krmap_functions.get_time_evol that do not
+        need a fit. The number of events is the number of kdst rows.
+        """
+        ids   = sorted(self.slices)
+        ncols = len(TIME_EVOL_COLUMNS)
+        stats = np.array([self.slices[idx] for idx in ids]).reshape(len(ids), 3 + ncols * 2)
+        n, tmin, tmax = stats[:, :3].T
+        mean, m2      = np.split(stats[:, 3:], 2, axis=1)
+
+        sqrtn = np.sqrt(n)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            std = np.sqrt(m2 / (n[:, np.newaxis] - 1))
+            t_evol = { 'run_number' : np.full(len(ids), run_number)
+                     , 'ts'         : tmin
+                     , 'nevents'    : n.astype(int)
+                     , 'neventsu'   : sqrtn
+                     , 'rate'       : n     / (tmax - tmin)
+                     , 'rateu'      : sqrtn / (tmax - tmin)}
+
+        for c, name in enumerate(TIME_EVOL_COLUMNS):
+            t_evol[name      ] = mean[:, c]
+            t_evol[name + 'u'] = std [:, c] / sqrtn
+
+        return pd.DataFrame(t_evol)
+
+    def save(self, filename : str):
+        """
+        Stores the accumulators in filename (a .npz file). The file is
+        replaced atomically, so a partial production can always be
+        resumed from the last checkpoint.
+        """
+        ids   = np.array(sorted(self.slices), dtype=int)
+        stats = np.array([self.slices[idx] for idx in ids]).reshape(len(ids), -1)
+
+        dirname = os.path.dirname(os.path.abspath(filename))
+        with tempfile.NamedTemporaryFile(dir=dirname, suffix=".npz", delete=False) as file:
+            np.savez( file
+                    , xy_range    = self.xy_range
+                    , dt_range    = self.dt_range
+                    , xy_nbins    = self.xy_nbins
+                    , dt_nbins    = self.dt_nbins
+                    , S2e_range   = self.S2e_range
+                    , S2e_nbins   = self.S2e_nbins
+                    , slice_hours = self.slice_hours
+                    , nevents     = self.nevents
+                    , S2e_mean    = self.S2e_mean
+                    , S2e_m2      = self.S2e_m2
+                    , S2e_hist    = self.S2e_hist
+                    , nrows       = self.nrows
+                    , ncolumns    = self.ncolumns
+                    , time_range  = self.time_range
+                    , rmax        = self.rmax
+                    , zmax        = self.zmax
+                    , t0          = self.t0
+                    , slice_ids   = ids
+                    , slice_stats = stats
+                    , files       = np.array(self.files, dtype=str))
+        os.replace(file.name, filename)
+
+    @classmethod
+    def load(cls, filename : str) -> "KrMapAccumulator":
+        """
+        Reads the accumulators stored by save.
+        """
+        with np.load(filename) as data:
+            acc = cls( tuple(data["xy_range"]), tuple(data["dt_range"])
+                     , int(data["xy_nbins"]), int(data["dt_nbins"])
+                     , tuple(data["S2e_range"]), int(data["S2e_nbins"])
+                     , float(data["slice_hours"]))
+
+            acc.nevents    = data["nevents"]
+            acc.S2e_mean   = data["S2e_mean"]
+            acc.S2e_m2     = data["S2e_m2"]
+            acc.S2e_hist   = data["S2e_hist"]
+            acc.nrows      = int  (data["nrows"])
+            acc.ncolumns   = int  (data["ncolumns"])
+            acc.time_range = data["time_range"]
+            acc.rmax       = float(data["rmax"])
+            acc.zmax       = float(data["zmax"])
+            acc.t0         = float(data["t0"])
+            acc.slices     = dict(zip(data["slice_ids"].tolist(), data["slice_stats"]))
+            acc.files      = data["files"].tolist()
+        return acc
+
+
+def accumulate_kdsts(filenames   : Sequence[str],
+                     group       : str,
+                     node        : str,
+                     accumulator : KrMapAccumulator,
+                     selection   : Optional[Callable] = None,
+                     checkpoint  : Optional[str]      = None) -> KrMapAccumulator:
+    """
+    Adds the kdst files to the accumulator one at a time, skipping
+    those already added.
+
+    Parameters
+    ----------
+    filenames : sequence of str
+        kdst files.
+    group, node : str
+        Location of the kdst table in the files.
+    accumulator : KrMapAccumulator
+        Accumulator to which the files are added.
+    selection : callable, optional
+        Function applied to the kdst of each file before adding it,
+        e.g. to apply quality cuts.
+    checkpoint : str, optional
+        If given, the accumulator is saved to this file after each
+        file is added.
+
+    Returns
+    -------
+    accumulator : KrMapAccumulator
+        The accumulator with all files added.
+    """
+    for filename in filenames:
+        if filename in accumulator.files:
+            continue
+
+        dst = load_dst(filename, group, node)
+        if selection is not None:
+            dst = selection(dst)
+
+        accumulator.add(dst, filename)
+        if checkpoint is not None:
+            accumulator.save(checkpoint)
+
+    return accumulator
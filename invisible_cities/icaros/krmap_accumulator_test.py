@@ -0,0 +1,146 @@
+import os
+
+import numpy  as np
+import pandas as pd
+import tables as tb
+
+from pytest import fixture
+from pytest import mark
+from pytest import raises
+
+from .. core   .core_functions    import fix_random_seed
+from .. core   .testing_utils     import assert_dataframes_close
+from .. io     .dst_io            import df_writer
+from .. types  .symbols           import MapFitFunction
+from .. icaros .krmap_functions   import fit_map
+from .. icaros .krmap_functions   import get_median
+from .. icaros .krmap_functions   import compute_3D_map
+from .. icaros .krmap_accumulator import KrMapAccumulator
+from .. icaros .krmap_accumulator import TIME_EVOL_COLUMNS
+from .. icaros .krmap_accumulator import accumulate_kdsts
+
+
+map_args = (-100, 100), (20, 80), 4, 2, (1000, 20000)
+
+
+@fixture(scope="module")
+def dummy_kdst():
+    n = 40000
+    with fix_random_seed(42):
+        df = pd.DataFrame({ 'event': np.arange(n)
+                          , 'time' : np.sort(np.random.uniform(0, 5 * 3600, n))
+                          , 'X'    : np.random.uniform(-100, 100, n)
+                          , 'Y'    : np.random.uniform(-100, 100, n)
+                          , 'DT'   : np.random.uniform(  20,  80, n)
+                          , 'S2e'  : np.random.normal(8000, 100, n)})
+        for column in list(TIME_EVOL_COLUMNS.values())[1:]:
+            df[column] = np.random.normal(10, 1, n)
+    return df.assign(Z = df.DT, R = np.hypot(df.X, df.Y))
+
+
+def test_krmap_accumulator_chunks_same_as_all_at_once(dummy_kdst):
+    all_at_once = KrMapAccumulator(*map_args)
+    in_chunks   = KrMapAccumulator(*map_args, t0 = dummy_kdst.time.min())
+    all_at_once.add(dummy_kdst)
+    for chunk in np.array_split(np.arange(len(dummy_kdst)), 7):
+        in_chunks.add(dummy_kdst.iloc[chunk])
+
+    assert np.all     (in_chunks.nevents    == all_at_once.nevents )
+    assert np.all     (in_chunks.S2e_hist   == all_at_once.S2e_hist)
+    assert np.allclose(in_chunks.S2e_mean   ,  all_at_once.S2e_mean)
+    assert np.allclose(in_chunks.S2e_m2     ,  all_at_once.S2e_m2  )
+    assert np.all     (in_chunks.time_range == all_at_once.time_range)
+    assert_dataframes_close(in_chunks.get_time_evol(1), all_at_once.get_time_evol(1))
+
+
+def test_krmap_accumulator_medians(dummy_kdst):
+    acc = KrMapAccumulator(*map_args)
+    acc.add(dummy_kdst)
+
+    result   = acc.fit_map(MapFitFunction.fast_median).reset_index(drop=True)
+    expected = fit_map(dummy_kdst[['X', 'Y', 'DT', 'S2e']], *map_args, get_median)
+    binsize  = np.diff(map_args[-1])[0] / acc.S2e_nbins
+
+    assert np.all(result[['k', 'i', 'j', 'nevents']] == expected[['k', 'i', 'j', 'nevents']])
+    assert np.allclose(result.mu   , expected.mu   , atol = binsize)
+    assert np.allclose(result.sigma, expected.sigma)
+
+
+def test_krmap_accumulator_gaussian_computes_right_values(dummy_kdst):
+    acc = KrMapAccumulator(*map_args)
+    acc.add(dummy_kdst)
+
+    result = acc.fit_map(MapFitFunction.fast_gaussian, nbins = 50)
+
+    assert np.allclose(result.mu   , 8000, atol = 5 * result.mu_error)
+    assert np.allclose(result.sigma,  100, rtol = 0.1)
+
+
+@mark.parametrize("fit_function", (MapFitFunction.gaussian, MapFitFunction.median))
+def test_krmap_accumulator_fit_map_raises_for_exact_fits(dummy_kdst, fit_function):
+    acc = KrMapAccumulator(*map_args)
+    acc.add(dummy_kdst)
+
+    with raises(ValueError):
+        acc.fit_map(fit_function)
+
+
+def test_krmap_accumulator_compute_3D_map_same_schema(dummy_kdst):
+    acc = KrMapAccumulator(*map_args)
+    acc.add(dummy_kdst)
+
+    result   = acc.compute_3D_map(MapFitFunction.fast_median)
+    expected = compute_3D_map(dummy_kdst[['X', 'Y', 'DT', 'S2e', 'time']], *map_args, get_median)
+
+    assert result.columns.tolist() == expected.columns.tolist()
+    assert (result.dtypes == expected.dtypes).all()
+    assert np.allclose(result.density, expected.density, equal_nan = True)
+
+
+def test_krmap_accumulator_time_evol(dummy_kdst):
+    acc = KrMapAccumulator(*map_args, slice_hours = 1)
+    acc.add(dummy_kdst)
+
+    result   = acc.get_time_evol(1)
+    t_slice  = np.floor((dummy_kdst.time - dummy_kdst.time.min()) / 3600)
+    expected = dummy_kdst.groupby(t_slice)
+
+    assert np.all     (result.nevents == expected.size().values)
+    assert np.allclose(result.ts      , expected.time.min().values)
+    for name, column in TIME_EVOL_COLUMNS.items():
+        assert np.allclose(result[name      ], expected[column].mean().values)
+        assert np.allclose(result[name + 'u'], expected[column].std ().values / np.sqrt(result.nevents))
+
+
+@mark.parametrize("fit_function", (MapFitFunction.fast_gaussian, MapFitFunction.fast_median))
+def test_krmap_accumulator_save_and_load(config_tmpdir, dummy_kdst, fit_function):
+    filename = os.path.join(config_tmpdir, f"krmap_accumulator_{fit_function}.npz")
+    acc      = KrMapAccumulator(*map_args)
+    acc.add(dummy_kdst, "file.h5")
+    acc.save(filename)
+    loaded   = KrMapAccumulator.load(filename)
+
+    assert loaded.files == ["file.h5"]
+    assert_dataframes_close(loaded.compute_3D_map(fit_function), acc.compute_3D_map(fit_function))
+    assert_dataframes_close(loaded.get_time_evol(1)            , acc.get_time_evol(1))
+
+
+def test_accumulate_kdsts_resumes_from_checkpoint(config_tmpdir, dummy_kdst):
+    filenames = []
+    for i, chunk in enumerate(np.array_split(np.arange(len(dummy_kdst)), 3)):
+        filename = os.path.join(config_tmpdir, f"accumulate_kdsts_{i}.h5")
+        with tb.open_file(filename, "w") as h5out:
+            df_writer(h5out, dummy_kdst.iloc[chunk], "DST", "Events")
+        filenames.append(filename)
+
+    checkpoint = os.path.join(config_tmpdir, "accumulate_kdsts.npz")
+    partial    = accumulate_kdsts(filenames[:2], "DST", "Events", KrMapAccumulator(*map_args),
+                                  checkpoint = checkpoint)
+    resumed    = accumulate_kdsts(filenames, "DST", "Events", KrMapAccumulator.load(checkpoint),
+                                  checkpoint = checkpoint)
+    full       = accumulate_kdsts(filenames, "DST", "Events", KrMapAccumulator(*map_args))
+
+    assert partial.nevents.sum() < full.nevents.sum()
+    assert resumed.files == filenames
+    assert np.all(resumed.S2e_hist == full.S2e_hist)
+    assert np.all(KrMapAccumulator.load(checkpoint).nevents == full.nevents)
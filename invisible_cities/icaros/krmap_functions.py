@@ -25,6 +25,9 @@ from .. icaros.lifetime_vdrift_functions import compute_drift_v
 from typing import Callable
 from typing import Union
 
+from functools          import partial
+from concurrent.futures import ProcessPoolExecutor
+
 
 def gauss_seed(x         : np.array,
                y         : np.array,
@@ -177,9 +180,195 @@ def gaussian_fit(var        : np.ndarray,
 
 def gaussian_fit_ready(nbins      : int,
                        min_events : int = 50):
-    def fit_fun(var):
-        return gaussian_fit(var, nbins, min_events)
-    return fit_fun
+    # a partial, unlike a closure, can be sent to the processes of fit_map
+    return partial(gaussian_fit, nbins=nbins, min_events=min_events)
+
+
+def get_median_by_voxel(voxel : np.ndarray,
+                        var   : np.ndarray) -> pd.DataFrame:
+    """
+    Same as get_median, applied at once to the values of every voxel.
+    Parameters
+    ----------
+    voxel : np.ndarray
+      Index of the voxel of each value, sorted and consecutive
+      (from 0 to the number of voxels - 1).
+    var : np.ndarray
+      Values of the variable.
+    Returns
+    -------
+    map : pd.DataFrame
+      Dataframe containing 'nevents', 'mu', 'sigma', 'mu_error', 'sigma_error'
+      for each voxel.
+    """
+    order   = np.lexsort((var, voxel))
+    var     = np.asarray(var, dtype=float)[order]
+    nevents = np.bincount(voxel)
+    start   = np.cumsum(nevents) - nevents
+    median  = (var[start + (nevents - 1) // 2] + var[start + nevents // 2]) / 2
+
+    mean    = np.bincount(voxel, var) / nevents
+    with np.errstate(divide="ignore", invalid="ignore"):
+        std = np.sqrt(np.bincount(voxel, (var - mean[voxel])**2) / (nevents - 1))
+
+    few   = nevents < 5
+    sigma = np.where(few, (0.04/2.35) * median, std)
+    return pd.DataFrame({'nevents'    : nevents,
+                         'mu'         : np.where(few, np.nan, median),
+                         'sigma'      : sigma,
+                         'mu_error'   : sigma/np.sqrt(nevents),
+                         'sigma_error': np.nan})
+
+
+def gaussian_fit_by_voxel(voxel      : np.ndarray,
+                          var        : np.ndarray,
+                          nbins      : int,
+                          min_events : int = 50) -> pd.DataFrame:
+    """
+    Fast, approximate version of gaussian_fit applied at once to the
+    values of every voxel. Instead of an iterative fit, the logarithm
+    of the histogram of each voxel is fitted to a parabola by weighted
+    linear least squares (weighting each bin by its counts, the inverse
+    of the variance of their logarithm),
+    which gives the mean and sigma of the gaussian in closed form.
+    With few entries per bin the sigma tends to be overestimated.
+    As in gaussian_fit, the median is used for voxels with fewer than
+    min_events entries or when the mean falls outside [0.5, 1.5] times
+    the median, and NaNs are returned when the fit fails. The errors
+    are those of the mean and the standard deviation of a gaussian
+    sample of the same size.
+    Parameters
+    ----------
+    voxel : np.ndarray
+      Index of the voxel of each value, sorted and consecutive
+      (from 0 to the number of voxels - 1).
+    var : np.ndarray
+      Values of the variable.
+    nbins : int
+      Number of bins to histogram the variable in each voxel.
+    min_events : int
+      Minimum number of entries to fit the voxel.
+    Returns
+    -------
+    map : pd.DataFrame
+      Dataframe containing 'nevents', 'mu', 'sigma', 'mu_error', 'sigma_error'
+      for each voxel.
+    """
+    var     = np.asarray(var, dtype=float)
+    medians = get_median_by_voxel(voxel, var)
+    nvoxels = len(medians)
+
+    # histogram each voxel in its own range as np.histogram does
+    low    = np.full(nvoxels, np.inf)
+    high   = np.full(nvoxels, -np.inf)
+    np.minimum.at(low , voxel, var)
+    np.maximum.at(high, voxel, var)
+    empty  = low == high
+    low    = np.where(empty, low - 0.5, low)
+    width  = np.where(empty, 1, high - low)
+    ibin   = ((var - low[voxel]) / width[voxel] * nbins).astype(int).clip(0, nbins - 1)
+    counts = np.bincount(voxel * nbins + ibin, minlength=nvoxels * nbins).reshape(nvoxels, nbins)
+
+    # bin centers in units of the voxel range
+    x = (np.arange(nbins) + 0.5) / nbins
+    return gaussian_fit_histograms(counts, x, low, width, medians, min_events)
+
+
+def gaussian_fit_histograms(counts     : np.ndarray,
+                            x          : np.ndarray,
+                            offset     : Union[float, np.ndarray],
+                            scale      : Union[float, np.ndarray],
+                            medians    : pd.DataFrame,
+                            min_events : int = 50) -> pd.DataFrame:
+    """
+    Fits a gaussian to each row of counts by weighted linear least
+    squares of log(counts) = a + b x + c x^2, as in gaussian_fit_by_voxel.
+    The bin centers of row v are offset[v] + scale[v] * x.
+    Parameters
+    ----------
+    counts : np.ndarray
+      Histogram of each voxel, with shape (number of voxels, number of bins).
+    x : np.ndarray
+      Bin centers, common to all voxels, in units of scale.
+    offset, scale : float or np.ndarray
+      Transformation from x to the variable for each voxel.
+    medians : pd.DataFrame
+      Output of get_median for each voxel, used as fallback.
+    min_events : int
+      Minimum number of entries to fit the voxel.
+    Returns
+    -------
+    map : pd.DataFrame
+      Dataframe containing 'nevents', 'mu', 'sigma', 'mu_error', 'sigma_error'
+      for each voxel.
+    """
+    nvoxels = len(counts)
+    weights = counts.astype(float)
+    logy    = np.log(np.where(counts > 0, counts, 1))
+    powers  = x[:, np.newaxis] ** np.arange(5)
+    moments = weights @ powers
+    A       = moments[:, [[0, 1, 2], [1, 2, 3], [2, 3, 4]]]
+    b       = (weights * logy) @ powers[:, :3]
+
+    fitted  = (medians.nevents.values >= min_events) & (np.count_nonzero(counts, axis=1) >= 3)
+    coefs   = np.full((nvoxels, 3), np.nan)
+    with np.errstate(all="ignore"):
+        solvable         = fitted & (np.abs(np.linalg.det(A)) > 0)
+        coefs[solvable]  = np.linalg.solve(A[solvable], b[solvable][..., np.newaxis])[..., 0]
+        c                = np.where(coefs[:, 2] < 0, coefs[:, 2], np.nan)
+        mu               = offset + scale * (-coefs[:, 1] / (2 * c))
+        sigma            = scale * np.sqrt(-1 / (2 * c))
+        nevents          = medians.nevents.values
+        median           = medians.mu.values
+
+    result = pd.DataFrame({'nevents'    : nevents,
+                           'mu'         : mu,
+                           'sigma'      : sigma,
+                           'mu_error'   : sigma / np.sqrt(nevents),
+                           'sigma_error': sigma / np.sqrt(2 * (nevents - 1))})
+
+    failed       = fitted & np.isnan(mu)
+    use_median   = ~fitted | (~failed & ~in_range(mu, 0.5*median, 1.5*median))
+    result.loc[use_median] = medians.loc[use_median]
+    result.loc[failed, ['mu', 'sigma', 'mu_error', 'sigma_error']] = np.nan
+    return result
+
+
+def gaussian_fit_by_voxel_ready(nbins      : int,
+                                min_events : int = 50):
+    return partial(gaussian_fit_by_voxel, nbins=nbins, min_events=min_events)
+
+
+_fit_function = None
+_fit_values   = None
+
+def _init_fit_worker(fit_function : Callable,
+                     values       : np.ndarray):
+    """
+    Stores the fit function and the S2e values sorted by voxel in
+    each of the processes spawned in fit_map.
+    """
+    global _fit_function, _fit_values
+    _fit_function, _fit_values = fit_function, values
+
+
+def _fit_voxels(bounds):
+    """
+    Applies _fit_function to the values of the voxels between the
+    given bounds. Used by the processes spawned in fit_map.
+    """
+    return fit_voxels(_fit_function, _fit_values, bounds)
+
+
+def fit_voxels(fit_function : Callable,
+               values       : np.ndarray,
+               bounds       : list) -> list:
+    """
+    Applies fit_function to the values of each voxel, given by the
+    (start, stop) bounds of the voxel in values.
+    """
+    return [fit_function(pd.Series(values[start:stop], name='S2e'))
+            for start, stop in bounds]
 
 
 def fit_map(df            : pd.DataFrame,
@@ -188,11 +377,14 @@ def fit_map(df            : pd.DataFrame,
             xy_nbins      : int,
             dt_nbins      : int,
             S2e_range     : tuple,
-            fit_function  : Callable) -> pd.DataFrame:
+            fit_function  : Callable,
+            vectorized    : bool = False,
+            nprocs        : int  = 1) -> pd.DataFrame:
     """
     For a given dataframe :
     - takes its x, y, dt and S2e values with their respective ranges.
     - calculates every possible indices combination to get i,j,k.
+    - sorts the data by voxel once.
     - creates a map applying fit_function to data.
     Parameters
     ----------
@@ -212,6 +404,16 @@ def fit_map(df            : pd.DataFrame,
       Number of map bins for S2e.
     S2e_range: tuple
       Range in S2e (pe) inside which the map is being computed.
+    vectorized : bool
+      If True, fit_function is called once with the index of the voxel
+      of each entry and the S2e values of all voxels, and returns one
+      row per voxel (e.g. get_median_by_voxel). Otherwise, it is called
+      once per voxel with its S2e values.
+    nprocs : int
+      Number of processes among which the voxels are distributed when
+      fit_function is applied per voxel. fit_function is sent to the
+      processes, so it must be picklable (e.g. not a closure) unless
+      they are started with fork.
     Returns
     -------
     result : pd.DataFrame
@@ -219,7 +421,8 @@ def fit_map(df            : pd.DataFrame,
       data and 'nevents', 'mu', 'sigma', 'mu_error', 'sigma_error' of the input
       dataframe after applying fit_function (note that it doesn't include spatial
       coordinates and if there is an index combination that doesn't contain data
-      it won't appear in the output).
+      it won't appear in the output, so the map is empty if no entry falls
+      within the ranges).
     """
     df = df.loc[:,['X', 'Y', 'DT', 'S2e']]
 
@@ -230,22 +433,52 @@ def fit_map(df            : pd.DataFrame,
 
     df   = df[mask]
 
-    x, y, dt, _ = df.values.T
+    x, y, dt, S2e = df.values.T
+
+    if len(S2e) == 0:
+        columns = ['k', 'i', 'j', 'nevents', 'mu', 'sigma', 'mu_error', 'sigma_error']
+        dtypes  = dict.fromkeys(columns[:4], np.int64) | dict.fromkeys(columns[4:], np.float64)
+        return pd.DataFrame(columns=columns).astype(dtypes)
 
     xy_bins = np.linspace(*xy_range, xy_nbins + 1)
     dt_bins = np.linspace(*dt_range, dt_nbins + 1)
 
     #add -1 so the indices go from 0 to 49, not from 1 to 50.
-    map_df = df.assign( i = np.digitize(x, bins = xy_bins) - 1,
-                        j = np.digitize(y, bins = xy_bins) - 1,
-                        k = np.digitize(dt, bins = dt_bins) - 1)
-
-    result = map_df.groupby(['k', 'i', 'j']).S2e.apply(fit_function)
-    result = result.reset_index()
-    if 'level_3' in result.columns:
-        result = result.drop(columns = 'level_3')
+    i = np.digitize(x, bins = xy_bins) - 1
+    j = np.digitize(y, bins = xy_bins) - 1
+    k = np.digitize(dt, bins = dt_bins) - 1
+
+    order         = np.lexsort((j, i, k))
+    kij           = np.stack([k, i, j])[:, order]
+    S2e           = S2e[order]
+    new_voxel     = np.any(np.diff(kij, axis=1) != 0, axis=0)
+    voxel         = np.concatenate([[0], np.cumsum(new_voxel)]).astype(int)
+    start         = np.flatnonzero(np.concatenate([[True], new_voxel]))
+    stop          = np.append(start[1:], len(S2e))
+    index         = pd.MultiIndex.from_arrays(kij[:, start], names=['k', 'i', 'j'])
+
+    if vectorized:
+        result = fit_function(voxel, S2e)
+        result.index = index
+        return result.reset_index()
+
+    bounds = list(zip(start, stop))
+    if nprocs > 1 and len(bounds) > 1:
+        chunks = np.array_split(np.arange(len(bounds)), min(nprocs, len(bounds)) * 4)
+        chunks = [[bounds[c] for c in chunk] for chunk in chunks]
+        with ProcessPoolExecutor(nprocs,
+                                 initializer = _init_fit_worker,
+                                 initargs    = (fit_function, S2e)) as executor:
+            results = sum(executor.map(_fit_voxels, chunks), [])
+    else:
+        results = fit_voxels(fit_function, S2e, bounds)
 
-    return result
+    if results and all(isinstance(r, pd.DataFrame) for r in results):
+        result = pd.concat(results, keys=index).droplevel(-1)
+        result.index.names = index.names
+    else:
+        result = pd.Series(results, index=index, name='S2e')
+    return result.reset_index()
 
 
 def merge_maps(NaN_map : pd.DataFrame,
@@ -352,7 +585,9 @@ def compute_3D_map(df           : pd.DataFrame,
                    xy_nbins     : int,
                    dt_nbins     : int,
                    S2e_range    : tuple,
-                   fit_function : Callable) -> pd.DataFrame:
+                   fit_function : Callable,
+                   vectorized   : bool = False,
+                   nprocs       : int  = 1) -> pd.DataFrame:
     """
     Computes a 3D map from the data in df given a range in xy and dt and the number of bins for each coordinate.
     The map values in each voxel are computed using fit_function.
@@ -380,6 +615,10 @@ def compute_3D_map(df           : pd.DataFrame,
       Number of map bins for S2e.
     S2e_range: tuple
       Range in S2e (pe) inside which the map is being computed.
+    vectorized : bool
+      Whether fit_function is applied at once to all voxels (see fit_map).
+    nprocs : int
+      Number of processes used to fit the voxels (see fit_map).
     Returns
     -------
     full_map : pd.DataFrame
@@ -391,7 +630,8 @@ def compute_3D_map(df           : pd.DataFrame,
     xy_binsize = (xy_range[1] - xy_range[0])/xy_nbins
 
     NaN_map    = create_empty_map(xy_range, dt_range, xy_nbins, dt_nbins)
-    map_3D_fit = fit_map(df, xy_range, dt_range, xy_nbins, dt_nbins, S2e_range, fit_function)
+    map_3D_fit = fit_map(df, xy_range, dt_range, xy_nbins, dt_nbins, S2e_range, fit_function,
+                         vectorized, nprocs)
     map        = merge_maps(NaN_map, map_3D_fit)
     coor_map   = include_coordinates(map, xy_range, dt_range, xy_nbins, dt_nbins)
 
@@ -1,19 +1,28 @@
 import os
+import multiprocessing
 
 import numpy as np
 import pandas as pd
 
 from pytest import fixture
+from pytest import mark
+
+from functools          import partial
+from concurrent.futures import ProcessPoolExecutor
 
 from .. types    .symbols         import SelRegionMethod
 from .. core     .fit_functions   import gauss
 from .. core     .core_functions  import in_range
 from .. core     .core_functions  import fix_random_seed
 from .. core     .testing_utils   import assert_dataframes_close
+from .. icaros                    import krmap_functions as krf
 from .. icaros   .krmap_functions import create_empty_map
 from .. icaros   .krmap_functions import get_median
 from .. icaros   .krmap_functions import gaussian_fit_ready
 from .. icaros   .krmap_functions import gaussian_fit
+from .. icaros   .krmap_functions import get_median_by_voxel
+from .. icaros   .krmap_functions import gaussian_fit_by_voxel
+from .. icaros   .krmap_functions import gaussian_fit_by_voxel_ready
 from .. icaros   .krmap_functions import fit_map
 from .. icaros   .krmap_functions import merge_maps
 from .. icaros   .krmap_functions import include_coordinates
@@ -276,6 +285,105 @@ def test_fit_map_missing_bins():
     assert result.shape[0] == 3*3*3
 
 
+@fixture
+def dummy_fit_map_kdst():
+    with fix_random_seed(42):
+        return pd.DataFrame({
+            'X'  : np.random.uniform(-100, 100, 50000),
+            'Y'  : np.random.uniform(-100, 100, 50000),
+            'DT' : np.random.uniform(  20,  80, 50000),
+            'S2e': np.random.normal(loc = 8000, scale = 100.0, size = 50000)})
+
+
+def test_get_median_by_voxel_same_as_get_median():
+    with fix_random_seed(42):
+        nevents = np.random.randint(1, 20, size = 30)
+        S2e     = np.random.normal(loc = 8000, scale = 100.0, size = nevents.sum())
+    voxel = np.repeat(np.arange(len(nevents)), nevents)
+
+    result   = get_median_by_voxel(voxel, S2e)
+    expected = pd.concat([get_median(pd.Series(S2e[voxel == v])) for v in range(len(nevents))],
+                         ignore_index = True)
+
+    assert_dataframes_close(result, expected)
+
+
+def test_gaussian_fit_by_voxel_computes_right_values():
+    with fix_random_seed(42):
+        S2e = np.random.normal(loc = 8000, scale = 10.0, size = (3, 10000))
+    voxel = np.repeat(np.arange(3), 10000)
+
+    results = gaussian_fit_by_voxel(voxel, S2e.flatten(), nbins = 50)
+
+    assert np.allclose(results.mu         , S2e.mean(axis=1), atol = 1)
+    assert np.allclose(results.sigma      , S2e.std (axis=1), atol = 0.5)
+    assert np.allclose(results.mu_error   , 0.1             , atol = 0.01)
+    assert np.allclose(results.sigma_error, 0.07            , atol = 0.01)
+    assert (results.nevents == 10000).all()
+
+
+def test_gaussian_fit_by_voxel_few_entries_use_median():
+    with fix_random_seed(42):
+        S2e = np.random.normal(loc = 8000, scale = 10.0, size = 120)
+    voxel = np.repeat([0, 1], [100, 20])
+
+    results  = gaussian_fit_by_voxel(voxel, S2e, nbins = 10, min_events = 50)
+    expected = get_median(pd.Series(S2e[100:]))
+
+    assert_dataframes_close(results.iloc[1:].reset_index(drop=True), expected)
+
+
+@mark.parametrize("fit_function", (get_median, gaussian_fit_ready(20, 50)))
+def test_fit_map_in_parallel_same_as_serial(dummy_fit_map_kdst, fit_function):
+    args     = dummy_fit_map_kdst, (-100, 100), (20, 80), 4, 2, (1000, 20000), fit_function
+    serial   = fit_map(*args)
+    parallel = fit_map(*args, nprocs = 2)
+
+    assert_dataframes_close(parallel, serial)
+
+
+@mark.parametrize("fit_function", (get_median, gaussian_fit_ready(20, 50)))
+def test_fit_map_in_parallel_with_spawn(monkeypatch, dummy_fit_map_kdst, fit_function):
+    # the fit function is sent to the processes, which is only possible
+    # if it can be pickled unless the processes are forked
+    spawn_executor = partial(ProcessPoolExecutor, mp_context=multiprocessing.get_context("spawn"))
+    monkeypatch.setattr(krf, "ProcessPoolExecutor", spawn_executor)
+
+    args     = dummy_fit_map_kdst, (-100, 100), (20, 80), 2, 2, (1000, 20000), fit_function
+    serial   = fit_map(*args)
+    parallel = fit_map(*args, nprocs = 2)
+
+    assert_dataframes_close(parallel, serial)
+
+
+@mark.parametrize("fit_function vectorized_function".split(),
+                  ((get_median               , get_median_by_voxel                ),
+                   (gaussian_fit_ready(20,50), gaussian_fit_by_voxel_ready(20, 50))))
+def test_fit_map_vectorized_same_schema(dummy_fit_map_kdst, fit_function, vectorized_function):
+    args       = dummy_fit_map_kdst, (-100, 100), (20, 80), 4, 2, (1000, 20000)
+    result     = fit_map(*args, fit_function)
+    vectorized = fit_map(*args, vectorized_function, vectorized = True)
+
+    assert vectorized.columns.tolist() == result.columns.tolist()
+    assert (vectorized.dtypes          == result.dtypes).all()
+    assert np.all(vectorized[["k", "i", "j", "nevents"]] == result[["k", "i", "j", "nevents"]])
+    assert np.allclose(vectorized.mu   , result.mu   , rtol = 1e-3)
+    assert np.allclose(vectorized.sigma, result.sigma, rtol = 0.1 )
+
+
+@mark.parametrize("fit_function vectorized".split(),
+                  ((get_median         , False),
+                   (get_median_by_voxel, True )))
+def test_fit_map_no_data_in_range(dummy_fit_map_kdst, fit_function, vectorized):
+    args     = (-100, 100), (20, 80), 4, 2
+    result   = fit_map(dummy_fit_map_kdst, *args, (   0,   500), fit_function, vectorized)
+    expected = fit_map(dummy_fit_map_kdst, *args, (1000, 20000), fit_function, vectorized)
+
+    assert len(result) == 0
+    assert result.columns.tolist() == expected.columns.tolist()
+    assert (result.dtypes          == expected.dtypes).all()
+
+
 def test_merge_maps():
     Nan_map_test = create_empty_map(xy_range = (-500, 500), dt_range = (0, 1400), xy_nbins = 100, dt_nbins = 10)
     #creating a map with 3 wholes to make sure that the shape still the same as NaNmaps
@@ -2,16 +2,12 @@ from typing                import Dict
 
 from functools             import partial
 
-import numpy               as     np
+import tables              as     tb
 import pandas              as     pd
 
-from . dst_io              import load_dst
 from . dst_io              import df_writer
-from ..evm.event_model     import Hit
-from ..evm.event_model     import Cluster
 from ..evm.event_model     import HitCollection
-from .. types.ic_types     import xy
-from .. types.ic_types     import NN
+from ..evm.event_model     import ColumnarHits
 
 
 def hits_from_df (dst : pd.DataFrame, skip_NN : bool = False) -> Dict[int, HitCollection]:
@@ -30,44 +26,39 @@ def hits_from_df (dst : pd.DataFrame, skip_NN : bool = False) -> Dict[int, HitCo
     ------
     Dictionary {event_number : HitCollection}
     """
-    all_events = {}
-    times = getattr(dst, 'time', [-1]*len(dst))
-    for (event, time) , df in dst.groupby(['event', times]):
-        #pandas is not consistent with numpy dtypes so we have to change it by hand
-        event = np.int64(event)
-        hits  = []
-        for i, row in df.iterrows():
-            Q = getattr(row,'Q', row.E)
-            if skip_NN and Q == NN:
-                continue
-            Xpeak   = getattr(row, 'Xpeak'   , -1000)     # for backwards compatibility
-            Ypeak   = getattr(row, 'Ypeak'   , -1000)     # for backwards compatibility
-            Ec      = getattr(row, 'Ec'      , -1   )     # for backwards compatibility
-            trackID = getattr(row, 'track_id', -1   )     # for backwards compatibility
-            Ep      = getattr(row, 'Ep'      , -1.  )     # for backwards compatibility
-
-            hit = Hit(row.npeak            ,
-                      Cluster(Q               ,
-                              xy(row.X, row.Y),
-                              xy(    0,     0),
-                              nsipm =      1  ,
-                              z     = row.Z   ,
-                              E     = row.E   ,
-                              Qc    =  0      ),
-                      row.Z                ,
-                      row.E                ,
-                      xy(Xpeak, Ypeak)     ,
-                      s2_energy_c = Ec     ,
-                      track_id    = trackID,
-                      Ep          = Ep
-                      )
-
-            hits.append(hit)
-
-        if len(hits):
-            all_events[event] = HitCollection(event, time, hits=hits)
-
-    return all_events
+    hits = ColumnarHits.from_df(dst)
+    if skip_NN:
+        hits = hits.without_NN()
+    return dict(hits.hit_collections())
+
+
+def load_columnar_hits(DST_file_name : str, group_name : str = 'RECO', table_name : str = 'Events', skip_NN : bool = False
+                      )-> ColumnarHits:
+    """
+    Function to load hits into a ColumnarHits object, without building
+    an object per hit.
+
+    ------
+    Parameters
+    ------
+    DST_file_name : str
+    group_name    : str (default 'RECO')
+        Name of the group inside pytable
+    table_name    : str (default 'Events')
+        Name of the table inside the group
+    skip_NN       : bool (default False)
+        whether to skip NN hits
+    ------
+    Returns
+    ------
+    ColumnarHits with the hits of all events
+    """
+    with tb.open_file(DST_file_name) as h5in:
+        records = getattr(getattr(h5in.root, group_name), table_name).read()
+
+    hits = ColumnarHits.from_records(records)
+    return hits.without_NN() if skip_NN else hits
+
 
 # reader
 def load_hits(DST_file_name : str, group_name : str = 'RECO', table_name : str = 'Events', skip_NN : bool = False
@@ -90,12 +81,8 @@ def load_hits(DST_file_name : str, group_name : str = 'RECO', table_name : str =
     ------
     Dictionary {event_number : HitCollection}
     """
-    dst = load_dst(DST_file_name, group_name, table_name)
-    hits_dict = {}
-    # Check dst is defined and non-empty
-    if dst is not None and len(dst):
-        hits_dict = hits_from_df (dst, skip_NN)
-    return hits_dict
+    hits = load_columnar_hits(DST_file_name, group_name, table_name, skip_NN)
+    return dict(hits.hit_collections())
 
 def load_hits_skipping_NN(DST_file_name : str, group_name : str = 'RECO', table_name : str = 'Events'
                           )-> Dict[int, HitCollection]:
@@ -126,3 +113,10 @@ def hits_writer(hdf5_file, group_name, table_name, *, compression=None):
                   , descriptive_string = "Hits"
                   , columns_to_index   = ["event"]
                   , compression        = compression)
+
+
+def columnar_hits_writer(hdf5_file, group_name, table_name, *, compression=None):
+    write_df = hits_writer(hdf5_file, group_name, table_name, compression=compression)
+    def write(hits : ColumnarHits):
+        write_df(hits.to_df())
+    return write
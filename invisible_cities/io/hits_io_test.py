@@ -7,6 +7,9 @@ import time   as tm
 from . dst_io              import load_dst
 from .  hits_io            import hits_writer
 from .  hits_io            import load_hits
+from .  hits_io            import hits_from_df
+from .  hits_io            import load_columnar_hits
+from .  hits_io            import columnar_hits_writer
 from .. types.ic_types     import NN
 
 from .. core.testing_utils import assert_dataframes_close
@@ -97,6 +100,44 @@ def test_hits_writer(config_tmpdir, Th228_hits):
     assert_dataframes_close(read_hits, original_hits)
 
 
+def test_columnar_hits_round_trip(config_tmpdir):
+    output_file = os.path.join(config_tmpdir, "test_columnar_hits.h5")
+    nhits       = 100
+    hits_df     = pd.DataFrame(dict( event    = np.repeat(np.arange(10), 10).astype(np.int64)
+                                   , time     = np.repeat(np.arange(10), 10).astype(float)
+                                   , npeak    = np.zeros (nhits, dtype=np.uint16)
+                                   , Xpeak    = np.zeros (nhits)
+                                   , Ypeak    = np.zeros (nhits)
+                                   , X        = np.arange(nhits, dtype=float)
+                                   , Y        = np.arange(nhits, dtype=float)
+                                   , Z        = np.arange(nhits, dtype=float)
+                                   , Q        = np.where (np.arange(nhits) % 3, 1., NN)
+                                   , E        = np.ones  (nhits)
+                                   , Ec       = np.ones  (nhits)
+                                   , track_id = np.full  (nhits, -1, dtype=np.int64)
+                                   , Ep       = np.ones  (nhits)))
+
+    with tb.open_file(output_file, 'w') as h5out:
+        hits_writer(h5out, "RECO", "Events")(hits_df)
+
+    hits = load_columnar_hits(output_file)
+    assert_dataframes_close(hits.to_df(), hits_df)
+
+    with tb.open_file(output_file, 'w') as h5out:
+        columnar_hits_writer(h5out, "RECO", "Events")(hits)
+
+    read_hits = load_dst(output_file, group = "RECO", node = "Events")
+    assert_dataframes_close(read_hits, hits_df)
+
+    for skip_NN in (False, True):
+        expected = hits_from_df(hits_df, skip_NN)
+        loaded   = load_hits   (output_file, skip_NN=skip_NN)
+        assert list(loaded) == list(expected)
+        for event, hitc in loaded.items():
+            assert [(h.X, h.Q, h.E) for h in hitc.hits] == [(h.X, h.Q, h.E) for h in expected[event].hits]
+        assert len(load_columnar_hits(output_file, skip_NN=skip_NN).data) == sum(len(hc.hits) for hc in loaded.values())
+
+
 # TODO: this test does not test make any sense
 def test_hit_time_is_in_second(ICDATADIR):
     output_file = os.path.join(ICDATADIR, "hits_1hit_perSiPM_30pes_6817_trigger2_v0.9.9_20190111_krth1600.0.h5")
@@ -1,4 +1,8 @@
-from functools import partial
+from functools   import partial
+from collections import defaultdict
+from itertools   import count
+from itertools   import islice
+from itertools   import repeat
 
 import numpy  as np
 import tables as tb
@@ -148,7 +152,45 @@ def load_pmaps_as_df_eager(filename):
                 to_df(pmap.S2Pmt.read()) if 'S2Pmt' in pmap else None)
 
 
-def load_pmaps_as_df_lazy(filename, skip=0, n=None):
+def read_table_by_event(table, chunk_size):
+    """
+    Iterate over the rows of a table grouped by event number.
+
+    The table is read in contiguous blocks of `chunk_size` rows, so
+    the memory usage is bounded regardless of the size of the table.
+    Each block is split in groups of consecutive rows with the same
+    event number. The last group of a block might continue in the
+    next one, so it is carried over until the boundary is found.
+
+    Parameters
+    ----------
+    table: tables.Table
+      Table with an `event` column. The rows of each event must be
+      contiguous, as written by `pmap_writer`.
+
+    chunk_size: int
+      Number of rows read at once.
+
+    Returns
+    -------
+    An iterator of tuples (event_number, records).
+    """
+    leftover = table.read(0, 0)
+    for start in range(0, table.nrows, chunk_size):
+        chunk      = table.read(start, start + chunk_size)
+        chunk      = np.concatenate([leftover, chunk]) if leftover.size else chunk
+        events     = chunk["event"]
+        boundaries = np.flatnonzero(events[1:] != events[:-1]) + 1
+        boundaries = np.concatenate([[0], boundaries])
+        for begin, end in zip(boundaries[:-1], boundaries[1:]):
+            yield events[begin], chunk[begin:end]
+        leftover = chunk[boundaries[-1]:]
+
+    if leftover.size:
+        yield leftover["event"][0], leftover
+
+
+def load_pmaps_as_df_lazy(filename, skip=0, n=None, chunk_size=100_000):
     """
     Read pmaps from file as dataframes lazily.
 
@@ -163,6 +205,9 @@ def load_pmaps_as_df_lazy(filename, skip=0, n=None):
     n: int or None, optional
       How many events to read (defaults to all).
 
+    chunk_size: int, optional
+      Number of rows read at once from each table (default 100000).
+
     Returns
     -------
     An iterator of tuples of dataframes.
@@ -173,21 +218,35 @@ def load_pmaps_as_df_lazy(filename, skip=0, n=None):
       - S1 per PMT
       - S2 per PMT
     """
-    def read_event(table, event):
-        if table is None: return None
-        records = table.read_where(f"event=={event}")
-        return pd.DataFrame.from_records(records)
+    def records_by_event(table):
+        """Yield the records of each event in `events`, in order"""
+        groups   = read_table_by_event(table, chunk_size)
+        empty    = table.read(0, 0)
+        position = -1
+        for i in count():
+            # groups of events not in `events` are skipped
+            while position < i:
+                event, records = next(groups, (None, None))
+                if event is None: break
+                position       = event_position.get(event, -1)
+
+            yield records if position == i else empty
+
+    def read_events(table):
+        if table is None: return repeat(None)
+        return map(pd.DataFrame.from_records, islice(records_by_event(table), skip, skip + n))
 
     tables = "S1 S2 S2Si S1Pmt S2Pmt".split()
     with tb.open_file(filename, 'r') as h5f:
         check_file_integrity(h5f)
 
-        events = h5f.root.Run.events.read(field="evt_number")
-        tables = [getattr(h5f.root.PMAPS, table, None) for table in tables]
-        n = events.size if n is None else n
-        events = events[skip : skip+n]
-        for event in events:
-            yield tuple(read_event(table, event) for table in tables)
+        events         = h5f.root.Run.events.read(field="evt_number")
+        n              = events.size if n is None else n
+        n              = max(min(n, events.size - skip), 0)
+        event_position = {event: i for i, event in enumerate(events)}
+        tables         = [getattr(h5f.root.PMAPS, table, None) for table in tables]
+        readers        = list(map(read_events, tables))
+        yield from zip(*readers)
 
 
 # Hack fix to allow loading pmaps without individual pmts. Used in load_pmaps
@@ -235,51 +294,118 @@ def load_pmaps_eager(filename):
     -------
     A dictionary mapping event numbers to PMaps.
     """
-    pmap_dict = {}
-    s1df, s2df, sidf, s1pmtdf, s2pmtdf = load_pmaps_as_df_eager(filename)
+    with tb.open_file(filename, 'r') as h5f:
+        check_file_integrity(h5f)
+
+        pmap  = h5f.root.PMAPS
+        s1    = pmap.S1   .read()
+        s2    = pmap.S2   .read()
+        si    = pmap.S2Si .read()
+        s1pmt = pmap.S1Pmt.read() if 'S1Pmt' in pmap else None
+        s2pmt = pmap.S2Pmt.read() if 'S2Pmt' in pmap else None
+
     # Hack fix to allow loading pmaps without individual pmts
-    if s1pmtdf is None: s1pmtdf = _build_ipmtdf_from_sumdf(s1df)
-    if s2pmtdf is None: s2pmtdf = _build_ipmtdf_from_sumdf(s2df)
-    event_numbers = set.union(set(s1df.event), set(s2df.event))
-    s1df_grouped   =s1df   .groupby('event')
-    s1pmtdf_grouped=s1pmtdf.groupby('event')
-    s2df_grouped   =s2df   .groupby('event')
-    s2pmtdf_grouped=s2pmtdf.groupby('event')
-    sidf_grouped   =sidf   .groupby('event')
-    for event_number in event_numbers:
-        try:
-            s1indx=s1df_grouped      .groups[event_number]
-        except KeyError:
-            s1indx=[]
-        try:
-            s1pmtindx=s1pmtdf_grouped.groups[event_number]
-        except KeyError:
-            s1pmtindx=[]
-        try:
-            s2indx=s2df_grouped      .groups[event_number]
-        except KeyError:
-            s2indx=[]
-        try:
-            s2pmtindx=s2pmtdf_grouped.groups[event_number]
-        except KeyError:
-            s2pmtindx=[]
-        try:
-            siindx=sidf_grouped      .groups[event_number]
-        except KeyError:
-            siindx=[]
-
-        s1s = s1s_from_df(s1df   .iloc   [s1indx   ],
-                          s1pmtdf.iloc   [s1pmtindx])
-        s2s = s2s_from_df(s2df   .iloc   [s2indx   ],
-                          s2pmtdf.iloc   [s2pmtindx],
-                          sidf   .iloc   [siindx   ])
-
-        pmap_dict[event_number] = PMap(s1s, s2s)
-
-    return pmap_dict
-
-
-def load_pmaps_lazy(filename, skip=0, n=None):
+    if s1pmt is None: s1pmt = _build_ipmt_records_from_sum(s1)
+    if s2pmt is None: s2pmt = _build_ipmt_records_from_sum(s2)
+
+    peaks = defaultdict(lambda: ([], []))
+    for event, s1 in peaks_from_records(s1, s1pmt, None):
+        peaks[event][0].append(s1)
+    for event, s2 in peaks_from_records(s2, s2pmt,   si):
+        peaks[event][1].append(s2)
+
+    return {event: PMap(*peaks[event]) for event in sorted(peaks)}
+
+
+def _build_ipmt_records_from_sum(records):
+    ipmt = np.empty(len(records), dtype=[("event", np.int64), ("peak", np.uint16),
+                                         ("npmt" , np.int64), ("ene" , np.float32)])
+    ipmt["event"] = records["event"]
+    ipmt["peak" ] = records["peak" ]
+    ipmt["npmt" ] = -1
+    ipmt["ene"  ] = records["ene"  ]
+    return ipmt
+
+
+def _sort_by_peak(records):
+    """
+    Sort the records of a PMAPS table by event and peak number,
+    preserving the order of the rows within each peak.
+    Returns the sorted records and a unique key for each row.
+    """
+    keys  = records["event"].astype(np.int64) * 2**16 + records["peak"]
+    order = np.argsort(keys, kind="stable")
+    return records[order], keys[order]
+
+
+def peaks_from_records(records, pmt_records, sipm_records):
+    """
+    Build the peaks stored in the PMAPS tables without going through
+    dataframes. The tables are sorted once and the rows of each peak
+    are located in all tables with `np.searchsorted`. The sensor
+    responses are views of the sorted columns.
+
+    Parameters
+    ----------
+    records: np.ndarray
+      Records of the S1 or S2 table.
+
+    pmt_records: np.ndarray
+      Records of the S1Pmt or S2Pmt table.
+
+    sipm_records: np.ndarray or None
+      Records of the S2Si table or None for S1s.
+
+    Returns
+    -------
+    An iterator of tuples (event_number, peak), ordered by event and
+    peak number. The peaks are S1s if `sipm_records` is None or S2s
+    otherwise.
+    """
+    records    , keys      = _sort_by_peak(    records)
+    pmt_records, pmt_keys  = _sort_by_peak(pmt_records)
+    peak_keys  , starts    = np.unique(keys, return_index=True)
+    stops                  = np.append(starts[1:], len(keys))
+    pmt_starts             = np.searchsorted(pmt_keys, peak_keys, side= "left")
+    pmt_stops              = np.searchsorted(pmt_keys, peak_keys, side="right")
+
+    events   = records["event"][starts]
+    times    = np.ascontiguousarray(records["time"])
+    widths   = np.ascontiguousarray(records["bwidth"]) if "bwidth" in records.dtype.names else None
+    pmt_ids  = np.ascontiguousarray(pmt_records["npmt"])
+    pmt_enes = np.ascontiguousarray(pmt_records["ene" ])
+
+    if sipm_records is None:
+        sipm_starts = sipm_stops = np.zeros_like(starts)
+    else:
+        sipm_records, sipm_keys = _sort_by_peak(sipm_records)
+        sipm_starts = np.searchsorted(sipm_keys, peak_keys, side= "left")
+        sipm_stops  = np.searchsorted(sipm_keys, peak_keys, side="right")
+        sipm_ids    = np.ascontiguousarray(sipm_records["nsipm"])
+        sipm_enes   = np.ascontiguousarray(sipm_records["ene"  ])
+
+    peak_type = S1 if sipm_records is None else S2
+    for i, event in enumerate(events):
+        peak_times = times[starts[i]:stops[i]]
+        n_times    = peak_times.size
+        if widths is None: peak_widths = _bin_widths_from_times(peak_times)
+        else             : peak_widths =       widths[starts[i]:stops[i]]
+
+        pmt_slice = slice(pmt_starts[i], pmt_stops[i])
+        pmt_r     = PMTResponses( pmt_ids [pmt_slice][::n_times]
+                                , pmt_enes[pmt_slice].reshape(-1, n_times))
+
+        if sipm_starts[i] == sipm_stops[i]:
+            sipm_r = SiPMResponses.build_empty_instance()
+        else:
+            sipm_slice = slice(sipm_starts[i], sipm_stops[i])
+            sipm_r     = SiPMResponses( sipm_ids [sipm_slice][::n_times]
+                                      , sipm_enes[sipm_slice].reshape(-1, n_times))
+
+        yield event, peak_type(peak_times, peak_widths, pmt_r, sipm_r)
+
+
+def load_pmaps_lazy(filename, skip=0, n=None, chunk_size=100_000):
     """
     Read pmaps from file lazily.
 
@@ -294,11 +420,14 @@ def load_pmaps_lazy(filename, skip=0, n=None):
     n: int or None, optional
       How many events to read (defaults to all).
 
+    chunk_size: int, optional
+      Number of rows read at once from each table (default 100000).
+
     Returns
     -------
     An iterator of dict[event_number, PMap].
     """
-    for (s1df, s2df, sidf, s1pmtdf, s2pmtdf) in load_pmaps_as_df_lazy(filename, skip, n):
+    for (s1df, s2df, sidf, s1pmtdf, s2pmtdf) in load_pmaps_as_df_lazy(filename, skip, n, chunk_size):
         # Hack fix to allow loading pmaps without individual pmts
         if s1pmtdf is None: s1pmtdf = _build_ipmtdf_from_sumdf(s1df)
         if s2pmtdf is None: s2pmtdf = _build_ipmtdf_from_sumdf(s2df)
@@ -310,23 +439,27 @@ def load_pmaps_lazy(filename, skip=0, n=None):
         yield event_number, PMap(s1s, s2s)
 
 
+def _bin_widths_from_times(times):
+    ## Old file without bin widths saved
+    ## Calculate 'fake' widths from times
+    time_diff = np.diff(times)
+    if len(time_diff) == 0:
+        return np.full(1, 1000)
+    elif np.all(time_diff == time_diff[0]):
+        ## S1-like
+        return np.full(times.shape, time_diff[0])
+    else:
+        ## S2-like, round to closest mus
+        binw = time_diff.max().round(-3)
+        return np.full(times.shape, binw)
+
+
 def build_pmt_responses(pmtdf, ipmtdf):
     times = pmtdf.time.values
     try:
         widths = pmtdf.bwidth.values
     except AttributeError:
-        ## Old file without bin widths saved
-        ## Calculate 'fake' widths from times
-        time_diff = np.diff(times)
-        if len(time_diff) == 0:
-            widths = np.full(1, 1000)
-        elif np.all(time_diff == time_diff[0]):
-            ## S1-like
-            widths = np.full(times.shape, time_diff[0])
-        else:
-            ## S2-like, round to closest mus
-            binw = time_diff.max().round(-3)
-            widths = np.full(times.shape, binw)
+        widths = _bin_widths_from_times(times)
     pmt_ids = pd.unique(ipmtdf.npmt.values)
     enes    =           ipmtdf.ene .values.reshape(pmt_ids.size,
                                                      times.size)
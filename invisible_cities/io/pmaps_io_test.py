@@ -332,6 +332,31 @@ def test_load_pmaps_as_df_lazy_subset(KrMC_pmaps_filename, skip, nread):
         assert df.event.nunique() == nread
 
 
+@mark.parametrize("chunk_size", (1, 7, 1000))
+def test_load_pmaps_as_df_lazy_chunk_size(two_pmaps, chunk_size):
+    """Ensure the output does not depend on how the tables are chunked"""
+    filename, _, true_dfs = two_pmaps
+    dfs_lazy = pmpio.load_pmaps_as_df_lazy(filename, chunk_size=chunk_size)
+    dfs_lazy = [pd.concat(node_dfs, ignore_index=True) for node_dfs in zip(*dfs_lazy)]
+
+    for df_lazy, true_df in zip(dfs_lazy, true_dfs):
+        assert_dataframes_equal(df_lazy, true_df)
+
+
+@mark.parametrize("chunk_size", (1, 1000))
+def test_read_table_by_event(two_pmaps, chunk_size):
+    filename, _, _ = two_pmaps
+    with tb.open_file(filename) as file:
+        table  = file.root.PMAPS.S2Si
+        groups = list(pmpio.read_table_by_event(table, chunk_size))
+        events = table.read(field="event")
+
+    assert [event for event, _ in groups] == pd.unique(events).tolist()
+    for event, records in groups:
+        assert np.all(records["event"] == event)
+        assert len(records) == np.count_nonzero(events == event)
+
+
 def test_load_pmaps_as_df(KrMC_pmaps_filename):
     """Ensure the output of the function is the expected one"""
     eager = pmpio.load_pmaps_as_df(KrMC_pmaps_filename, lazy=False)
@@ -369,6 +394,42 @@ def test_load_pmaps_eager(two_pmaps, output_tmpdir):
         assert_PMap_equality(read_pmaps[key], true_pmap)
 
 
+def test_load_pmaps_eager_without_ipmt(two_pmaps, output_tmpdir):
+    filename, _, _ = two_pmaps
+    filename_noipmt = os.path.join(output_tmpdir, "two_pmaps_without_ipmt.h5")
+    shutil.copy(filename, filename_noipmt)
+    with tb.open_file(filename_noipmt, "a") as file:
+        file.remove_node(file.root.PMAPS.S1Pmt)
+        file.remove_node(file.root.PMAPS.S2Pmt)
+
+    read_pmaps = pmpio.load_pmaps_eager(filename_noipmt)
+    s1df, s2df, sidf, _, _ = pmpio.load_pmaps_as_df_eager(filename_noipmt)
+    for event, pmap in read_pmaps.items():
+        s1s = pmpio.s1s_from_df( s1df[s1df.event == event]
+                               , pmpio._build_ipmtdf_from_sumdf(s1df[s1df.event == event]))
+        s2s = pmpio.s2s_from_df( s2df[s2df.event == event]
+                               , pmpio._build_ipmtdf_from_sumdf(s2df[s2df.event == event])
+                               , sidf[sidf.event == event])
+        assert_PMap_equality(pmap, PMap(s1s, s2s))
+
+
+def test_peaks_from_records_does_not_depend_on_row_order(two_pmaps):
+    filename, true_pmaps, _ = two_pmaps
+    with tb.open_file(filename) as file:
+        s2, s2pmt, si = (table.read() for table in (file.root.PMAPS.S2, file.root.PMAPS.S2Pmt, file.root.PMAPS.S2Si))
+
+    # reverse the order of the events, keeping the order of the rows within each event
+    reverse = lambda records: np.concatenate([records[records["event"] == event]
+                                              for event in sorted(set(records["event"]))[::-1]])
+    s2s = pmpio.peaks_from_records(reverse(s2), reverse(s2pmt), reverse(si))
+    s2s = [(event, s2) for event, s2 in s2s]
+
+    assert [event for event, _ in s2s] == sorted(event for event, pmap in true_pmaps.items() for _ in pmap.s2s)
+    for event in true_pmaps:
+        read_s2s = [s2 for evt, s2 in s2s if evt == event]
+        assert_PMap_equality(PMap([], read_s2s), PMap([], true_pmaps[event].s2s))
+
+
 def test_load_pmaps_lazy(KrMC_pmaps_filename):
     """Ensure the lazy and non-lazy versions provide the same result"""
     pmaps_eager = pmpio.load_pmaps_eager(KrMC_pmaps_filename)
@@ -13,6 +13,9 @@ from functools import reduce
 from scipy                  import interpolate
 from scipy.signal           import fftconvolve
 from scipy.signal           import convolve
+from scipy.fft              import rfftn
+from scipy.fft              import irfftn
+from scipy.fft              import next_fast_len
 from scipy.spatial.distance import cdist
 from scipy.spatial          import cKDTree
 from scipy                  import ndimage as ndi
@@ -404,6 +407,192 @@ def deconvolve(n_iterations         : int,
     return deconvolve
 
 
+@check_annotations
+def deconvolve_batch(n_iterations         : int,
+                     iteration_tol        : float,
+                     sample_width         : Tuple2Dor3D,
+                     det_grid             : List[np.ndarray],
+                     satellite_start_iter : Union[int, NoneType],
+                     satellite_max_size   : int,
+                     e_cut                : float,
+                     cut_type             : Optional[CutType]   = CutType.abs,
+                     inter_method         : InterpolationMethod = InterpolationMethod.cubic,
+                     workers              : Optional[int]       = None,
+                     psf_cache_size       : int                 = 32
+                     ) -> Callable:
+    """
+    Same as `deconvolve`, but the returned function deconvolves several
+    sets of data that share the same PSF at once using
+    `richardson_lucy_batch`. The spectra of the last `psf_cache_size`
+    PSF and FFT shape combinations are cached across calls. Each entry
+    takes about 16 bytes per voxel of the zero-padded FFT grid, e.g.
+    ~1 MB for a 250x250 grid or ~40 MB for a 250x250x40 one, so the
+    cache size should be lowered for large 3D deconvolutions.
+
+    Parameters
+    ----------
+    data    : Sequence with the sensor (hits) position points of each image.
+    weight  : Sequence with the sensor charge of each image.
+    psf     : Point-spread function, common to all images.
+
+    Initialization parameters:
+        Same as `deconvolve`, plus
+        workers        : Number of workers used in the FFTs (see `scipy.fft`).
+        psf_cache_size : Maximum number of PSF spectra kept in the cache.
+
+    Returns
+    -------
+    A list with a tuple (deconv_image, inter_pos) for each image.
+    """
+    var_name     = np.array(['xr', 'yr', 'zr'])
+    deconv_input = deconvolution_input(sample_width, det_grid, inter_method)
+    psf_cache    = {}
+
+    def deconvolve_batch(data   : List[Tuple[np.ndarray, ...]],
+                         weight : List[np.ndarray],
+                         psf    : pd.DataFrame
+                        ) -> List[Tuple[np.ndarray, Tuple[np.ndarray, ...]]]:
+
+        inputs                  = [deconv_input(d, w) for d, w in zip(data, weight)]
+        inter_signals, inter_pos = zip(*inputs)
+
+        columns       = var_name[:len(data[0])]
+        psf_deco      = psf.factor.values.reshape(psf.loc[:, columns].nunique().values)
+        deconv_images = richardson_lucy_batch(inter_signals, psf_deco, satellite_start_iter,
+                                              satellite_max_size, e_cut, cut_type,
+                                              n_iterations, iteration_tol,
+                                              workers = workers, psf_cache = psf_cache,
+                                              psf_cache_size = psf_cache_size)
+
+        return [(np.nan_to_num(image), pos) for image, pos in zip(deconv_images, inter_pos)]
+
+    return deconvolve_batch
+
+
+def psf_spectra(psf       : np.ndarray,
+                fft_shape : Tuple[int, ...],
+                cache     : Optional[dict] = None,
+                workers   : Optional[int]  = None,
+                max_size  : Optional[int]  = None
+                ) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Fourier transforms of a PSF and its mirror image, zero-padded to
+    `fft_shape`. If a cache (dict) is given, the result is stored in
+    it and reused for the same PSF and shape. If `max_size` is given,
+    the least recently used entries are dropped to keep at most
+    `max_size` entries in the cache.
+    """
+    key = psf.shape, psf.tobytes(), fft_shape
+    if cache is not None and key in cache:
+        cache[key] = cache.pop(key) # mark as most recently used
+        return cache[key]
+
+    s          = slice(None, None, -1)
+    psf_mirror = psf[(s,) * psf.ndim]
+    spectra    = ( rfftn(psf       , fft_shape, workers=workers)
+                 , rfftn(psf_mirror, fft_shape, workers=workers))
+
+    if cache is not None:
+        cache[key] = spectra
+        while max_size is not None and len(cache) > max_size:
+            del cache[next(iter(cache))]
+    return spectra
+
+
+def richardson_lucy_batch(images, psf, satellite_start_iter, satellite_max_size, e_cut, cut_type,
+                          iterations=50, iter_thr=0., workers=None, psf_cache=None, psf_cache_size=None):
+    """Richardson-Lucy deconvolution of several images with the same PSF.
+
+    Equivalent to applying `richardson_lucy` to each image, but all
+    images are processed together: they are zero-padded to a common
+    shape and stacked, and the convolutions of the whole stack are
+    computed with a single FFT of a size suitable for fast transforms.
+    The PSF spectra can be cached across calls with `psf_cache`.
+
+    The padding does not alter the result: the deconvolved image is
+    kept at zero outside of the original image, so it does not
+    contribute to the convolutions. The satellite killer and the
+    stopping threshold are applied to each image separately, and
+    images that reach the threshold are not iterated any further.
+
+    Parameters
+    ----------
+    images    : sequence of ndarrays
+       Input degraded images (can be N dimensional), possibly with
+       different shapes.
+    psf       : ndarray
+       The point spread function.
+    workers   : int, optional
+       Number of workers used in the FFTs (see `scipy.fft`).
+    psf_cache : dict, optional
+       Cache for the PSF spectra.
+    psf_cache_size : int, optional
+       Maximum number of entries kept in `psf_cache` (see `psf_spectra`).
+
+    The rest of the parameters are the same as in `richardson_lucy`.
+
+    Returns
+    -------
+    im_deconv : list of ndarrays
+       The deconvolved images.
+    """
+    if not len(images): return []
+
+    images    = [image.astype(float) for image in images]
+    psf       = psf.astype(float)
+    shape     = tuple(np.max([image.shape for image in images], axis=0))
+    fft_shape = tuple(next_fast_len(n + k - 1, real=True) for n, k in zip(shape, psf.shape))
+    axes      = tuple(range(1, psf.ndim + 1))
+
+    spectrum, spectrum_mirror = psf_spectra(psf, fft_shape, psf_cache, workers, psf_cache_size)
+
+    # region of the full convolution that corresponds to the 'same' mode
+    same = (slice(None),) + tuple(slice((k - 1) // 2, (k - 1) // 2 + n) for n, k in zip(shape, psf.shape))
+    def convolve_stack(stack, spectrum):
+        stack_spectrum = rfftn(stack, fft_shape, axes=axes, workers=workers)
+        return irfftn(stack_spectrum * spectrum, fft_shape, axes=axes, workers=workers)[same]
+
+    regions   = [tuple(map(slice, image.shape)) for image in images]
+    padded    = np.zeros((len(images),) + shape)
+    im_deconv = np.zeros((len(images),) + shape)
+    for k, (image, region) in enumerate(zip(images, regions)):
+        padded   [(k,) + region] = image
+        im_deconv[(k,) + region] = 0.5
+
+    eps        = np.finfo(float).eps ### Protection against 0 value
+    ref_images = [image / image.max() for image in images]
+    active     = np.arange(len(images))
+
+    for i in range(iterations):
+        current = im_deconv[active]
+        x = convolve_stack(current, spectrum)
+        np.place(x, x==0, eps) ### Protection against 0 value
+        relative_blur = padded[active] / x
+        current *= convolve_stack(relative_blur, spectrum_mirror)
+
+        converged = np.zeros(active.size, dtype=bool)
+        for j, k in enumerate(active):
+            image = current[j][regions[k]]
+
+            # if satellite parameters are provided kill satellites after each iteration.
+            if satellite_start_iter is not None and i >= satellite_start_iter:
+                sat_mask = generate_satellite_mask(image, satellite_max_size, e_cut, cut_type)
+                image[sat_mask] = 0
+
+            with np.errstate(divide='ignore', invalid='ignore'):
+                rel_diff = np.nansum(np.divide(((image/image.max() - ref_images[k])**2), ref_images[k]))
+            if rel_diff < iter_thr: ### Stop iterating this image if a given threshold is reached.
+                converged[j] = True
+
+            ref_images[k] = image/image.max()
+
+        im_deconv[active] = current
+        active            = active[~converged]
+        if not active.size: break
+
+    return [im_deconv[(k,) + region] for k, region in enumerate(regions)]
+
+
 def richardson_lucy(image, psf, satellite_start_iter, satellite_max_size, e_cut, cut_type, iterations=50, iter_thr=0.):
     """Richardson-Lucy deconvolution (modification from scikit-image package).
 
@@ -20,6 +20,8 @@ from .. reco    .deconv_functions import interpolate_signal
 from .. reco    .deconv_functions import deconvolution_input
 from .. reco    .deconv_functions import deconvolve
 from .. reco    .deconv_functions import richardson_lucy
+from .. reco    .deconv_functions import richardson_lucy_batch
+from .. reco    .deconv_functions import psf_spectra
 from .. reco    .deconv_functions import generate_satellite_mask
 from .. reco    .deconv_functions import collect_component_sizes
 from .. reco    .deconv_functions import no_satellite_killer
@@ -317,6 +319,65 @@ def test_richardson_lucy(data_hdst, data_hdst_deconvolved):
     assert np.allclose(ref_interpolation['e_deco'], deco.flatten())
 
 
+@mark.parametrize("satellite_start_iter iter_thr".split(), ((None, 0   ),
+                                                            (None, 1e-3),
+                                                            (   5, 0   ),
+                                                            (   5, 1e-3)))
+@mark.parametrize("psf_shape images_shape".split(), (((7, 7   ), ((10, 12   ), (15, 9   ), (5, 5   ))),
+                                                    ((6, 8   ), ((10, 12   ), (15, 9   )           )),
+                                                    ((4, 5, 3), (( 8,  9, 7), ( 6, 6, 6)           ))))
+def test_richardson_lucy_batch_same_as_richardson_lucy(psf_shape, images_shape, satellite_start_iter, iter_thr):
+    rng    = np.random.default_rng(12345)
+    psf    = rng.random(psf_shape)
+    psf   /= psf.sum()
+    images = [rng.random(shape) for shape in images_shape]
+    params = dict(satellite_start_iter = satellite_start_iter,
+                  satellite_max_size   = 3,
+                  e_cut                = 0.2,
+                  cut_type             = CutType.rel,
+                  iterations           = 20,
+                  iter_thr             = iter_thr)
+
+    batch = richardson_lucy_batch(images, psf, **params)
+
+    assert len(batch) == len(images)
+    for image, deco in zip(images, batch):
+        expected = richardson_lucy(image, psf, **params)
+        assert deco.shape == image.shape
+        assert np.allclose(deco, expected, rtol=1e-8, atol=1e-12)
+
+
+def test_richardson_lucy_batch_empty():
+    assert richardson_lucy_batch([], np.ones((3, 3)), **no_satellite_killer) == []
+
+
+def test_psf_spectra_cache():
+    psf   = np.random.default_rng(1).random((5, 5))
+    cache = {}
+
+    spectra = psf_spectra(psf, (16, 16), cache)
+    assert len(cache) == 1
+    assert psf_spectra(psf, (16, 16), cache) is spectra
+
+    psf_spectra(psf, (18, 16), cache)
+    assert len(cache) == 2
+
+
+def test_psf_spectra_cache_max_size():
+    psf   = np.random.default_rng(1).random((5, 5))
+    cache = {}
+
+    spectra = psf_spectra(psf, (16, 16), cache, max_size=2)
+    psf_spectra(psf, (18, 16), cache, max_size=2)
+    assert psf_spectra(psf, (16, 16), cache, max_size=2) is spectra
+
+    # (18, 16) is the least recently used entry and is dropped
+    psf_spectra(psf, (20, 16), cache, max_size=2)
+    assert len(cache) == 2
+    assert psf_spectra(psf, (16, 16), cache, max_size=2) is spectra
+    assert [key[-1] for key in cache] == [(20, 16), (16, 16)]
+
+
 def test_grid_binning(data_hdst, data_hdst_deconvolved):
     hdst   = load_dst(data_hdst, 'RECO', 'Events')
     h      = hdst[(hdst.event == 3021916) & (hdst.npeak == 0)]
@@ -10,6 +10,11 @@ from .. types.ic_types import NN
 
 EPSILON = np.finfo(np.float64).eps
 
+# DBSCAN radius of the hit clustering, in units of the scaled hit
+# separation. It is fixed to a value a bit higher of √3 to retain
+# diagonal neighbours in the same cluster
+DBSCAN_EPS = 1.8
+
 
 def e_from_q(qs: np.ndarray, e: float) -> np.ndarray:
     """
@@ -69,6 +74,56 @@ def sipms_above_threshold(xys: np.ndarray, qs: np.ndarray, thr:float, energy: fl
     return xs, ys, qs, es
 
 
+def sipms_above_threshold_in_slices(xys: np.ndarray, qs: np.ndarray, thr:float, energies: np.ndarray):
+    """
+    Same as `sipms_above_threshold` applied to each slice of a peak,
+    but computed for all slices at once. The hits are ordered by slice
+    and, within each slice, by SiPM. Slices without SiPMs above
+    threshold produce a single NN hit carrying the slice energy.
+
+    Parameters
+    ----------
+    xys: np.ndarray, shape (n,2)
+        SiPM positions
+    qs: np.ndarray, shape (m,n)
+        Charge of each SiPM in each slice.
+    thr: float
+        Threshold on SiPM charge.
+    energies: np.ndarray, shape (m,)
+        Energy of each slice to be shared among its hits.
+
+    Returns
+    -------
+    slices: np.ndarray, shape (k,)
+        Slice index of each hit
+    xs: np.ndarray, shape (k,)
+        x positions of the hits
+    ys: np.ndarray, shape (k,)
+        y positions of the hits
+    qs: np.ndarray, shape (k,)
+        Charge of the hits
+    es: np.ndarray, shape (k,)
+        Associated energy of each hit
+    """
+    qs       = np.asarray(qs, dtype=float).reshape(len(energies), len(xys))
+    energies = np.asarray(energies, dtype=float)
+    over_thr = qs >= thr
+    empty    = ~np.any(over_thr, axis=1)
+
+    # column 0 stands for the NN hit of the empty slices
+    slices, sipms = np.nonzero(np.column_stack([empty, over_thr]))
+    xys_nn        = np.vstack([[NN, NN], xys]).astype(float)
+    qs_nn         = np.column_stack([np.full(len(qs), float(NN)), qs])
+    q_slice       = np.where(over_thr, qs, 0).sum(axis=1)
+
+    xs = xys_nn[sipms, 0]
+    ys = xys_nn[sipms, 1]
+    qs = qs_nn [slices, sipms]
+    es = np.where( sipms == 0, energies[slices]
+                 , qs * energies[slices] / (q_slice[slices] + EPSILON))
+    return slices, xs, ys, qs, es
+
+
 def merge_NN_hits(hits: pd.DataFrame, same_peak: bool = True) -> pd.DataFrame:
     """
     Finds NN hits (defined as hits with Q=NN) and removes them without energy
@@ -114,26 +169,70 @@ def merge_NN_hits(hits: pd.DataFrame, same_peak: bool = True) -> pd.DataFrame:
     # hits may or may not have Ec, consider both cases
     has_ec  = "Ec" in hits.columns
     columns = "E Ec".split() if has_ec else ["E"]
-    corrections = pd.DataFrame(dict(zip(columns, (0,0))), dtype=float, index=hits.index.values)
-    for _, nn_hit in nn_hits.iterrows():
-        candidates = hits.loc[hits.npeak == nn_hit.npeak] if same_peak else hits
-        if len(candidates) == 0: continue # drop hit !!! dangerous
-
-        # find closest hit or hits
-        dz      = np.abs(candidates.Z - nn_hit.Z)
-        closest = candidates.loc[np.isclose(dz, dz.min())]
-        index   = closest.index
-
-        # redistribute energy proportionally to the receiving hits' energy
-        # corrections are accumulated to make this process order insentitive
-        corr_e      = nn_hit.E  * closest.E  / closest.E .sum()
-        if has_ec:
-            corr_ec = nn_hit.Ec * closest.Ec / closest.Ec.sum()
-        corrs = [corr_e, corr_ec] if has_ec else [corr_e]
-        corrections.loc[index, columns] += np.stack(corrs, axis=1)
+
+    # sort the receiving hits by (peak, Z), keeping the original order
+    # within each slice, and find the boundaries of each slice
+    hit_peak = hits   .npeak.values if same_peak else np.zeros(len(hits)   , dtype=int)
+    nn_peak  = nn_hits.npeak.values if same_peak else np.zeros(len(nn_hits), dtype=int)
+    hit_z    = hits.Z.values
+    order    = np.lexsort((hit_z, hit_peak))
+    peak_s   = hit_peak[order]
+    z_s      = hit_z   [order]
+    new_sl   = np.ones(len(order), dtype=bool)
+    new_sl[1:] = (peak_s[1:] != peak_s[:-1]) | (z_s[1:] != z_s[:-1])
+    sl_start = np.flatnonzero(new_sl)
+    sl_stop  = np.append(sl_start[1:], len(order))
+    sl_peak  = peak_s[sl_start]
+    sl_z     = z_s   [sl_start]
+
+    # pair each NN hit with the slices in a window around the closest
+    # one, found with a binary search within its peak. The window is
+    # slightly wider than the tolerance of np.isclose, which is used
+    # afterwards to select the closest slice or slices exactly.
+    nn_z    = nn_hits.Z.values
+    pair_nn = []
+    pair_sl = []
+    for peak in np.unique(nn_peak):
+        nn_index       = np.flatnonzero(nn_peak == peak)
+        first, last    = np.searchsorted(sl_peak, peak, side="left"), np.searchsorted(sl_peak, peak, side="right")
+        if first == last: continue # drop hits !!! dangerous
+
+        zs   = sl_z[first:last]
+        z    = nn_z[nn_index]
+        i    = np.searchsorted(zs, z)
+        dz   = np.minimum( np.abs(zs[np.clip(i - 1, 0, len(zs) - 1)] - z)
+                         , np.abs(zs[np.clip(i    , 0, len(zs) - 1)] - z))
+        w    = dz + 2 * (1e-8 + 1e-5 * dz)
+        lo   = np.searchsorted(zs, z - w, side="left" )
+        hi   = np.searchsorted(zs, z + w, side="right")
+        n    = hi - lo
+        nn_i = np.repeat(nn_index, n)
+        sl_i = np.repeat(lo - np.cumsum(n) + n, n) + np.arange(n.sum())
+
+        closest = np.isclose(np.abs(zs[sl_i] - nn_z[nn_i]), np.repeat(dz, n))
+        pair_nn.append(nn_i       [closest])
+        pair_sl.append(sl_i[closest] + first)
+
+    if not pair_nn: return hits
+    pair_nn = np.concatenate(pair_nn)
+    pair_sl = np.concatenate(pair_sl)
+
+    # expand each (NN hit, slice) pair to the hits in the slice
+    n       = sl_stop[pair_sl] - sl_start[pair_sl]
+    recv_nn = np.repeat(pair_nn, n)
+    recv    = order[np.repeat(sl_start[pair_sl] - np.cumsum(n) + n, n) + np.arange(n.sum())]
+
+    # redistribute energy proportionally to the receiving hits' energy
+    # corrections are accumulated to make this process order insentitive
+    corrections = np.zeros((len(hits), len(columns)))
+    for j, column in enumerate(columns):
+        e_recv  = hits   [column].values[recv]
+        e_nn    = nn_hits[column].values
+        e_total = np.bincount(recv_nn, weights=e_recv, minlength=len(nn_hits))
+        np.add.at(corrections[:, j], recv, e_nn[recv_nn] * e_recv / e_total[recv_nn])
 
     # apply correction factors based on original charge values
-    hits.loc[:, columns] += corrections.values
+    hits.loc[:, columns] += corrections
     return hits
 
 
@@ -278,9 +377,7 @@ def tag_hits_in_event(event_hits   : pd.DataFrame
     coords[:, :2] /= scale_xy
     coords[:, 2]  /= scale_z
 
-    # eps parameter is fixed to a value a bit higher of √3
-    # to retain diagonal neighbours in the same cluster
-    labels = DBSCAN(eps=1.8, min_samples=min_samples).fit_predict(coords)
+    labels = DBSCAN(eps=DBSCAN_EPS, min_samples=min_samples).fit_predict(coords)
     event_hits['cluster'] = labels
 
     return event_hits
@@ -293,8 +390,13 @@ def cluster_tagger(df_hits      : pd.DataFrame
                   , scale_z     : float
                   ) -> pd.DataFrame:
     """
-    This function groups the input DataFrame by 'event' and applies the
-    `tag_hits_in_event` function to each event's group of hits.
+    Applies DBSCAN clustering to the hits of each event in the input
+    DataFrame, as `tag_hits_in_event` does, but clustering all events
+    in a single DBSCAN call. The events are placed at different values
+    of a fourth coordinate, separated by more than the DBSCAN radius,
+    so that hits of different events are never neighbours while the
+    distances within each event are unchanged. The cluster labels are
+    then renumbered from 0 in each event.
 
     Parameters
     ----------
@@ -306,18 +408,31 @@ def cluster_tagger(df_hits      : pd.DataFrame
     Returns
     -------
     pd.DataFrame
-        The input DataFrame with an added 'cluster' column indicating the
-        cluster label for each hit (-1 for noise).
+        The input DataFrame, sorted by event, with an added 'cluster' column
+        indicating the cluster label for each hit (-1 for noise).
     """
     if df_hits.empty:
         return df_hits.assign(cluster=pd.Series(dtype=int))
 
-    df_clustered = (df_hits.groupby('event')
-                           .apply( tag_hits_in_event
-                                 , min_samples = min_samples
-                                 , scale_xy    = scale_xy
-                                 , scale_z     = scale_z )
-                           .reset_index(level=1, drop=True)
-                           .reset_index())
+    columns = ["event"] + [c for c in df_hits.columns if c != "event"]
+    df      = df_hits.iloc[np.argsort(df_hits.event.to_numpy(), kind="stable")]
+
+    coords = df[['X', 'Y', 'Z']].to_numpy().copy()
+    coords[:, :2] /= scale_xy
+    coords[:, 2]  /= scale_z
+
+    event   = df.event.to_numpy()
+    starts  = np.concatenate([[0], np.flatnonzero(np.diff(event)) + 1])
+    nhits   = np.diff(np.append(starts, len(df)))
+    if len(starts) > 1:
+        event_coord = np.repeat(np.arange(len(starts)) * 2 * DBSCAN_EPS, nhits)
+        coords      = np.column_stack([coords, event_coord])
+
+    labels = DBSCAN(eps=DBSCAN_EPS, min_samples=min_samples).fit_predict(coords)
+
+    # clusters are numbered consecutively across events
+    clustered = labels >= 0
+    first     = np.minimum.reduceat(np.where(clustered, labels, np.iinfo(labels.dtype).max), starts)
+    labels    = np.where(clustered, labels - np.repeat(first, nhits), labels)
 
-    return df_clustered.set_index(df_hits.index)
+    return df[columns].assign(cluster=labels).set_index(df_hits.index)
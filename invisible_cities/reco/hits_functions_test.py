@@ -11,7 +11,9 @@ from   .  hits_functions       import e_from_q
 from   .  hits_functions       import merge_NN_hits
 from   .  hits_functions       import threshold_hits
 from   .  hits_functions       import sipms_above_threshold
+from   .  hits_functions       import sipms_above_threshold_in_slices
 from   .  hits_functions       import cluster_tagger
+from   .  hits_functions       import tag_hits_in_event
 from hypothesis                import given
 from hypothesis.strategies     import lists
 from hypothesis.strategies     import floats
@@ -123,6 +125,21 @@ def test_sipms_above_threshold_thr_too_high_produces_NN():
     assert out[2][0] == NN
     assert out[3][0] == e  # conserves energy
 
+@given(integers(1, 20), integers(0, 10), integers(0, 1000))
+def test_sipms_above_threshold_in_slices_same_as_per_slice(nslices, nsipms, seed):
+    rng = np.random.default_rng(seed)
+    xys = rng.uniform(-100, 100, size=(nsipms, 2))
+    qs  = rng.uniform(   0,  10, size=(nslices, nsipms))
+    es  = rng.uniform(   1, 100, size= nslices)
+    thr = 5
+
+    slices, *got = sipms_above_threshold_in_slices(xys, qs, thr, es)
+    expected     = [sipms_above_threshold(xys, q, thr, e) for q, e in zip(qs, es)]
+
+    assert_almost_equal(slices, np.repeat(np.arange(nslices), [len(x[0]) for x in expected]))
+    for i, item in enumerate(got):
+        assert_almost_equal(item, np.concatenate([x[i] for x in expected]))
+
 @given(list_of_hits())
 def test_merge_NN_does_not_modify_input(hits):
     hits_org = deepcopy(hits)
@@ -143,6 +160,38 @@ def test_merge_nn_hits_does_not_leave_nn_hits(hits):
     assert all(hits_merged.Q != NN)
 
 
+@mark.parametrize("same_peak", (True, False))
+def test_merge_nn_hits_splits_ties_proportionally(same_peak):
+    # the NN hit at Z=3 is equidistant to the slices at Z=2 and Z=4 of
+    # its peak. With same_peak=False, the closest slice is the one at
+    # Z=3 from the other peak.
+    hits = pd.DataFrame(dict( npeak = [ 0 , 0 , 0 , 0 , 1 ]
+                            , Z     = [ 2., 2., 4., 3., 3.]
+                            , Q     = [ 1., 1., 1., NN, 1.]
+                            , E     = [ 1., 2., 3., 6., 5.]
+                            , Ec    = [ 2., 2., 4., 8., 1.]))
+    merged = merge_NN_hits(hits, same_peak=same_peak)
+
+    assert merged.index.tolist() == [0, 1, 2, 4]
+    if same_peak:
+        assert_almost_equal(merged.E .values, [2., 4., 6., 5.])
+        assert_almost_equal(merged.Ec.values, [4., 4., 8., 1.])
+    else:
+        assert_almost_equal(merged.E .values, [1., 2., 3., 11.])
+        assert_almost_equal(merged.Ec.values, [2., 2., 4.,  9.])
+
+
+def test_merge_nn_hits_drops_nn_hits_without_candidates():
+    hits = pd.DataFrame(dict( npeak = [ 0 , 1 ]
+                            , Z     = [ 2., 3.]
+                            , Q     = [ 1., NN]
+                            , E     = [ 1., 6.]))
+    merged = merge_NN_hits(hits)
+
+    assert merged.index.tolist() == [0]
+    assert_almost_equal(merged.E.values, [1.])
+
+
 @given(list_of_hits(), floats())
 def test_threshold_hits_does_not_modify_input(hits, th):
     hits_org = deepcopy(hits)
@@ -217,6 +266,22 @@ def test_cluster_tagger_new_column_validity(df):
     assert pd.api.types.is_integer_dtype(df_result.cluster), "'cluster' column is not of integer type."
     assert not df_result.cluster.isna().any(), "'cluster' column contains NaN values."
 
+
+@given(df=gen_cluster_df)
+@settings(deadline=None)
+def test_cluster_tagger_same_as_tag_hits_in_event(df):
+    """
+    Verifies that clustering all events at once gives the same labels
+    as clustering each event on its own.
+    """
+    params    = dict(min_samples=2, scale_xy=100.0, scale_z=200.0)
+    df_result = cluster_tagger(df.copy(), **params)
+
+    for event, hits in df.groupby("event"):
+        expected = tag_hits_in_event(hits.copy(), **params).cluster.to_numpy()
+        assert np.array_equal(df_result[df_result.event == event].cluster.to_numpy(), expected)
+
+
 def test_cluster_tagger_row_alignment():
     """
     Verifies that the correct cluster label is assigned to the correct hit,
@@ -7,6 +7,9 @@ import pandas   as pd
 import networkx as nx
 
 from networkx           import Graph
+from scipy.spatial      import cKDTree
+from scipy.sparse       import csr_matrix
+from scipy.sparse.csgraph import dijkstra
 from .. evm.event_model import Voxel
 from .. core.exceptions import NoHits
 from .. core.exceptions import NoVoxels
@@ -95,13 +98,24 @@ def voxelize_hits(hits             : pd.DataFrame,
                               for coords, bins, n in zip(xyz.T, edges, number_of_voxels)
                             ]).T
 
+    # group the hits by voxel: sort them once by their flat voxel index
+    # and find the range of hits of each voxel with a binary search.
+    # The sort is stable, so the hits keep their relative order within
+    # each voxel, and each voxel holds a slice of the sorted hits.
+    flat_hit_indices   = np.ravel_multi_index(hits_indices.T, number_of_voxels)
+    order              = np.argsort(flat_hit_indices, kind="stable")
+    flat_hit_indices   = flat_hit_indices[order]
+    sorted_hits        = hits.iloc[order]
+
+    voxel_indices      = np.nonzero(E)
+    flat_voxel_indices = np.ravel_multi_index(voxel_indices, number_of_voxels)
+    starts             = np.searchsorted(flat_hit_indices, flat_voxel_indices, side= "left")
+    stops              = np.searchsorted(flat_hit_indices, flat_voxel_indices, side="right")
+
     voxels = []
     true_dimensions = np.array([size_x[0], size_y[0], size_z[0]])
-    for indices_voxel in np.stack(np.nonzero(E)).T:
-        x, y, z     = indices_voxel
-        indices     = np.where(np.all(hits_indices == indices_voxel, axis=1))[0]
-        hits_in_bin = hits.iloc[indices]
-
+    for x, y, z, start, stop in zip(*voxel_indices, starts, stops):
+        hits_in_bin = sorted_hits.iloc[start:stop]
         voxels.append(Voxel(cx[x], cy[y], cz[z], E[x,y,z], true_dimensions, hits_in_bin, energy_type))
 
     return voxels
@@ -111,6 +125,38 @@ def neighbours(va : Voxel, vb : Voxel, contiguity : Contiguity = Contiguity.CORN
     return np.linalg.norm((va.pos - vb.pos) / va.size) < contiguity.value
 
 
+def neighbour_pairs(positions  : np.ndarray,
+                    sizes      : np.ndarray,
+                    contiguity : Contiguity = Contiguity.CORNER) -> Tuple[np.ndarray, np.ndarray]:
+    """Find all pairs of neighbour voxels, given their positions and sizes.
+    Returns the indices (i, j), with i < j, of each pair in the same
+    order as `itertools.combinations`. The neighbourhood criterion is
+    the same as in `neighbours`, with the size of the first voxel of
+    each pair.
+
+    When all voxels have the same size, the candidate pairs are found
+    with a KD-tree in normalized coordinates, so only the voxels within
+    the contiguity radius are compared. Otherwise, all pairs are
+    compared.
+    """
+    n = len(positions)
+    if n > 1 and np.all(sizes == sizes[0]):
+        # slightly larger radius so the exact comparison below decides
+        # the pairs at the boundary
+        radius = contiguity.value * (1 + 1e-6)
+        pairs  = cKDTree(positions / sizes[0]).query_pairs(radius, output_type="ndarray")
+        i, j   = pairs.T if len(pairs) else (np.zeros(0, dtype=int),) * 2
+    else:
+        i, j   = np.triu_indices(n, k=1)
+
+    scaled    = (positions[i] - positions[j]) / sizes[i]
+    neighbour = np.sqrt(np.vecdot(scaled, scaled)) < contiguity.value
+    i, j      = i[neighbour], j[neighbour]
+
+    order = np.lexsort((j, i))
+    return i[order], j[order]
+
+
 def make_track_graphs(voxels           : Sequence[Voxel],
                       contiguity       : Contiguity = Contiguity.CORNER) -> Sequence[Graph]:
     """Create a graph where the voxels are the nodes and the edges are any
@@ -118,12 +164,19 @@ def make_track_graphs(voxels           : Sequence[Voxel],
     neighbours if their distance normalized to their size is smaller
     than a contiguity factor.
     """
+    voxels    = list(voxels)
+    positions = np.array([v.pos  for v in voxels], dtype=float).reshape(-1, 3)
+    sizes     = np.array([np.broadcast_to(v.size, 3) for v in voxels], dtype=float).reshape(-1, 3)
+    i, j      = neighbour_pairs(positions, sizes, contiguity)
+
+    # same as np.linalg.norm applied to each pair
+    displacements = positions[i] - positions[j]
+    distances     = np.sqrt(np.vecdot(displacements, displacements))
 
     voxel_graph = nx.Graph()
     voxel_graph.add_nodes_from(voxels)
-    for va, vb in combinations(voxels, 2):
-        if neighbours(va, vb, contiguity):
-            voxel_graph.add_edge(va, vb, distance = np.linalg.norm(va.pos - vb.pos))
+    voxel_graph.add_edges_from((voxels[a], voxels[b], dict(distance=d))
+                               for a, b, d in zip(i, j, distances))
 
     return tuple(connected_component_subgraphs(voxel_graph))
 
@@ -151,6 +204,110 @@ def shortest_paths(track_graph : Graph) -> Dict[Voxel, Dict[Voxel, float]]:
 
 
 
+class TrackAnalysis:
+    """
+    Topological analysis of a track graph.
+
+    The shortest-path distances between all pairs of voxels of the
+    track are computed once, as a dense matrix indexed by the position
+    of the voxels in the graph, and reused to obtain the extrema, the
+    length and the blobs of the track. The results are the same as
+    those of the module-level functions, which compute the distances
+    anew on each call.
+    """
+    def __init__(self, track_graph : Graph):
+        self.track  = track_graph
+        self.voxels = list(track_graph.nodes())
+        if not self.voxels:
+            raise NoVoxels
+
+        index = {v: i for i, v in enumerate(self.voxels)}
+        n     = len(self.voxels)
+        edges = [(index[va], index[vb], d) for va, vb, d in track_graph.edges(data="distance", default=1)]
+        i, j, d = np.array(edges, dtype=float).reshape(-1, 3).T
+        i, j    = i.astype(int), j.astype(int)
+        graph   = csr_matrix((np.concatenate([d, d]), (np.concatenate([i, j]), np.concatenate([j, i]))), shape=(n, n))
+
+        self.index     = index
+        self.distances = dijkstra(graph, directed=True)
+
+        # same order as the output of `shortest_paths`
+        self.sorted_indices = sorted(range(n), key=lambda k: self.voxels[k].pos.tolist())
+
+    def distances_from(self, voxel : Voxel) -> Dict[Voxel, float]:
+        """Distances from a voxel to all voxels, as in `shortest_paths`."""
+        row = self.distances[self.index[voxel]]
+        return {self.voxels[k]: row[k] for k in self.sorted_indices}
+
+    def extrema_and_length(self) -> Tuple[Voxel, Voxel, float]:
+        """Same as `find_extrema_and_length`."""
+        if len(self.voxels) == 1:
+            return (self.voxels[0], self.voxels[0], 0.)
+
+        order     = self.sorted_indices
+        distances = self.distances[np.ix_(order, order)]
+        distances = np.where(np.triu(np.ones_like(distances, dtype=bool), k=1), distances, 0)
+        first, last = np.unravel_index(np.argmax(distances), distances.shape)
+        if distances[first, last] <= 0:
+            return None, None, 0
+        return self.voxels[order[first]], self.voxels[order[last]], distances[first, last]
+
+    def energy_within_radius(self, voxel : Voxel, radius : float) -> float:
+        """Same as `energy_of_voxels_within_radius` for the distances from `voxel`."""
+        row = self.distances[self.index[voxel]]
+        return sum(self.voxels[k].E for k in self.sorted_indices if row[k] < radius)
+
+    def highest_encapsulating_node(self, extreme : Voxel, big_radius : float, small_radius : float) -> Voxel:
+        """Same as `find_highest_encapsulating_node`."""
+        row                 = self.distances[self.index[extreme]]
+        nodes_within_radius = [v for k, v in enumerate(self.voxels) if row[k] <= big_radius]
+
+        def energy_within_radius(node):
+            return self.energy_within_radius(node, small_radius)
+
+        return max(nodes_within_radius, key=energy_within_radius)
+
+    def hits_in_blob(self, radius : float, extreme : Voxel) -> Sequence[BHit]:
+        """Same as `hits_in_blob`."""
+        row      = self.distances[self.index[extreme]]
+        blob_pos = blob_centre(extreme)
+        diag     = np.linalg.norm(extreme.size)
+
+        blob_hits = []
+        for k, v in enumerate(self.voxels):
+            if row[k] < radius + diag:
+                hit_distances = np.linalg.norm(v.hits["X Y Z".split()] - blob_pos, axis=1)
+                blob_hits.append(v.hits.loc[hit_distances < radius])
+
+        return pd.concat(blob_hits, ignore_index=True)
+
+    def blob_energies_hits_and_centres(self,
+                                       small_radius : float,
+                                       big_radius   : Union[float, NoneType]):
+        """Same as `blob_energies_hits_and_centres`."""
+        a, b, _ = self.extrema_and_length()
+
+        if big_radius is not None:
+            a = self.highest_encapsulating_node(a, big_radius, small_radius)
+            b = self.highest_encapsulating_node(b, big_radius, small_radius)
+
+        ha = self.hits_in_blob(small_radius, a)
+        hb = self.hits_in_blob(small_radius, b)
+        ca = blob_centre(a)
+        cb = blob_centre(b)
+
+        e_type = self.voxels[0].Etype
+        # Consider the case where voxels are built without associated hits
+        some_hits = len(ha) or len(hb)
+        Ea = ha[e_type].sum() if some_hits else self.energy_within_radius(a, small_radius)
+        Eb = hb[e_type].sum() if some_hits else self.energy_within_radius(b, small_radius)
+
+        if Eb > Ea:
+            return (Eb, Ea, hb, ha, cb, ca)
+        else:
+            return (Ea, Eb, ha, hb, ca, cb)
+
+
 def find_extrema_and_length(distance : Dict[Voxel, Dict[Voxel, float]]) -> Tuple[Voxel, Voxel, float]:
     """Find the extrema and the length of a track, given its dictionary of distances."""
     if not distance:
@@ -170,15 +327,13 @@ def find_extrema(track: Graph) -> Tuple[Voxel, Voxel]:
     """Find the pair of voxels separated by the greatest geometric
       distance along the track.
     """
-    distances = shortest_paths(track)
-    extremum_a, extremum_b, _ = find_extrema_and_length(distances)
+    extremum_a, extremum_b, _ = TrackAnalysis(track).extrema_and_length()
     return extremum_a, extremum_b
 
 
 def length(track: Graph) -> float:
     """Calculate the length of a track."""
-    distances = shortest_paths(track)
-    _, _, length = find_extrema_and_length(distances)
+    _, _, length = TrackAnalysis(track).extrema_and_length()
     return length
 
 
@@ -207,24 +362,13 @@ def blob_centre(voxel: Voxel) -> Tuple[float, float, float]:
 def hits_in_blob(track_graph : Graph,
                  radius      : float,
                  extreme     : Voxel) -> Sequence[BHit]:
-    """Returns the hits that belong to a blob."""
-    distances         = shortest_paths(track_graph)
-    dist_from_extreme = distances[extreme]
-    blob_pos          = blob_centre(extreme)
-    diag              = np.linalg.norm(extreme.size)
-
-    blob_hits = []
-    # First, consider only voxels at a certain distance from the end-point, along the track.
-    # We allow for 1 extra contiguity, because this distance is calculated between
-    # the centres of the voxels, and not the hits. In the second step we will refine the
-    # selection, using the euclidean distance between the blob position and the hits.
-    for v in track_graph.nodes():
-        voxel_distance = dist_from_extreme[v]
-        if voxel_distance < radius + diag:
-            hit_distances = np.linalg.norm(v.hits["X Y Z".split()] - blob_pos, axis=1)
-            blob_hits.append(v.hits.loc[hit_distances < radius])
-
-    return pd.concat(blob_hits, ignore_index=True)
+    """Returns the hits that belong to a blob.
+    First, consider only voxels at a certain distance from the end-point,
+    along the track. We allow for 1 extra contiguity, because this distance
+    is calculated between the centres of the voxels, and not the hits.
+    In the second step the selection is refined using the euclidean distance
+    between the blob position and the hits."""
+    return TrackAnalysis(track_graph).hits_in_blob(radius, extreme)
 
 
 def find_highest_encapsulating_node( track         : Graph
@@ -259,29 +403,7 @@ def blob_energies_hits_and_centres(track_graph  : Graph,
 
        If a big_radius is provided, the blob centre is chosen to be the voxel within the big
        radius of the extrema that contains the most energy around it within the small_radius."""
-    distances = shortest_paths(track_graph)
-    a, b, _   = find_extrema_and_length(distances)
-
-    if big_radius is not None:
-        a = find_highest_encapsulating_node(track_graph, a, distances, big_radius, small_radius)
-        b = find_highest_encapsulating_node(track_graph, b, distances, big_radius, small_radius)
-
-    ha = hits_in_blob(track_graph, small_radius, a)
-    hb = hits_in_blob(track_graph, small_radius, b)
-    ca = blob_centre(a)
-    cb = blob_centre(b)
-
-    voxels = list(track_graph.nodes())
-    e_type = voxels[0].Etype
-    # Consider the case where voxels are built without associated hits
-    some_hits = len(ha) or len(hb)
-    Ea = ha[e_type].sum() if some_hits else energy_of_voxels_within_radius(distances[a], small_radius)
-    Eb = hb[e_type].sum() if some_hits else energy_of_voxels_within_radius(distances[b], small_radius)
-
-    if Eb > Ea:
-        return (Eb, Ea, hb, ha, cb, ca)
-    else:
-        return (Ea, Eb, ha, hb, ca, cb)
+    return TrackAnalysis(track_graph).blob_energies_hits_and_centres(small_radius, big_radius)
 
 
 def blob_energies(track_graph : Graph, small_radius : float, big_radius : Union[float, NoneType]) -> Tuple[float, float]:
@@ -319,8 +441,9 @@ def make_tracks(evt_number       : float,
     tc = TrackCollection(evt_number, evt_time) # type: TrackCollection
     track_graphs = make_track_graphs(voxels, contiguity) # type: Sequence[Graph]
     for trk in track_graphs:
-        energy_a, energy_b, hits_a, hits_b = blob_energies_and_hits(trk, blob_radius, None)
-        a, b                               = blob_centres(trk, blob_radius, None)
+        (energy_a, energy_b,
+         hits_a  , hits_b  ,
+         a       , b       ) = TrackAnalysis(trk).blob_energies_hits_and_centres(blob_radius, None)
         blob_a = Blob(a, hits_a, blob_radius, energy_type) # type: Blob
         blob_b = Blob(b, hits_b, blob_radius, energy_type)
         blobs = (blob_a, blob_b)
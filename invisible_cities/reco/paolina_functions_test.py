@@ -45,11 +45,14 @@ from . paolina_functions import hits_in_blob
 from . paolina_functions import voxelize_hits
 from . paolina_functions import shortest_paths
 from . paolina_functions import make_track_graphs
+from . paolina_functions import neighbours
+from . paolina_functions import neighbour_pairs
 from . paolina_functions import voxels_from_track_graph
 from . paolina_functions import length
 from . paolina_functions import drop_end_point_voxels
 from . paolina_functions import make_tracks
 from . paolina_functions import get_track_energy
+from . paolina_functions import TrackAnalysis
 
 from .. core                import system_of_units as units
 from .. core.core_functions import in_range
@@ -290,6 +293,18 @@ def test_voxel_hits_are_same_as_original_ones(hits, requested_voxel_dimensions):
     assert_dataframes_close(hits, hits_from_voxels)
 
 
+@given(bunch_of_hits(), box_sizes)
+def test_voxel_hits_keep_original_index_and_order(hits, requested_voxel_dimensions):
+    voxels = voxelize_hits(hits, requested_voxel_dimensions, strict_voxel_size=False)
+    for v in voxels:
+        assert v.hits.index.is_monotonic_increasing
+        assert_dataframes_close(v.hits, hits.loc[v.hits.index])
+
+        xyz       = v.hits["X Y Z".split()].values
+        half_size = v.size / 2 + 1e-6
+        assert np.all(np.abs(xyz - v.pos) <= half_size)
+
+
 def test_hits_on_border_are_assigned_to_correct_voxel():
     z = 10.
     energy = 1.
@@ -483,6 +498,28 @@ def test_contiguity(proximity, contiguity, are_neighbours):
     assert len(tracks) == expected_number_of_tracks
 
 
+@given(voxels=lists(single_voxels(), min_size=0, max_size=50))
+@parametrize("contiguity", Contiguity)
+def test_neighbour_pairs_same_as_neighbours(voxels, contiguity):
+    positions = np.array([v.pos  for v in voxels], dtype=float).reshape(-1, 3)
+    sizes     = np.array([v.size for v in voxels], dtype=float).reshape(-1, 3)
+    i, j      = neighbour_pairs(positions, sizes, contiguity)
+
+    expected = [ (a, b) for (a, va), (b, vb) in combinations(enumerate(voxels), 2)
+                 if neighbours(va, vb, contiguity) ]
+    assert list(zip(i.tolist(), j.tolist())) == expected
+
+
+def test_neighbour_pairs_with_different_voxel_sizes():
+    positions = np.array([[0, 0, 0], [1.5, 0, 0], [3, 0, 0]])
+    sizes     = np.array([[1, 1, 1], [  2, 2, 2], [1, 1, 1]])
+    i, j      = neighbour_pairs(positions, sizes, Contiguity.FACE)
+
+    # the size of the first voxel of the pair is used
+    assert i.tolist() == [1]
+    assert j.tolist() == [2]
+
+
 @given(bunch_of_hits(), box_sizes, min_n_of_voxels, fraction_zero_one)
 def test_energy_is_conserved_with_dropped_voxels(hits, requested_voxel_dimensions, min_voxels, fraction_zero_one):
     tot_initial_energy = hits.E.sum()
@@ -715,6 +752,82 @@ def test_blobs(radius, expected):
     assert blob_energies(tracks[0], radius, None) == expected
 
 
+def hits_in_blob_from_distances(track, distances, radius, extreme):
+    # the selection of `hits_in_blob` before it used `TrackAnalysis`
+    blob_pos  = blob_centre(extreme)
+    diag      = np.linalg.norm(extreme.size)
+    blob_hits = []
+    for v in track.nodes():
+        if distances[extreme][v] < radius + diag:
+            hit_distances = np.linalg.norm(v.hits["X Y Z".split()] - blob_pos, axis=1)
+            blob_hits.append(v.hits.loc[hit_distances < radius])
+    return pd.concat(blob_hits, ignore_index=True)
+
+
+def assert_track_analysis_same_as_functions(track, blob_radius, big_radius):
+    analysis  = TrackAnalysis(track)
+    distances = shortest_paths(track)
+
+    for v in track.nodes():
+        assert analysis.distances_from(v) == distances[v]
+    assert analysis.extrema_and_length() == find_extrema_and_length(distances)
+
+    for big in (None, big_radius):
+        got      = analysis.blob_energies_hits_and_centres(blob_radius, big)
+        a, b, _  = find_extrema_and_length(distances)
+        if big is not None:
+            a = find_highest_encapsulating_node(track, a, distances, big, blob_radius)
+            b = find_highest_encapsulating_node(track, b, distances, big, blob_radius)
+        expected_hits = [hits_in_blob_from_distances(track, distances, blob_radius, extreme)
+                         for extreme in (a, b)]
+
+        # the hits are the ones selected by the old code and the
+        # energies those of the old functions, with the most
+        # energetic blob first
+        some_hits = len(expected_hits[0]) or len(expected_hits[1])
+        energies  = [ hs[extreme.Etype].sum() if some_hits else
+                      energy_of_voxels_within_radius(distances[extreme], blob_radius)
+                      for hs, extreme in zip(expected_hits, (a, b))]
+        if energies[1] > energies[0]:
+            energies, expected_hits = energies[::-1], expected_hits[::-1]
+
+        assert got[0:2] == approx(energies)
+        assert got[0:2] == approx(blob_energies_and_hits(track, blob_radius, big)[0:2])
+        for got_hits, hs in zip(got[2:4], expected_hits):
+            assert_dataframes_close(got_hits, hs)
+
+
+@settings(deadline=None)
+@given(bunch_of_hits(), box_sizes, radius, radius)
+def test_track_analysis_same_as_functions(hits, voxel_dimensions, blob_radius, big_radius):
+    voxels = voxelize_hits(hits, voxel_dimensions)
+    for t in make_track_graphs(voxels):
+        assert_track_analysis_same_as_functions(t, blob_radius, big_radius)
+
+
+@mark.parametrize("blob_radius", (2.5, 5.5, 10.))
+def test_track_analysis_same_as_functions_along_a_line(blob_radius):
+    # a single track with several hits per voxel, so that the blobs
+    # cut through voxels
+    n    = 60
+    hits = pd.DataFrame(dict( event    = 0
+                            , time     = 0
+                            , npeak    = 0
+                            , X        = np.linspace(0, 30, n)
+                            , Y        = np.sin(np.linspace(0, 3, n))
+                            , Z        = np.linspace(50, 70, n)
+                            , Q        = 1
+                            , E        = np.linspace(1, 5, n)
+                            , Ec       = 1
+                            , track_id = 0
+                            , Ep       = 1))
+    voxels = voxelize_hits(hits, np.array([2., 2., 2.]))
+    tracks = make_track_graphs(voxels)
+
+    assert len(tracks) == 1
+    assert_track_analysis_same_as_functions(tracks[0], blob_radius, 2 * blob_radius)
+
+
 @settings(deadline=None)
 @given(bunch_of_hits(), box_sizes, radius)
 def test_blob_hits_are_inside_radius(hits, voxel_dimensions, blob_radius):
@@ -121,24 +121,87 @@ def find_peaks(ccwfs, index,
                pmt_samp_wid = 25*units.ns,
                sipm_samp_wid = 1*units.mus,
                sipm_wfs=None, thr_sipm_s2=0):
+    """
+    Builds all the peaks found in `index` at once: the samples of
+    the selected peaks are gathered in a single array, which is
+    rebinned in one go and then split into peaks. This gives the
+    same result as calling `build_peak` for each peak.
+    """
     ccwfs = np.array(ccwfs, ndmin=2)
 
-    peaks           = []
     times           = np.arange     (ccwfs.shape[1]) * pmt_samp_wid
     widths          = np.full       (ccwfs.shape[1],   pmt_samp_wid)
     indices_split   = split_in_peaks(index, stride)
     selected_splits = select_peaks  (indices_split, time, length, pmt_samp_wid)
     with_sipms      = Pk is S2 and sipm_wfs is not None
+    if not selected_splits: return []
 
-    for indices in selected_splits:
-        pk = build_peak(indices, times,
-                        widths, ccwfs, pmt_ids, sipm_ids,
-                        rebin_stride,
-                        with_sipms, Pk,
-                        pmt_samp_wid, sipm_samp_wid,
-                        sipm_wfs, thr_sipm_s2)
-        peaks.append(pk)
-    return peaks
+    sipm_pmt_bin_ratio = int(sipm_samp_wid/pmt_samp_wid)
+    starts = np.array([indices[ 0]     for indices in selected_splits])
+    stops  = np.array([indices[-1] + 1 for indices in selected_splits])
+    n_pad  = starts % sipm_pmt_bin_ratio if with_sipms else np.zeros_like(starts)
+
+    # PMTs, padded with zeros at the start of each peak if the SiPMs
+    # are used so that the PMT and SiPM bins are aligned
+    samples = np.concatenate([np.arange(start - pad, stop)
+                              for start, stop, pad in zip(starts, stops, n_pad)])
+    padding = np.concatenate([np.arange(stop - start + pad) < pad
+                              for start, stop, pad in zip(starts, stops, n_pad)])
+    samples[padding] = 0
+    pk_times         = times [   samples]
+    pk_widths        = widths[   samples]
+    pmt_wfs          = ccwfs [:, samples]
+    pk_times [   padding] = 0
+    pk_widths[   padding] = 0
+    pmt_wfs  [:, padding] = 0
+    (pk_times ,
+     pk_widths,
+     pmt_wfs  ) = rebin_peaks(pk_times, pk_widths, pmt_wfs,
+                              stops - starts + n_pad, rebin_stride)
+    pmt_rs = [PMTResponses(pmt_ids, wfs) for wfs in pmt_wfs]
+
+    if with_sipms:
+        sipm_starts  = starts      // sipm_pmt_bin_ratio
+        sipm_stops   = (stops - 1) // sipm_pmt_bin_ratio + 1
+        sipm_samples = np.concatenate([np.arange(start, stop)
+                                       for start, stop in zip(sipm_starts, sipm_stops)])
+        dummy         = np.zeros(len(sipm_samples))
+        *_, sipm_wfs_ = rebin_peaks(dummy, dummy,
+                                    sipm_wfs[:, sipm_samples],
+                                    sipm_stops - sipm_starts,
+                                    rebin_stride // sipm_pmt_bin_ratio)
+        sipm_rs = []
+        for wfs in sipm_wfs_:
+            sipm_idx, wfs = select_wfs_above_time_integrated_thr(wfs, thr_sipm_s2)
+            sipm_rs.append(SiPMResponses(sipm_ids[sipm_idx], wfs))
+    else:
+        sipm_rs = [SiPMResponses.build_empty_instance()] * len(pmt_rs)
+
+    return list(map(Pk, pk_times, pk_widths, pmt_rs, sipm_rs))
+
+
+def rebin_peaks(times, widths, waveforms, lengths, rebin_stride):
+    """
+    Rebins consecutive peaks of `lengths` samples, stored back to back
+    in `times`, `widths` and `waveforms`, with a single call to
+    `rebin_times_and_waveforms`. Returns the times, widths and
+    waveforms of each peak.
+    """
+    offsets = np.cumsum(lengths)[:-1]
+    if rebin_stride >= 2:
+        peak_starts = np.append(0, offsets)
+        peak_stops  = peak_starts + lengths
+        slices      = [[slice(start, min(start + rebin_stride, stop))
+                        for start in range(peak_start, stop, rebin_stride)]
+                       for peak_start, stop in zip(peak_starts, peak_stops)]
+        offsets     = np.cumsum(list(map(len, slices)))[:-1]
+        (times ,
+         widths,
+         waveforms) = rebin_times_and_waveforms(times, widths, waveforms,
+                                                rebin_stride, sum(slices, []))
+    return (np.split(times    , offsets),
+            np.split(widths   , offsets),
+            np.split(waveforms, offsets, axis=1))
 
 
 def get_pmap(ccwf, s1_indx, s2_indx, sipm_zs_wf,
@@ -159,25 +222,37 @@ def rebin_times_and_waveforms(times, widths, waveforms,
                               rebin_stride=2, slices=None):
     if rebin_stride < 2: return times, widths, waveforms
 
+    n_samples = len(times)
+    times     = np.asarray(times    , dtype=float)
+    widths    = np.asarray(widths   , dtype=float)[    :n_samples]
+    waveforms = np.asarray(waveforms, dtype=float)[:, :n_samples]
     if slices is None:
-        n_bins = int(np.ceil(len(times) / rebin_stride))
-        reb    = rebin_stride
-        slices = [slice(reb * i, reb * (i + 1)) for i in range(n_bins)]
-    n_sensors = waveforms.shape[0]
-
-    rebinned_times  = np.zeros(            len(slices) )
-    rebinned_widths = np.zeros(            len(slices) )
-    rebinned_wfs    = np.zeros((n_sensors, len(slices)))
-
-    for i, sl in enumerate(slices):
-        t = times    [   sl]
-        e = waveforms[:, sl]
-        ## Weight with the charge sum per slice
-        ## if positive and unweighted if all
-        ## negative.
-        s = np.sum(e, axis=0).clip(0)
-        w = s if np.any(s) else None
-        rebinned_times [   i] = np.average(t, weights=w)
-        rebinned_widths[   i] = np.sum    (  widths[sl])
-        rebinned_wfs   [:, i] = np.sum    (e,    axis=1)
+        starts = np.arange(0, n_samples, rebin_stride)
+        stops  = np.minimum(starts + rebin_stride, n_samples)
+    else:
+        starts = np.array([sl.start or 0 for sl in slices], dtype=int)
+        stops  = np.array([n_samples if sl.stop is None else sl.stop
+                           for sl in slices], dtype=int).clip(max=n_samples)
+
+    # Each slice is reduced between its start and stop, which must not
+    # overlap the next slice. A zero sample is appended so that slices
+    # reaching the end of the waveforms can be closed.
+    bounds = np.stack([starts, stops], axis=1).flatten()
+    counts = stops - starts
+    def reduce_slices(values):
+        values = np.concatenate([values, np.zeros_like(values[..., :1])], axis=-1)
+        return np.add.reduceat(values, bounds, axis=-1)[..., ::2] * (counts > 0)
+
+    ## Weight with the charge sum per slice
+    ## if positive and unweighted if all
+    ## negative.
+    charge          = np.sum(waveforms, axis=0).clip(0)
+    charge_sum      = reduce_slices(charge)
+    weighted_times  = reduce_slices(times * charge)
+    average_times   = reduce_slices(times) / np.where(counts > 0, counts, 1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rebinned_times = np.where(charge_sum > 0, weighted_times / charge_sum, average_times)
+
+    rebinned_widths = reduce_slices(widths)
+    rebinned_wfs    = reduce_slices(waveforms)
     return rebinned_times, rebinned_widths, rebinned_wfs
@@ -492,6 +492,42 @@ def test_find_peaks_s2_style(pmt_and_sipm_wfs_with_indices):
     assert_Peak_equality(peaks[0], expected_peak)
 
 
+@mark.parametrize("Pk rebin_stride thr_sipm_s2".split(),
+                  ((S1,  1,  0),
+                   (S2, 40, -1),
+                   (S2, 80, 30)))
+def test_find_peaks_same_as_build_peak_for_each_peak(Pk, rebin_stride, thr_sipm_s2):
+    n_pmt, n_sipm, n_samples = 3, 10, 4000
+    pmt_ids  = np.arange(n_pmt)
+    sipm_ids = np.arange(n_sipm)
+    pmt_wfs  = np.zeros((n_pmt, n_samples))
+    for first, last in ((103, 200), (1017, 1789), (1900, 1934), (3001, 3999)):
+        pmt_wfs[:, first:last] = np.random.uniform(1, 10, size=(n_pmt, last - first))
+    sipm_wfs = np.random.uniform(0, 5, size=(n_sipm, n_samples // 40))
+    index    = np.where(pmt_wfs.sum(axis=0) > 0)[0]
+
+    time   = minmax(0, 1e6)
+    length = minmax(0, 1e6)
+    stride = 4
+    peaks  = pf.find_peaks(pmt_wfs, index, time, length,
+                           stride, rebin_stride, Pk, pmt_ids, sipm_ids,
+                           sipm_wfs    = sipm_wfs,
+                           thr_sipm_s2 = thr_sipm_s2)
+
+    times  = np.arange(n_samples) * 25 * units.ns
+    widths = np.full  (n_samples,   25 * units.ns)
+    splits = pf.split_in_peaks(index, stride)
+    assert len(peaks) == len(splits) == 4
+    for peak, indices in zip(peaks, splits):
+        expected = pf.build_peak(indices, times, widths, pmt_wfs,
+                                 pmt_ids, sipm_ids, rebin_stride,
+                                 with_sipms  = Pk is S2,
+                                 Pk          = Pk,
+                                 sipm_wfs    = sipm_wfs,
+                                 thr_sipm_s2 = thr_sipm_s2)
+        assert_Peak_equality(peak, expected)
+
+
 def test_get_pmap(s1_and_s2_with_indices):
     (times, widths, pmt_wfs, sipm_wfs,
      s1_indx, s2_indx, sipm_indices,
@@ -101,15 +101,15 @@ def noise_suppression(waveforms, thresholds, padding = 0):
 def cwf_from_rwf(pmtrwf, event_list, calib_vectors, deconv_params):
     """Compute CWF from RWF for a given list of events."""
 
+    b_cf, a_cf = blr.cleaning_filters(calib_vectors.coeff_c)
+    coeff_blr  = np.asarray(calib_vectors.coeff_blr, dtype=np.double)
+
     CWF=[]
     for event in event_list:
         pmt_evt = pmtrwf[event]
         ZWF     = csf.means(pmt_evt[:, :deconv_params.n_baseline]) - pmt_evt
-        rep_thr = np.repeat(deconv_params.thr_trigger, ZWF.shape[0])
-        CWF.append(np.array(tuple(map(blr.deconvolve_signal, ZWF,
-                                      calib_vectors.coeff_c     ,
-                                      calib_vectors.coeff_blr   ,
-                                      rep_thr                   ))))
+        CWF.append(blr.deconvolve_signals(ZWF.astype(np.double, copy=False), b_cf, a_cf, coeff_blr,
+                                          thr_trigger = deconv_params.thr_trigger))
     return CWF
 
 
@@ -1,6 +1,8 @@
 import numpy  as np
 import pandas as pd
 
+from functools import lru_cache
+
 from .. core.core_functions  import weighted_mean_and_var
 from .. core                 import system_of_units as units
 from .. core.exceptions      import SipmEmptyList
@@ -116,6 +118,36 @@ def count_masked( center    : np.ndarray   # shape (2,)
     return masked[indices].sum()
 
 
+class SiPMNeighbours:
+    """
+    Neighbour lookup over the tracking plane, meant to be built once
+    per detector configuration (i.e. from the output of `DataSiPM`)
+    and reused for every slice.
+
+    Only the masked SiPMs are relevant for clustering, so their
+    positions are extracted once. The number of masked SiPMs around a
+    given point is cached, as the same points (typically SiPM
+    positions) are queried repeatedly.
+    """
+    def __init__(self, all_sipms : pd.DataFrame):
+        masked           = ~all_sipms.Active.values.astype(bool) # True if masked
+        self.masked_pos  = all_sipms.filter(list("XY")).values[masked]
+
+    def count_masked( self
+                    , center : np.ndarray # shape (2,)
+                    , d      : float):
+        """
+        Count the number of masked (inactive) SiPMs within a distance
+        `d` of `center`. Equivalent to `count_masked`.
+        """
+        x, y = np.ravel(center)
+        return self._count_masked(float(x), float(y), float(d))
+
+    @lru_cache(maxsize=4096)
+    def _count_masked(self, x : float, y : float, d : float):
+        return len(get_nearby_sipm_inds(np.array([x, y]), d, self.masked_pos))
+
+
 @check_annotations
 def corona( pos             : np.ndarray # (n, 2)
           , qs              : np.ndarray # (n,)
@@ -125,7 +157,8 @@ def corona( pos             : np.ndarray # (n, 2)
           , lm_radius       : float
           , new_lm_radius   : float
           , msipm           : int
-          , consider_masked : Optional[bool] = False) -> Sequence[Cluster]:
+          , consider_masked : Optional[bool] = False
+          , sipm_neighbours : Optional[SiPMNeighbours] = None) -> Sequence[Cluster]:
     """
     Creates a list of clusters with the following steps:
     - identifying the SiPM with highest charge (which must be > `Qlm`)
@@ -176,6 +209,12 @@ def corona( pos             : np.ndarray # (n, 2)
         clusters might contain less than `msipm` SiPMs, if any of
         those is a masked sensor.
 
+    sipm_neighbours : SiPMNeighbours, optional
+        Neighbour lookup built from `all_sipms`. Building it once and
+        passing it in every call avoids scanning `all_sipms` for each
+        cluster. If not given, it is built from `all_sipms` when
+        `consider_masked` is `True`.
+
     Returns
     -------
     clusters : List[Cluster]
@@ -229,6 +268,9 @@ def corona( pos             : np.ndarray # (n, 2)
 
     pos, qs = threshold_check(pos, qs, Qthr)
 
+    if consider_masked and sipm_neighbours is None:
+        sipm_neighbours = SiPMNeighbours(all_sipms)
+
     c  = []
     # While there are more local maxima
     while len(qs) > 0:
@@ -242,7 +284,7 @@ def corona( pos             : np.ndarray # (n, 2)
 
         # find the SiPMs within new_lm_radius of the new local maximum of charge
         within_new_lm_radius = get_nearby_sipm_inds(new_local_maximum, new_lm_radius, pos      )
-        n_masked_neighbours  = count_masked        (new_local_maximum, new_lm_radius, all_sipms) if consider_masked else 0
+        n_masked_neighbours  = sipm_neighbours.count_masked(new_local_maximum, new_lm_radius) if consider_masked else 0
 
         # if there are at least msipms within_new_lm_radius, taking
         # into account any masked channel, get the barycenter
@@ -29,6 +29,7 @@ from .       xy_algorithms   import barycenter
 from .       xy_algorithms   import discard_sipms
 from .       xy_algorithms   import get_nearby_sipm_inds
 from .       xy_algorithms   import count_masked
+from .       xy_algorithms   import SiPMNeighbours
 
 
 @composite
@@ -345,6 +346,40 @@ def test_count_masked_near_masked(datasipm_5000, sipm_id, radius, expected_nmask
     assert count_masked(masked_xy, radius, datasipm_5000) == expected_nmasked
 
 
+@parametrize("radius", (0, 1, 1.5, 2, 5))
+def test_sipm_neighbours_count_masked_same_as_count_masked(datasipm5x5, radius):
+    neighbours = SiPMNeighbours(datasipm5x5)
+    centers    = np.concatenate([ datasipm5x5.filter(list("XY")).values
+                                , np.random.default_rng(1).uniform(-1, 5, size=(20, 2))])
+    for center in centers:
+        expected = count_masked(center, radius, datasipm5x5)
+        assert neighbours.count_masked(center, radius) == expected
+        # cached value
+        assert neighbours.count_masked(center, radius) == expected
+
+
+@parametrize("consider_masked", (False, True))
+def test_corona_with_sipm_neighbours(datasipm5x5, consider_masked):
+    datasipm = datasipm5x5
+    all_xys  = np.stack([datasipm.X.values, datasipm.Y.values], axis=1)
+    all_qs   = np.arange(25, dtype=float)
+    ok       = datasipm.Active.values.astype(bool)
+    params   = dict( Qthr            = 0
+                   , Qlm             = 6
+                   ,     lm_radius   = 0
+                   , new_lm_radius   = 1.5
+                   , msipm           = 3
+                   , consider_masked = consider_masked)
+
+    expected = corona(all_xys[ok], all_qs[ok], datasipm, **params)
+    clusters = corona(all_xys[ok], all_qs[ok], datasipm, **params,
+                      sipm_neighbours = SiPMNeighbours(datasipm))
+
+    assert len(clusters) == len(expected)
+    for cluster, expected_cluster in zip(clusters, expected):
+        assert_cluster_equality(cluster, expected_cluster)
+
+
 def test_masked_channels(datasipm_3x5):
     """
     Scheme of SiPM positions (the numbers are the SiPM charges)
@@ -24,6 +24,10 @@ coeff_c:   a vector of deconvolution coefficients (cleaning)
 coeff_blr: a vector of deconvolution coefficients (blr)
 n_baseline, thr_trigger as described above
 
+deconvolve_signals performs the same deconvolution as deconvolve_signal
+for all sensors at once, with the cleaning filters precomputed with
+cleaning_filters.
+
 """
 import numpy as np
 cimport numpy as np
@@ -32,4 +36,11 @@ cpdef deconvolve_signal(double [:] signal_daq,
                         double     coeff_clean     = *,
                         double     coeff_blr       = *,
                         double     thr_trigger     = *,
-                        int accum_discharge_length = *)
\ No newline at end of file
+                        int accum_discharge_length = *)
+
+cpdef deconvolve_signals(double [:, :] signals_daq,
+                         double [:, :] b_cf,
+                         double [:, :] a_cf,
+                         double [:]    coeff_blr,
+                         double     thr_trigger     = *,
+                         int accum_discharge_length = *)
@@ -2,6 +2,12 @@ import  numpy as np
 cimport numpy as np
 from scipy import signal as SGN
 
+from libc.math cimport sqrt
+
+
+cdef int NOISE_SAMPLES = 400 # fixed at 10 mus
+
+
 cpdef deconvolve_signal(double [:] signal_daq,
                         double coeff_clean            = 2.905447E-06,
                         double coeff_blr              = 1.632411E-03,
@@ -17,47 +23,108 @@ cpdef deconvolve_signal(double [:] signal_daq,
     always being charged. At the same time, the accumulator is being
     discharged when there is no signal. This avoids runoffs
     """
+    b_cf, a_cf = cleaning_filters(np.array([coeff_clean]))
+    signals    = deconvolve_signals(np.asarray(signal_daq)[np.newaxis],
+                                    b_cf, a_cf, np.array([coeff_blr]),
+                                    thr_trigger, accum_discharge_length)
+    return signals[0]
 
-    cdef double coef = coeff_blr
-    cdef double thr_acum = thr_trigger / coef
-    cdef int len_signal_daq = len(signal_daq)
 
-    cdef double [:] signal_r = np.zeros(len_signal_daq, dtype=np.double)
-    cdef double [:] acum     = np.zeros(len_signal_daq, dtype=np.double)
+def cleaning_filters(coeff_clean):
+    """
+    Computes the high-pass filters used to clean the signal before
+    the accumulator, one for each value of `coeff_clean`. They depend
+    only on the sensor coefficients, so they can be computed once per
+    detector/run.
+
+    Returns the numerator and denominator coefficients of the
+    filters, each with shape (n, 2), normalized so the first
+    denominator coefficient is 1.
+    """
+    filters    = [SGN.butter(1, c, 'high', analog=False) for c in coeff_clean]
+    b_cf, a_cf = np.array(filters, dtype=np.double).reshape(len(filters), 2, 2).transpose(1, 0, 2)
+    b_cf       = b_cf / a_cf[:, :1]
+    a_cf       = a_cf / a_cf[:, :1]
+    return np.ascontiguousarray(b_cf), np.ascontiguousarray(a_cf)
+
+
+cpdef deconvolve_signals(double [:, :] signals_daq,
+                         double [:, :] b_cf,
+                         double [:, :] a_cf,
+                         double [:]    coeff_blr,
+                         double thr_trigger            =     5,
+                         int    accum_discharge_length =  5000):
+    """
+    Same as `deconvolve_signal`, for all the sensors at once.
 
-    cdef int j
+    signals_daq: the raw signals, with shape (n_sensors, n_samples)
+    b_cf, a_cf : the cleaning filters of each sensor, as returned
+                 by `cleaning_filters`
+    coeff_blr  : the accumulator coefficient of each sensor
+    """
+    cdef int n_sensors = signals_daq.shape[0]
+    cdef int n_samples = signals_daq.shape[1]
+
+    if not (b_cf.shape[0] == a_cf.shape[0] == coeff_blr.shape[0] == n_sensors):
+        raise ValueError("One set of coefficients per sensor is required")
+    if n_samples < NOISE_SAMPLES:
+        raise IndexError(f"Signals must have at least {NOISE_SAMPLES} samples")
+
+    cdef double [:, :] signals_r = np.zeros((n_sensors, n_samples), dtype=np.double)
+    cdef double [:]    clean     = np.empty(n_samples, dtype=np.double)
+    cdef double [:]    acum      = np.empty(n_samples, dtype=np.double)
+    cdef int i
+
+    with nogil:
+        for i in range(n_sensors):
+            deconvolve_one(signals_daq[i], b_cf[i, 0], b_cf[i, 1], a_cf[i, 1],
+                           coeff_blr[i], thr_trigger, accum_discharge_length,
+                           clean, acum, signals_r[i])
+
+    return np.asarray(signals_r)
+
+
+cdef void deconvolve_one(double [:] signal_daq,
+                         double b0, double b1, double a1,
+                         double coef,
+                         double thr_trigger,
+                         int    accum_discharge_length,
+                         double [:] signal_daq_clean,
+                         double [:] acum,
+                         double [:] signal_r) noexcept nogil:
+    cdef double thr_acum = thr_trigger / coef
+    cdef int len_signal_daq = signal_daq.shape[0]
+    cdef int j, k
 
     # compute noise
-    cdef double noise =  0
-    cdef int nn = 400 # fixed at 10 mus
-
-    for j in range(nn):
+    cdef double noise = 0
+    for j in range(NOISE_SAMPLES):
         noise += signal_daq[j] * signal_daq[j]
-    noise /= nn
-    cdef double noise_rms = np.sqrt(noise)
+    noise /= NOISE_SAMPLES
+    cdef double noise_rms = sqrt(noise)
 
     # trigger line
     cdef double trigger_line = thr_trigger * noise_rms
 
-    # cleaning signal
-    cdef double [:]  b_cf
-    cdef double [:]  a_cf
-
-    b_cf, a_cf = SGN.butter(1, coeff_clean, 'high', analog=False);
-    signal_daq = SGN.lfilter(b_cf, a_cf, signal_daq)
+    # cleaning signal: first order IIR filter, evaluated as
+    # in scipy.signal.lfilter (direct form II transposed)
+    cdef double z = 0
+    for k in range(len_signal_daq):
+        signal_daq_clean[k] = z + b0 * signal_daq[k]
+        z                   = b1 * signal_daq[k] - a1 * signal_daq_clean[k]
 
-    cdef int k
     j = 0
-    signal_r[0] = signal_daq[0]
+    acum[0]     = 0
+    signal_r[0] = signal_daq_clean[0]
     for k in range(1, len_signal_daq):
 
         # always update signal and accumulator
-        signal_r[k] = (signal_daq[k] + signal_daq[k]*(coef / 2) +
+        signal_r[k] = (signal_daq_clean[k] + signal_daq_clean[k]*(coef / 2) +
                        coef * acum[k-1])
 
-        acum[k] = acum[k-1] + signal_daq[k]
+        acum[k] = acum[k-1] + signal_daq_clean[k]
 
-        if (signal_daq[k] < trigger_line) and (acum[k-1] < thr_acum):
+        if (signal_daq_clean[k] < trigger_line) and (acum[k-1] < thr_acum):
             # discharge accumulator
 
             if acum[k-1] > 1:
@@ -69,5 +136,3 @@ cpdef deconvolve_signal(double [:] signal_daq,
             else:
                 acum[k] = 0
                 j = 0
-    # return recovered signal
-    return np.asarray(signal_r)
\ No newline at end of file
@@ -3,8 +3,11 @@ from collections import namedtuple
 import numpy  as np
 import tables as tb
 
+from scipy import signal as SGN
+
 from pytest import fixture
 from pytest import mark
+from pytest import raises
 from flaky  import flaky
 
 from .. calib import calib_sensors_functions as csf
@@ -144,3 +147,73 @@ def test_deconv_pmt_ad_hoc_signals_dead_sensors(ad_hoc_blr_signals):
                                   rep_thr              , rep_acc             )))
 
     np.allclose(blr_wfs, evt_true_blr_wfs[pmt_active])
+
+
+def test_cleaning_filters_same_as_butter():
+    coeff_clean = np.array([1e-6, 2.905447e-6, 1e-3])
+    b_cf, a_cf  = blr.cleaning_filters(coeff_clean)
+
+    assert b_cf.shape == a_cf.shape == (len(coeff_clean), 2)
+    for b, a, c in zip(b_cf, a_cf, coeff_clean):
+        expected_b, expected_a = SGN.butter(1, c, 'high', analog=False)
+        assert np.allclose(b, expected_b)
+        assert np.allclose(a, expected_a)
+
+
+def test_deconvolve_signals_same_as_deconvolve_signal(sin_wf_params):
+    n_baseline, params = sin_wf_params
+    n_sensors          = 5
+    coeff_clean        = np.random.uniform(1e-6, 5e-6, size=n_sensors)
+    coeff_blr          = np.random.uniform(1e-3, 2e-3, size=n_sensors)
+    wfs                = np.random.normal(0, 1, size=(n_sensors, 4 * n_baseline))
+    wfs[:, n_baseline:2 * n_baseline] -= 50 * np.sin(np.linspace(0, np.pi, n_baseline))
+
+    cwfs       = csf.means(wfs[:, :n_baseline]) - wfs
+    b_cf, a_cf = blr.cleaning_filters(coeff_clean)
+    blr_wfs    = blr.deconvolve_signals(cwfs, b_cf, a_cf, coeff_blr,
+                                        thr_trigger            = params.thr_trigger,
+                                        accum_discharge_length = params.accum_discharge_length)
+
+    assert blr_wfs.shape == cwfs.shape
+    for cwf, blr_wf, c, b in zip(cwfs, blr_wfs, coeff_clean, coeff_blr):
+        expected = blr.deconvolve_signal(cwf, c, b,
+                                         thr_trigger            = params.thr_trigger,
+                                         accum_discharge_length = params.accum_discharge_length)
+        assert np.array_equal(blr_wf, expected)
+
+
+def python_deconvolve_signal(signal_daq, coeff_clean, coeff_blr, thr_trigger, accum_discharge_length):
+    # Pure python version of the algorithm, using scipy for the
+    # cleaning filter
+    coef         = coeff_blr
+    thr_acum     = thr_trigger / coef
+    noise_rms    = np.sqrt(np.sum(signal_daq[:400]**2) / 400)
+    trigger_line = thr_trigger * noise_rms
+
+    b_cf, a_cf = SGN.butter(1, coeff_clean, 'high', analog=False)
+    signal_daq = SGN.lfilter(b_cf, a_cf, signal_daq)
+
+    signal_r    = np.zeros_like(signal_daq)
+    acum        = np.zeros_like(signal_daq)
+    signal_r[0] = signal_daq[0]
+    for k in range(1, len(signal_daq)):
+        signal_r[k] = (signal_daq[k] + signal_daq[k]*(coef / 2) +
+                       coef * acum[k-1])
+        acum[k] = acum[k-1] + signal_daq[k]
+        if (signal_daq[k] < trigger_line) and (acum[k-1] < thr_acum):
+            acum[k] = acum[k-1] * (1 - coef) if acum[k-1] > 1 else 0
+    return signal_r
+
+
+def test_deconvolve_signal_same_as_python_implementation(sin_wf, sin_wf_params):
+    n_baseline, params = sin_wf_params
+    cwf      = np.mean(sin_wf[:n_baseline]) - sin_wf
+    expected = python_deconvolve_signal(cwf, **params._asdict())
+    blr_wf   = blr.deconvolve_signal   (cwf, **params._asdict())
+    assert np.allclose(blr_wf, expected, rtol=1e-12, atol=1e-12)
+
+
+def test_deconvolve_signals_raises_with_mismatched_coefficients():
+    b_cf, a_cf = blr.cleaning_filters(np.array([1e-6, 1e-6]))
+    with raises(ValueError):
+        blr.deconvolve_signals(np.zeros((3, 1000)), b_cf, a_cf, np.ones(2))
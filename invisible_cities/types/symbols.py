@@ -81,8 +81,10 @@ class SelRegionMethod(AutoNameEnumBase):
 
 
 class MapFitFunction(AutoNameEnumBase):
-    gaussian = auto()
-    median   = auto()
+    gaussian      = auto()
+    median        = auto()
+    fast_gaussian = auto()
+    fast_median   = auto()
 
 
 